@@ -0,0 +1,262 @@
+"""Sliding-window anti-raid protection"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+
+import discord
+
+import state_store
+from channel_index import LOGS, ChannelIndex
+from metrics import REGISTRY
+
+logger = logging.getLogger('antiraid')
+
+LOCKDOWN = 'lockdown'
+KICK = 'kick'
+BAN = 'ban'
+
+# Most moderation API calls in flight at once per guild
+ACTION_CONCURRENCY = int(os.getenv('ANTIRAID_CONCURRENCY', '5'))
+
+# How long a guild stays in raid mode after the last trigger, in seconds
+RAID_MODE_DURATION = float(os.getenv('ANTIRAID_RAID_MODE', '120'))
+
+# Most recent suspicious joins kept per guild for kick/ban. Only user IDs are
+# kept; kicks and bans go by ID
+MAX_TRACKED_JOINS = 1000
+
+_raids = REGISTRY.counter(
+    'antiraid_raids_detected_total',
+    'Raids detected',
+    ('guild',)
+)
+_actions = REGISTRY.counter(
+    'antiraid_actions_total',
+    'Anti-raid moderation actions by result',
+    ('action', 'result')
+)
+
+class JoinRateCounter:
+    """Join counter over a sliding window of one-second buckets
+
+    Adding a join and reading the total are O(1); advancing clears at most
+    `window` stale buckets, so the cost stays flat however many members join.
+    """
+
+    def __init__(self, window):
+        self.window = int(window)
+        self._buckets = [0] * self.window
+        self._current = 0
+        self._total = 0
+
+    def _advance(self, now):
+        second = int(now)
+        gap = second - self._current
+        if gap <= 0:
+            return
+
+        if gap >= self.window:
+            self._buckets = [0] * self.window
+            self._total = 0
+        else:
+            for offset in range(1, gap + 1):
+                index = (self._current + offset) % self.window
+                self._total -= self._buckets[index]
+                self._buckets[index] = 0
+        self._current = second
+
+    def add(self, now):
+        """Count a join and return the total in the window"""
+        self._advance(now)
+        self._buckets[self._current % self.window] += 1
+        self._total += 1
+        return self._total
+
+    def total(self, now):
+        self._advance(now)
+        return self._total
+
+    def reset(self):
+        self._buckets = [0] * self.window
+        self._total = 0
+
+class GuildRaidState:
+    """Configuration and detector state for one guild"""
+
+    def __init__(self, enabled=False, threshold=5, window=10, action=LOCKDOWN,
+                 min_account_age_days=0, require_avatar=False):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.window = window
+        self.action = action
+        self.min_account_age_days = min_account_age_days
+        self.require_avatar = require_avatar
+
+        self.counter = JoinRateCounter(window)
+        self.recent_joins = deque(maxlen=MAX_TRACKED_JOINS)
+        self.raid_until = 0.0
+        self.semaphore = asyncio.Semaphore(ACTION_CONCURRENCY)
+
+    def to_json(self):
+        return json.dumps({
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'window': self.window,
+            'action': self.action,
+            'min_account_age_days': self.min_account_age_days,
+            'require_avatar': self.require_avatar
+        })
+
+    def is_suspicious(self, member, now):
+        """Check the optional account-age and avatar heuristics"""
+        if self.min_account_age_days:
+            age_days = (now - member.created_at.timestamp()) / 86400
+            if age_days < self.min_account_age_days:
+                return True
+        if self.require_avatar and member.avatar is None:
+            return True
+        # With no heuristics configured every join counts
+        return not (self.min_account_age_days or self.require_avatar)
+
+class AntiRaid:
+    """Detects join floods per guild and runs the configured action"""
+
+    _guilds = {}
+    _background = set()
+
+    @classmethod
+    async def get_state(cls, guild_id):
+        """Get a guild's anti-raid state, loading saved settings on first use"""
+        state = cls._guilds.get(guild_id)
+        if state is None:
+            saved = await state_store.get_value(f'antiraid:{guild_id}')
+            loaded = GuildRaidState(**json.loads(saved)) if saved else GuildRaidState()
+            # A burst of joins to a cold guild loads it several times at once;
+            # every caller must count on the first state stored, not its own
+            state = cls._guilds.setdefault(guild_id, loaded)
+        return state
+
+    @classmethod
+    async def configure(cls, guild_id, **settings):
+        """Update a guild's settings and save them"""
+        state = await cls.get_state(guild_id)
+        for key, value in settings.items():
+            if value is not None:
+                setattr(state, key, value)
+        state.counter = JoinRateCounter(state.window)
+        state.recent_joins.clear()
+        await state_store.set_value(f'antiraid:{guild_id}', state.to_json())
+        return state
+
+    @classmethod
+    async def on_member_join(cls, member):
+        """Count a join and act if it completes a raid"""
+        state = cls._guilds.get(member.guild.id)
+        if state is None:
+            state = await cls.get_state(member.guild.id)
+        if not state.enabled:
+            return
+
+        now = time.time()
+        if not state.is_suspicious(member, now):
+            return
+
+        state.recent_joins.append((now, member.id))
+
+        # Already handling a raid: deal with new arrivals directly
+        if now < state.raid_until:
+            state.raid_until = now + RAID_MODE_DURATION
+            if state.action in (KICK, BAN):
+                cls._spawn(cls._punish(member.guild, state, [member.id]))
+            return
+
+        if state.counter.add(now) < state.threshold:
+            return
+
+        state.raid_until = now + RAID_MODE_DURATION
+        state.counter.reset()
+        cutoff = now - state.window
+        raiders = [user_id for joined_at, user_id in state.recent_joins if joined_at >= cutoff]
+        _raids.labels(member.guild.id).inc()
+        logger.warning('Raid detected in guild %s (%s): %s joins in %ss', member.guild.name, member.guild.id, len(raiders), state.window)
+
+        cls._spawn(cls._respond(member.guild, state, raiders))
+
+    @classmethod
+    def background_tasks(cls):
+        """Get the raid responses still running"""
+        return set(cls._background)
+
+    @classmethod
+    def _spawn(cls, coro):
+        # Keep a reference so the task isn't garbage collected mid-run
+        task = asyncio.create_task(coro)
+        cls._background.add(task)
+        task.add_done_callback(cls._background.discard)
+
+    @classmethod
+    async def _respond(cls, guild, state, raiders):
+        await cls._alert(guild, state, len(raiders))
+        if state.action == LOCKDOWN:
+            await cls._lockdown(guild, state)
+        else:
+            await cls._punish(guild, state, raiders)
+
+    @classmethod
+    async def _alert(cls, guild, state, count):
+        channel = ChannelIndex.get(guild, LOGS) or guild.system_channel
+        if channel is None:
+            return
+        try:
+            await channel.send(
+                f'🚨 **RAID ALERT** 🚨 {count} members joined in {state.window} seconds. '
+                f'Action taken: {state.action}.'
+            )
+        except Exception as e:
+            logger.error('Error sending raid alert: %s', e)
+
+    @classmethod
+    async def _run_action(cls, state, action, func, target):
+        async with state.semaphore:
+            try:
+                await func(target)
+                _actions.labels(action, 'ok').inc()
+            except Exception as e:
+                _actions.labels(action, 'error').inc()
+                logger.error('Anti-raid %s failed for %s: %s', action, target, e)
+
+    @classmethod
+    async def _lockdown(cls, guild, state):
+        """Stop @everyone sending messages in every text channel"""
+        async def lock(channel):
+            await channel.set_permissions(
+                guild.default_role,
+                send_messages=False,
+                reason='Anti-raid: Server lockdown due to raid detection'
+            )
+            await channel.send('🚨 **This channel has been locked due to raid detection.** 🚨\n'
+                               'Server administrators will unlock the channel when it\'s safe.')
+
+        await asyncio.gather(*(cls._run_action(state, LOCKDOWN, lock, channel) for channel in guild.text_channels))
+
+    @classmethod
+    async def _punish(cls, guild, state, user_ids):
+        """Kick or ban the given users"""
+        if state.action == KICK:
+            async def punish(user_id):
+                # Kicked by ID, without looking the member up first
+                try:
+                    await guild.kick(discord.Object(user_id), reason='Anti-raid: Automatic kick due to raid detection')
+                except discord.NotFound:
+                    # Already gone
+                    pass
+        else:
+            async def punish(user_id):
+                # A ban needs no member, and also keeps out raiders who already left
+                await guild.ban(discord.Object(user_id), reason='Anti-raid: Automatic ban due to raid detection', delete_message_seconds=86400)
+
+        await asyncio.gather(*(cls._run_action(state, state.action, punish, user_id) for user_id in user_ids))
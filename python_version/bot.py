@@ -1,77 +1,244 @@
+import startup_profiler
+# Time every import below; the startup report lists the slowest
+startup_profiler.install_import_hook()
+
 import os
+import sys
+import signal
 import discord
 import asyncio
 import logging
 from discord.ext import commands
 from dotenv import load_dotenv
 
+import bot_commands
+import cluster
+import command_sync
+import command_tracing
+import flight_recorder
+import gateway_resume
+from antiraid import AntiRaid
+from channel_index import ChannelIndex
+from database import Database
+from deadline import start_deadline
+from gateway_config import build_client_options
+from graceful_shutdown import GracefulShutdown
+from logging_setup import setup_logging
+from loop_watchdog import LoopWatchdog
+from member_cache import MemberCache
+from metrics_server import METRICS_PORT, MetricsServer
+from restart_policy import EXIT_CONFIG_ERROR
+from roblox_api import RobloxAPI
+from welcomer import WelcomeCoalescer
+
+startup_profiler.mark(startup_profiler.IMPORTS)
+
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 logger = logging.getLogger('discord_bot')
 
 # Load environment variables
-load_dotenv()
+with startup_profiler.phase('env'):
+    load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 APPLICATION_ID = os.getenv('APPLICATION_ID')
 
-# Set up the bot
-intents = discord.Intents.default()
-intents.members = True
-intents.message_content = True
+# Time budget for Roblox work done on behalf of a single command, so a slow
+# Roblox request can't hold the reply past the interaction window
+COMMAND_DEADLINE = float(os.getenv('COMMAND_DEADLINE', '10'))
+
+# Command sync: only when the command tree changed, unless forced. Setting a
+# guild ID syncs to that guild only, which applies instantly during development
+COMMAND_SYNC_GUILD_ID = os.getenv('COMMAND_SYNC_GUILD_ID')
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', 'false').lower() == 'true'
+
+# Set by the supervisor for a warm standby, which waits for SIGUSR1 before logging in
+STANDBY = os.getenv('BOT_STANDBY') == '1'
+
+# Set up the bot. Intents, member caching, startup chunking and the message
+# cache come from the environment (see gateway_config); by default members
+# are not cached and are fetched on demand through MemberCache.
+# With SHARD_COUNT (or SHARDED=true) the bot runs the shards in SHARD_IDS, or
+# all of them; start_bot.py spreads the shards over CLUSTER_COUNT processes
+if cluster.is_sharded():
+    bot = commands.AutoShardedBot(
+        command_prefix='!',
+        shard_count=cluster.SHARD_COUNT,
+        shard_ids=cluster.SHARD_IDS,
+        **build_client_options()
+    )
+    logger.info('Cluster %s: shards %s of %s', cluster.CLUSTER_ID, cluster.SHARD_IDS or "all", cluster.SHARD_COUNT or "auto")
+else:
+    bot = commands.Bot(command_prefix='!', **build_client_options())
+
+# Welcome messages are batched during join bursts (WELCOME_WINDOW, WELCOME_MAX_BATCH)
+welcomer = WelcomeCoalescer()
+
+heartbeat_task = None
+
+# Whether this process has answered a command yet, for failover timing
+first_command_done = False
+
+# Reports synchronous code that blocks the event loop (LOOP_LAG_THRESHOLD)
+watchdog = LoopWatchdog()
+
+# Metrics and health endpoint, on METRICS_PORT or Render's PORT
+metrics_server = MetricsServer(bot, watchdog)
+
+# On SIGTERM: turn new commands away, let running ones finish (SHUTDOWN_GRACE),
+# then clean up in order
+shutdown = GracefulShutdown()
+bot.add_check(shutdown.check)
+shutdown.add_jobs('antiraid', AntiRaid.background_tasks)
+
+async def stop_background():
+    if heartbeat_task is not None:
+        heartbeat_task.cancel()
+    watchdog.stop()
+    await metrics_server.stop()
+
+async def close_database():
+    if Database.is_initialized():
+        await asyncio.to_thread(Database.close_all)
+
+# Welcomes for joins that arrive while the gateway closes are sent after it
+# closes, before the HTTP session goes with it
+shutdown.add_step('send buffered welcomes', welcomer.flush_all)
+shutdown.add_step('close gateway', lambda: gateway_resume.close(bot, before_http_close=welcomer.flush_all))
+shutdown.add_step('stop background tasks', stop_background)
+shutdown.add_step('close Roblox session', RobloxAPI.close)
+shutdown.add_step('close database pool', close_database)
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Setup: runs once per process after login, before connecting to the gateway
+async def setup_hook():
+    startup_profiler.mark(startup_profiler.LOGIN)
+    watchdog.start()
+    
+    # Open the database pool off the event loop; a promoted standby already has one
+    if not Database.is_initialized():
+        with startup_profiler.phase('db_init'):
+            await asyncio.to_thread(Database.initialize)
+    await ChannelIndex.load()
+    
+    # Pick up the gateway session of the process this one replaces, if it
+    # shut down cleanly moments ago
+    try:
+        with startup_profiler.phase('gateway_resume'):
+            await gateway_resume.prepare(bot)
+    except Exception as e:
+        logger.error('Failed to prepare gateway resume: %s', e)
+    
+    # Report health to the supervisor
+    global heartbeat_task
+    heartbeat_task = asyncio.create_task(cluster.heartbeat_loop(bot))
+    
+    # Each cluster process serves metrics on its own port
+    if METRICS_PORT:
+        try:
+            await metrics_server.start(int(METRICS_PORT) + cluster.CLUSTER_ID)
+        except Exception as e:
+            logger.error('Failed to start metrics server: %s', e)
+    
+    # Sync commands with Discord. Done here rather than in on_ready so
+    # gateway reconnects go straight to serving commands. Commands are
+    # global, so only the first cluster syncs them
+    if not cluster.is_primary():
+        return
+    try:
+        with startup_profiler.phase('command_sync'):
+            await command_sync.sync_if_changed(bot, COMMAND_SYNC_GUILD_ID, force=FORCE_COMMAND_SYNC)
+    except Exception as e:
+        logger.error('Failed to sync commands: %s', e)
+
+bot.setup_hook = setup_hook
 
 # Event: Bot is ready
 @bot.event
 async def on_ready():
-    logger.info(f'Logged in as {bot.user.name} ({bot.user.id})')
-    logger.info(f'Bot is ready to serve on {len(bot.guilds)} servers')
+    logger.info('Logged in as %s (%s)', bot.user.name, bot.user.id)
+    logger.info('Bot is ready to serve on %s servers', len(bot.guilds))
     
-    # Sync commands with Discord
-    logger.info('Syncing commands with Discord...')
-    try:
-        await bot.tree.sync()
-        logger.info('Commands synced successfully!')
-    except Exception as e:
-        logger.error(f'Failed to sync commands: {e}')
+    # on_ready fires again after reconnects; report the first time only
+    if startup_profiler.mark(startup_profiler.READY):
+        await asyncio.to_thread(startup_profiler.log_report)
+
+# Event: every gateway event, for the flight recorder
+@bot.event
+async def on_socket_event_type(event_type):
+    flight_recorder.record(flight_recorder.EVENT, event_type)
+
+# Events: keep the channel index in step with the guild
+@bot.event
+async def on_guild_available(guild):
+    ChannelIndex.index_guild(guild)
+
+@bot.event
+async def on_guild_join(guild):
+    ChannelIndex.index_guild(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    ChannelIndex.forget_guild(guild)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    ChannelIndex.on_channel_create(channel)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    ChannelIndex.on_channel_update(before, after)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    ChannelIndex.on_channel_delete(channel)
 
 # Event: Member joins the server
 @bot.event
 async def on_member_join(member):
-    logger.info(f'Member joined: {member.name}#{member.discriminator}')
+    logger.info('Member joined: %s#%s', member.name, member.discriminator)
     
-    # Send welcome message
-    try:
-        welcome_channel = discord.utils.get(member.guild.text_channels, name='welcome')
-        if welcome_channel:
-            await welcome_channel.send(f'Welcome to the server, {member.mention}! Please use `/verify` to link your Roblox account.')
-    except Exception as e:
-        logger.error(f'Error sending welcome message: {e}')
-
-# Verify command
-@bot.hybrid_command(name='verify', description='Link your Discord account to your Roblox account')
-async def verify(ctx):
-    await ctx.defer()
+    MemberCache.remember(member)
     
-    await ctx.send("This is a sample verification command. In a full implementation, this would handle Roblox verification.")
+    # Count the join towards raid detection
+    await AntiRaid.on_member_join(member)
+    
+    # Queue welcome message
+    welcomer.add(member)
+
+# Event: Member leaves the server
+@bot.event
+async def on_raw_member_remove(payload):
+    MemberCache.forget(payload.guild_id, payload.user.id)
 
-# Update rank command
-@bot.hybrid_command(name='update', description='Update your rank or another user\'s rank')
-async def update(ctx, user: discord.Member = None):
-    await ctx.defer()
+# Hook: runs before every command
+@bot.before_invoke
+async def before_command(ctx):
+    # Give the command a deadline that RobloxAPI calls inherit
+    start_deadline(COMMAND_DEADLINE)
+    command_tracing.start(ctx)
+    shutdown.command_started(ctx)
     
-    target = user or ctx.author
-    await ctx.send(f"This is a sample update command. In a full implementation, this would update {target.mention}'s rank.")
+    if ctx.guild is not None and isinstance(ctx.author, discord.Member):
+        MemberCache.remember(ctx.author)
 
-# Blacklisted groups command
-@bot.hybrid_command(name='blacklisted', description='Manage blacklisted groups')
-async def blacklisted(ctx):
-    await ctx.defer()
+# Hook: runs after every command, including failed ones
+@bot.after_invoke
+async def after_command(ctx):
+    shutdown.command_finished(ctx)
     
-    await ctx.send("This is a sample blacklisted command. In a full implementation, this would show or modify blacklisted groups.")
+    # Failures are recorded by on_command_error once the error reply is sent
+    if not ctx.command_failed:
+        command_tracing.finish(ctx, 'ok')
+        
+        global first_command_done
+        if not first_command_done:
+            first_command_done = True
+            await cluster.report_recovery()
+            startup_profiler.mark(startup_profiler.FIRST_COMMAND)
+            await asyncio.to_thread(startup_profiler.log_report)
+
+# Commands
+bot_commands.add_commands(bot)
 
 # Load extensions (cogs)
 async def load_extensions():
@@ -79,9 +246,9 @@ async def load_extensions():
         if filename.endswith('.py'):
             try:
                 await bot.load_extension(f'cogs.{filename[:-3]}')
-                logger.info(f'Loaded extension: {filename}')
+                logger.info('Loaded extension: %s', filename)
             except Exception as e:
-                logger.error(f'Failed to load extension {filename}: {e}')
+                logger.error('Failed to load extension %s: %s', filename, e)
 
 # Error handler
 @bot.event
@@ -89,18 +256,53 @@ async def on_command_error(ctx, error):
     if isinstance(error, commands.CommandNotFound):
         return
     
-    logger.error(f'Command error: {error}')
-    await ctx.send(f"An error occurred: {error}")
+    logger.error('Command error: %s', error)
+    try:
+        await ctx.send(f"An error occurred: {error}")
+    finally:
+        command_tracing.finish(ctx, command_tracing.outcome_for(error))
+
+async def wait_for_promotion():
+    """Park a warm standby until the supervisor promotes it with SIGUSR1"""
+    await asyncio.to_thread(Database.initialize)
+    
+    promoted = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGUSR1, promoted.set)
+    print(cluster.STANDBY_READY_MARKER, flush=True)
+    logger.info('Standby ready, waiting for promotion')
+    
+    with startup_profiler.phase('standby_wait'):
+        await promoted.wait()
+    loop.remove_signal_handler(signal.SIGUSR1)
+    logger.info('Promoted from standby, logging in')
 
 # Main function
 async def main():
+    if STANDBY:
+        await wait_for_promotion()
+    
     async with bot:
+        shutdown.install()
+        
         # Load extensions
         # await load_extensions()  # Uncomment when you have cogs
         
-        # Start the bot
+        # Start the bot; returns once the shutdown closes the gateway
         await bot.start(TOKEN)
+    
+    await shutdown.wait()
 
 # Run the bot
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    # Recent events, commands, calls, loop lag and logs, written to disk if the
+    # process crashes or gets SIGUSR2. Only when run as the bot process: the
+    # supervisor and tools import this module too
+    flight_recorder.install()
+    
+    try:
+        asyncio.run(main())
+    except (discord.LoginFailure, discord.PrivilegedIntentsRequired) as e:
+        # Restarting won't help; tell the supervisor not to retry
+        logger.critical('Bot configuration error: %s', e)
+        sys.exit(EXIT_CONFIG_ERROR)
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""Slash and prefix command definitions
+
+Kept apart from bot.py, which connects to Discord and starts background
+work when imported, so the supervisor can build the command tree for its
+REST sync without any of that.
+"""
+
+from typing import Literal
+
+import discord
+from discord.ext import commands
+
+from antiraid import AntiRaid
+from channel_index import ChannelIndex
+from member_cache import MemberCache
+
+# Verify command
+@commands.hybrid_command(name='verify', description='Link your Discord account to your Roblox account')
+async def verify(ctx):
+    await ctx.defer()
+    
+    await ctx.send("This is a sample verification command. In a full implementation, this would handle Roblox verification.")
+
+# Update rank command
+@commands.hybrid_command(name='update', description='Update your rank or another user\'s rank')
+async def update(ctx, user: discord.User = None):
+    await ctx.defer()
+    
+    # Members aren't cached by default; look the target up through the LRU
+    target = ctx.author
+    if user is not None and ctx.guild is not None:
+        target = await MemberCache.get(ctx.guild, user.id)
+        if target is None:
+            await ctx.send(f"{user.mention} is not a member of this server.")
+            return
+    await ctx.send(f"This is a sample update command. In a full implementation, this would update {target.mention}'s rank.")
+
+# Blacklisted groups command
+@commands.hybrid_command(name='blacklisted', description='Manage blacklisted groups')
+async def blacklisted(ctx):
+    await ctx.defer()
+    
+    await ctx.send("This is a sample blacklisted command. In a full implementation, this would show or modify blacklisted groups.")
+
+# Set channel command
+@commands.hybrid_command(name='setchannel', description='Set the channel used for welcome messages, tryouts or logs')
+@commands.has_permissions(manage_guild=True)
+async def setchannel(ctx, role: Literal['welcome', 'tryout', 'logs'], channel: discord.TextChannel):
+    await ctx.defer()
+    
+    await ChannelIndex.configure(ctx.guild, role, channel)
+    await ctx.send(f"The {role} channel is now {channel.mention}.")
+
+# Anti-raid commands
+@commands.hybrid_group(name='antiraid', description='Configure anti-raid protection settings')
+@commands.has_permissions(administrator=True)
+async def antiraid(ctx):
+    await ctx.send("Use `/antiraid enable`, `/antiraid disable` or `/antiraid status`.")
+
+@antiraid.command(name='enable', description='Enable anti-raid protection')
+@commands.has_permissions(administrator=True)
+async def antiraid_enable(
+    ctx,
+    threshold: commands.Range[int, 2, 50] = None,
+    timewindow: commands.Range[int, 5, 60] = None,
+    action: Literal['lockdown', 'kick', 'ban'] = None,
+    min_account_age: commands.Range[int, 0, 365] = None,
+    require_avatar: bool = None
+):
+    await ctx.defer()
+    
+    state = await AntiRaid.configure(
+        ctx.guild.id,
+        enabled=True,
+        threshold=threshold,
+        window=timewindow,
+        action=action,
+        min_account_age_days=min_account_age,
+        require_avatar=require_avatar
+    )
+    await ctx.send(
+        f"🛡️ Anti-raid protection enabled: {state.action} when {state.threshold} members join "
+        f"within {state.window} seconds."
+    )
+
+@antiraid.command(name='disable', description='Disable anti-raid protection')
+@commands.has_permissions(administrator=True)
+async def antiraid_disable(ctx):
+    await ctx.defer()
+    
+    await AntiRaid.configure(ctx.guild.id, enabled=False)
+    await ctx.send("✅ Anti-raid protection has been disabled.")
+
+@antiraid.command(name='status', description='Check current anti-raid settings')
+@commands.has_permissions(administrator=True)
+async def antiraid_status(ctx):
+    await ctx.defer()
+    
+    state = await AntiRaid.get_state(ctx.guild.id)
+    heuristics = []
+    if state.min_account_age_days:
+        heuristics.append(f"accounts younger than {state.min_account_age_days} days")
+    if state.require_avatar:
+        heuristics.append("accounts without an avatar")
+    await ctx.send(
+        f"Anti-raid is {'✅ enabled' if state.enabled else '❌ disabled'}\n"
+        f"Threshold: {state.threshold} members in {state.window} seconds\n"
+        f"Action: {state.action}\n"
+        f"Counting: {', '.join(heuristics) if heuristics else 'all joins'}"
+    )
+
+# Top-level commands, in the order they are added to a bot
+COMMANDS = (verify, update, blacklisted, setchannel, antiraid)
+
+def add_commands(bot):
+    """Register every command on a bot and its app-command tree"""
+    for command in COMMANDS:
+        bot.add_command(command)
+
+def build_tree():
+    """Get the app-command tree without a connected bot, e.g. for a REST sync"""
+    # Intents don't change the commands; default ones keep discord.py from
+    # warning that the guilds intent is off
+    bot = commands.Bot(command_prefix='!', intents=discord.Intents.default())
+    add_commands(bot)
+    return bot.tree
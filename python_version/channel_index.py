@@ -0,0 +1,127 @@
+"""Per-guild index of the channels the bot posts to"""
+
+import logging
+
+import discord
+
+import database
+from database import Database
+
+logger = logging.getLogger('channel_index')
+
+# Channel roles the bot resolves
+WELCOME = 'welcome'
+TRYOUT = 'tryout'
+LOGS = 'logs'
+
+# Names matched when a guild hasn't configured a channel for a role
+DEFAULT_CHANNEL_NAMES = {
+    WELCOME: 'welcome',
+    TRYOUT: 'tryouts',
+    LOGS: 'logs'
+}
+
+class ChannelIndex:
+    """Resolves a guild's welcome, tryout and log channels by ID in O(1)
+
+    Configured channel IDs come from the guild_channels table. Roles without
+    a configured channel fall back to a one-off name match when the guild is
+    indexed; channel create, update and delete events keep the index current
+    so joins never scan the channel list.
+    """
+
+    # guild_id -> {role: channel_id} set by server admins
+    _configured = {}
+
+    # guild_id -> {role: channel_id} currently in use
+    _resolved = {}
+
+    @classmethod
+    async def load(cls):
+        """Load configured channels from the database"""
+        if not Database.is_initialized():
+            return
+
+        try:
+            rows = await database.get_guild_channels()
+        except Exception as e:
+            logger.error("Error loading guild channels: %s", e)
+            return
+
+        for guild_id, role, channel_id in rows:
+            cls._configured.setdefault(int(guild_id), {})[role] = int(channel_id)
+        logger.info("Loaded %s configured guild channels", len(rows))
+
+    @classmethod
+    def index_guild(cls, guild):
+        """Resolve every channel role for a guild"""
+        configured = cls._configured.get(guild.id, {})
+        resolved = {}
+
+        for role, channel_id in configured.items():
+            if guild.get_channel(channel_id) is not None:
+                resolved[role] = channel_id
+
+        missing = {DEFAULT_CHANNEL_NAMES[role]: role for role in DEFAULT_CHANNEL_NAMES if role not in resolved}
+        if missing:
+            for channel in guild.text_channels:
+                role = missing.get(channel.name)
+                if role is not None and role not in resolved:
+                    resolved[role] = channel.id
+
+        cls._resolved[guild.id] = resolved
+
+    @classmethod
+    def forget_guild(cls, guild):
+        """Drop a guild the bot left"""
+        cls._resolved.pop(guild.id, None)
+
+    @classmethod
+    def get(cls, guild, role):
+        """Get the channel a guild uses for a role, or None"""
+        channel_id = cls._resolved.get(guild.id, {}).get(role)
+        if channel_id is None:
+            return None
+        return guild.get_channel(channel_id)
+
+    @classmethod
+    async def configure(cls, guild, role, channel):
+        """Set the channel a guild uses for a role"""
+        if Database.is_initialized():
+            await database.set_guild_channel(guild.id, role, channel.id)
+        else:
+            logger.warning("Database unavailable, %s channel for guild %s will reset on restart", role, guild.id)
+        cls._configured.setdefault(guild.id, {})[role] = channel.id
+        cls._resolved.setdefault(guild.id, {})[role] = channel.id
+
+    @classmethod
+    def on_channel_create(cls, channel):
+        """Pick up a new channel matching an unresolved role's default name"""
+        resolved = cls._resolved.get(channel.guild.id)
+        if resolved is None:
+            return
+
+        for role, name in DEFAULT_CHANNEL_NAMES.items():
+            if role not in resolved and channel.name == name and isinstance(channel, discord.TextChannel):
+                resolved[role] = channel.id
+
+    @classmethod
+    def on_channel_update(cls, before, after):
+        """Re-resolve when a name-matched channel is renamed"""
+        if before.name != after.name:
+            cls._reindex_if_affected(after)
+
+    @classmethod
+    def on_channel_delete(cls, channel):
+        """Re-resolve when an indexed channel is deleted"""
+        cls._reindex_if_affected(channel)
+
+    @classmethod
+    def _reindex_if_affected(cls, channel):
+        resolved = cls._resolved.get(channel.guild.id)
+        if resolved is None:
+            return
+
+        # Only channels we resolved, or ones that could now match a default name, matter
+        if channel.id in resolved.values() or channel.name in DEFAULT_CHANNEL_NAMES.values():
+            cls.index_guild(channel.guild)
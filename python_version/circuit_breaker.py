@@ -0,0 +1,127 @@
+"""Circuit breaker for calls to flaky upstream services"""
+
+import time
+import logging
+
+from metrics import REGISTRY
+
+logger = logging.getLogger('circuit_breaker')
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+# Numeric encoding used for the state gauge
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_state_gauge = REGISTRY.gauge(
+    'circuit_breaker_state',
+    'Circuit breaker state (0=closed, 1=half-open, 2=open)',
+    ('breaker',)
+)
+_transitions = REGISTRY.counter(
+    'circuit_breaker_transitions_total',
+    'Circuit breaker state transitions',
+    ('breaker', 'from_state', 'to_state')
+)
+_rejections = REGISTRY.counter(
+    'circuit_breaker_rejections_total',
+    'Calls rejected because the circuit was open',
+    ('breaker',)
+)
+
+class CircuitOpenError(Exception):
+    """Raised when a call is attempted while the circuit is open"""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f'Circuit {name} is open, retry in {retry_after:.0f}s')
+
+class CircuitBreaker:
+    """Closed / open / half-open circuit breaker
+
+    The breaker opens after `failure_threshold` consecutive failures. After
+    `recovery_timeout` seconds it lets up to `half_open_max_calls` probe calls
+    through; a successful probe closes the circuit, a failed one reopens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+        _state_gauge.labels(name).set(_STATE_VALUES[CLOSED])
+
+    @property
+    def state(self):
+        """Current state, moving from open to half-open once the timeout passes"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def retry_after(self):
+        """Seconds until the circuit will allow a probe call"""
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def allow_request(self):
+        """Check whether a call may go through right now"""
+        state = self.state
+        if state == CLOSED:
+            return True
+
+        if state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return True
+
+        _rejections.labels(self.name).inc()
+        return False
+
+    def check(self):
+        """Raise CircuitOpenError if a call may not go through"""
+        if not self.allow_request():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self):
+        """Record a successful call"""
+        self._failures = 0
+        if self._state != CLOSED:
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        """Record a failed call"""
+        if self._state == HALF_OPEN:
+            self._transition(OPEN)
+            return
+
+        self._failures += 1
+        if self._state == CLOSED and self._failures >= self.failure_threshold:
+            self._transition(OPEN)
+
+    def record_abandoned(self):
+        """Record a call that ended without a verdict (cancelled or cut short by the caller)"""
+        if self._state == HALF_OPEN and self._half_open_calls > 0:
+            # Give the probe slot back so the circuit can't get stuck half-open
+            self._half_open_calls -= 1
+
+    def _transition(self, new_state):
+        old_state = self._state
+        self._state = new_state
+        self._half_open_calls = 0
+
+        if new_state == OPEN:
+            self._opened_at = time.monotonic()
+        elif new_state == CLOSED:
+            self._failures = 0
+
+        _state_gauge.labels(self.name).set(_STATE_VALUES[new_state])
+        _transitions.labels(self.name, old_state, new_state).inc()
+        logger.warning('Circuit %s changed from %s to %s', self.name, old_state, new_state)
@@ -0,0 +1,160 @@
+"""Shard cluster layout and cross-process coordination
+
+The supervisor splits the shards into CLUSTER_COUNT ranges and starts one
+bot process per range, passing CLUSTER_ID, SHARD_IDS and SHARD_COUNT. Each
+process writes a heartbeat file the supervisor uses for health checks, and
+registers itself in Postgres. Limits that must hold across every process,
+such as Roblox write rates, are kept in Postgres too.
+"""
+
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+
+import database
+from database import Database
+from metrics import REGISTRY
+from state_store import STATE_DIR
+
+logger = logging.getLogger('cluster')
+
+CLUSTER_ID = int(os.getenv('CLUSTER_ID', '0'))
+CLUSTER_COUNT = int(os.getenv('CLUSTER_COUNT', '1'))
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+
+# Seconds between heartbeats
+HEARTBEAT_INTERVAL = 15
+
+# Printed by a standby process once it is parked and can be promoted
+STANDBY_READY_MARKER = 'STANDBY_READY'
+
+_failover_recovery = REGISTRY.gauge(
+    'failover_time_to_first_command_seconds',
+    'Seconds from the previous process dying to this one answering a command',
+    ('mode',)
+)
+
+def parse_shard_ids(text):
+    """Parse '0-3' or '0,1,2' into a list of shard IDs"""
+    if not text:
+        return None
+
+    shard_ids = []
+    for part in text.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-', 1)
+            shard_ids.extend(range(int(start), int(end) + 1))
+        elif part:
+            shard_ids.append(int(part))
+    return shard_ids
+
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS'))
+
+def is_sharded():
+    """Check whether the bot should run as an AutoShardedBot"""
+    return SHARD_COUNT is not None or os.getenv('SHARDED', 'false').lower() == 'true'
+
+def is_primary():
+    """Check whether this process does once-per-deployment work like command sync"""
+    return CLUSTER_ID == 0
+
+def shard_ranges(shard_count, cluster_count):
+    """Split shard IDs into contiguous ranges, one per cluster"""
+    cluster_count = max(1, min(cluster_count, shard_count))
+    base, extra = divmod(shard_count, cluster_count)
+
+    ranges = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        size = base + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+def heartbeat_path(cluster_id):
+    return os.path.join(STATE_DIR, f'cluster-{cluster_id}.json')
+
+def read_heartbeat(cluster_id):
+    """Get a cluster's last heartbeat, or None"""
+    try:
+        with open(heartbeat_path(cluster_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_heartbeat(data):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = heartbeat_path(CLUSTER_ID)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+async def heartbeat_loop(bot):
+    """Report this process's health until cancelled"""
+    while True:
+        data = {
+            'cluster_id': CLUSTER_ID,
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'shard_ids': list(bot.shard_ids or []) if hasattr(bot, 'shard_ids') else [],
+            'guilds': len(bot.guilds),
+            'latency': bot.latency if bot.latency == bot.latency else None,
+            'ready': bot.is_ready(),
+            'time': time.time()
+        }
+
+        try:
+            await asyncio.to_thread(_write_heartbeat, data)
+            if Database.is_initialized():
+                await database.record_cluster_heartbeat(CLUSTER_ID, json.dumps(data))
+        except Exception as e:
+            logger.warning("Error writing cluster heartbeat: %s", e)
+
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+def failover_path(cluster_id):
+    return os.path.join(STATE_DIR, f'failover-{cluster_id}.json')
+
+def record_failover(cluster_id, crashed_at, mode):
+    """Note when a cluster went down, so its replacement can time its recovery"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(failover_path(cluster_id), 'w') as f:
+        json.dump({'time': crashed_at, 'mode': mode}, f)
+
+def take_failover(cluster_id):
+    """Get and clear the last recorded failover for a cluster, or None"""
+    path = failover_path(cluster_id)
+    try:
+        with open(path) as f:
+            failover = json.load(f)
+        os.remove(path)
+        return failover
+    except (OSError, ValueError):
+        return None
+
+async def report_recovery():
+    """Report how long commands were down before this process answered one"""
+    failover = await asyncio.to_thread(take_failover, CLUSTER_ID)
+    if failover:
+        elapsed = time.time() - failover['time']
+        _failover_recovery.labels(failover['mode']).set(elapsed)
+        logger.info("First command %.2fs after the previous process died (%s restart)", elapsed, failover['mode'])
+
+def shared_limits_enabled():
+    """Check whether rate limits must be coordinated across processes"""
+    return CLUSTER_COUNT > 1 and Database.is_initialized()
+
+async def reserve_shared(key, per_minute, burst):
+    """Reserve one unit of a rate limit shared by every cluster
+
+    Returns how many seconds the caller must wait before using it.
+    """
+    tokens = await database.take_shared_token(key, per_minute / 60.0, burst)
+    if tokens >= 0:
+        return 0.0
+    return -tokens * 60.0 / per_minute
@@ -0,0 +1,180 @@
+"""Fingerprint-based slash command sync"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+
+import aiohttp
+import discord
+
+import state_store
+
+logger = logging.getLogger('command_sync')
+
+DISCORD_API = 'https://discord.com/api/v10'
+
+# Set by the supervisor after it synced this fingerprint over REST
+SYNCED_FINGERPRINT_ENV = 'COMMAND_TREE_SYNCED'
+
+# Fields Discord echoes back that decide whether a command changed. Left out
+# are the ones Discord assigns (id, application_id, guild_id, version)
+_COMMAND_KEYS = ('type', 'name', 'description', 'options', 'default_member_permissions', 'nsfw',
+                 'dm_permission', 'contexts', 'integration_types',
+                 'name_localizations', 'description_localizations')
+_OPTION_KEYS = ('type', 'name', 'description', 'required', 'choices', 'options', 'channel_types',
+                'min_value', 'max_value', 'min_length', 'max_length', 'autocomplete',
+                'name_localizations', 'description_localizations')
+
+# What Discord stores for a field that was left unset
+_DEFAULTS = {
+    'type': 1,
+    'nsfw': False,
+    'dm_permission': True,
+    'integration_types': [0],
+    'required': False,
+    'autocomplete': False
+}
+
+# List fields whose order doesn't matter
+_UNORDERED_KEYS = ('channel_types', 'contexts', 'integration_types')
+
+def serialize_tree(tree, guild=None):
+    """Serialize the app-command tree into the payload Discord receives, in a stable order"""
+    payload = []
+    for command in tree.get_commands(guild=guild):
+        try:
+            data = command.to_dict(tree)
+        except TypeError:
+            # discord.py < 2.4 doesn't take the tree
+            data = command.to_dict()
+        payload.append(data)
+
+    payload.sort(key=lambda data: (data.get('type', 1), data['name']))
+    return payload
+
+def fingerprint(payload):
+    """Get a stable hash of a serialized command payload"""
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def _normalize(data, keys):
+    """Reduce a command or option to the fields that matter, with unset fields at their defaults"""
+    result = {}
+    for key in keys:
+        value = data.get(key)
+        if value is None:
+            value = _DEFAULTS.get(key)
+        if key == 'options':
+            value = [_normalize(option, _OPTION_KEYS) for option in value or []]
+        elif key == 'choices':
+            value = [
+                {'name': choice['name'], 'value': choice['value'], 'name_localizations': choice.get('name_localizations') or {}}
+                for choice in value or []
+            ]
+        elif key in _UNORDERED_KEYS and value is not None:
+            value = sorted(value)
+        elif key == 'default_member_permissions' and value is not None:
+            value = str(value)
+        # Absent, null and empty are the same to Discord; 0 and False are not
+        if value is None or value == [] or value == {}:
+            continue
+        result[key] = value
+    return result
+
+def diff_commands(local, remote):
+    """Compare local command payloads with the ones Discord has
+
+    Returns (added, removed, changed) lists of command names.
+    """
+    local_commands = {(data.get('type', 1), data['name']): _normalize(data, _COMMAND_KEYS) for data in local}
+    remote_commands = {(data.get('type', 1), data['name']): _normalize(data, _COMMAND_KEYS) for data in remote}
+
+    added = [name for key, name in local_commands if (key, name) not in remote_commands]
+    removed = [name for key, name in remote_commands if (key, name) not in local_commands]
+    changed = [
+        name for key, name in local_commands
+        if (key, name) in remote_commands and local_commands[(key, name)] != remote_commands[(key, name)]
+    ]
+    return added, removed, changed
+
+async def _request(session, method, url, **kwargs):
+    """Send a Discord REST request, waiting out rate limits"""
+    for _ in range(5):
+        async with session.request(method, url, **kwargs) as response:
+            if response.status == 429:
+                data = await response.json()
+                await asyncio.sleep(float(data.get('retry_after', 1)))
+                continue
+            if response.status >= 400:
+                raise RuntimeError(f'Discord returned {response.status} for {method} {url}: {await response.text()}')
+            return await response.json()
+    raise RuntimeError(f'Rate limited too many times on {method} {url}')
+
+async def sync_via_rest(tree, token, application_id, guild_id=None, before_write=None):
+    """Sync the tree's commands over REST, without a gateway session
+
+    Fetches the registered commands and sends a bulk overwrite only when
+    they differ from the local definitions; `await before_write()` runs
+    first and may raise to stop the write. Returns the tree's fingerprint.
+    """
+    guild = discord.Object(id=int(guild_id)) if guild_id else None
+    if guild:
+        tree.copy_global_to(guild=guild)
+    local = serialize_tree(tree, guild)
+    digest = fingerprint(local)
+
+    if guild_id:
+        url = f'{DISCORD_API}/applications/{application_id}/guilds/{guild_id}/commands'
+    else:
+        url = f'{DISCORD_API}/applications/{application_id}/commands'
+    headers = {'Authorization': f'Bot {token}'}
+    timeout = aiohttp.ClientTimeout(total=30)
+
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+        remote = await _request(session, 'GET', url)
+        added, removed, changed = diff_commands(local, remote)
+        if not (added or removed or changed):
+            logger.info('Registered commands match the local tree (%s), nothing to sync', digest[:12])
+            return digest
+
+        if before_write is not None:
+            await before_write()
+        logger.info('Syncing commands: added %s, removed %s, changed %s', added, removed, changed)
+        await _request(session, 'PUT', url, json=local)
+
+    logger.info('Commands synced successfully!')
+    return digest
+
+def _state_key(guild_id):
+    return f'command_hash:{guild_id or "global"}'
+
+async def sync_if_changed(bot, guild_id=None, force=False):
+    """Sync commands only when the tree's fingerprint differs from the last sync
+
+    With `guild_id` the global commands are copied to that guild and synced
+    there, which applies instantly and is meant for development.
+    Returns True if a sync was sent.
+    """
+    guild = discord.Object(id=int(guild_id)) if guild_id else None
+    if guild:
+        bot.tree.copy_global_to(guild=guild)
+
+    digest = fingerprint(serialize_tree(bot.tree, guild))
+    key = _state_key(guild_id)
+
+    if not force and os.getenv(SYNCED_FINGERPRINT_ENV) == digest:
+        logger.info('Commands already synced by the supervisor (%s)', digest[:12])
+        await state_store.set_value(key, digest)
+        return False
+
+    if not force and await state_store.get_value(key) == digest:
+        logger.info('Command tree unchanged (%s), skipping sync', digest[:12])
+        return False
+
+    logger.info('Syncing commands with Discord (%s)...', "guild " + str(guild_id) if guild else "global")
+    await bot.tree.sync(guild=guild)
+    await state_store.set_value(key, digest)
+    logger.info('Commands synced successfully!')
+    return True
@@ -0,0 +1,138 @@
+"""Per-command latency breakdown from interaction receipt to final response"""
+
+import os
+import time
+import asyncio
+import logging
+import contextvars
+
+from discord import app_commands
+from discord.ext import commands
+
+import flight_recorder
+from metrics import REGISTRY
+
+logger = logging.getLogger('command_tracing')
+
+DEFER = 'defer'
+ROBLOX = 'roblox'
+DATABASE = 'database'
+TOTAL = 'total'
+
+# Discord drops an interaction that isn't answered within 3 seconds
+INTERACTION_DEADLINE = 3.0
+
+# Commands slower than this are logged with their breakdown
+SLOW_COMMAND_SECONDS = float(os.getenv('SLOW_COMMAND_SECONDS', '2.5'))
+
+# Finer around the interaction deadline, where the distinction matters
+COMMAND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 5.0, 10.0, 15.0)
+
+_phase_seconds = REGISTRY.histogram(
+    'command_phase_seconds',
+    'Time spent per command in each phase (defer, roblox, database, total)',
+    ('command', 'phase'),
+    buckets=COMMAND_BUCKETS
+)
+_commands = REGISTRY.counter(
+    'commands_total',
+    'Commands handled by outcome',
+    ('command', 'outcome')
+)
+
+_current_trace = contextvars.ContextVar('command_trace', default=None)
+
+class CommandTrace:
+    """Timings gathered while one command runs"""
+
+    def __init__(self, command, received_at):
+        self.command = command
+        # Wall-clock time Discord received the interaction or message
+        self.received_at = received_at
+        self.deferred_after = None
+        self.phases = {ROBLOX: 0.0, DATABASE: 0.0}
+        self.outcome = None
+
+    def elapsed(self):
+        # Snowflake timestamps and our clock can disagree by a little
+        return max(0.0, time.time() - self.received_at)
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def mark_deferred(self):
+        if self.deferred_after is None:
+            self.deferred_after = self.elapsed()
+
+def _received_at(ctx):
+    source = ctx.interaction or ctx.message
+    return source.created_at.timestamp()
+
+def start(ctx):
+    """Start tracing a command; called from the bot's before_invoke hook"""
+    name = ctx.command.qualified_name if ctx.command else 'unknown'
+    trace = CommandTrace(name, _received_at(ctx))
+    ctx.command_trace = trace
+    _current_trace.set(trace)
+    flight_recorder.record(flight_recorder.COMMAND, name, 'started', ctx.author.id)
+
+    # Time the defer, which is what keeps a slow interaction alive
+    defer = ctx.defer
+    async def timed_defer(*args, **kwargs):
+        await defer(*args, **kwargs)
+        trace.mark_deferred()
+    ctx.defer = timed_defer
+    return trace
+
+def add_time(phase, seconds):
+    """Charge time to the running command's phase, if a command is running
+
+    Calls made in parallel are summed, so a phase can exceed the total.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(phase, seconds)
+
+def outcome_for(error):
+    """Get the outcome label for a command error"""
+    # Hybrid and invoke errors wrap the real exception
+    while getattr(error, 'original', None) is not None:
+        error = error.original
+
+    if isinstance(error, (commands.CheckFailure, app_commands.CheckFailure)):
+        return 'rejected'
+    if isinstance(error, (commands.UserInputError, commands.CommandOnCooldown, app_commands.TransformerError)):
+        return 'bad_input'
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+    return 'error'
+
+def finish(ctx, outcome):
+    """Record a command's timings once its final response is sent"""
+    trace = getattr(ctx, 'command_trace', None)
+    if trace is None:
+        # Failed a check before before_invoke ran
+        name = ctx.command.qualified_name if ctx.command else 'unknown'
+        trace = CommandTrace(name, _received_at(ctx))
+        ctx.command_trace = trace
+    if trace.outcome is not None:
+        return
+    trace.outcome = outcome
+
+    total = trace.elapsed()
+    if trace.deferred_after is not None:
+        _phase_seconds.labels(trace.command, DEFER).observe(trace.deferred_after)
+    for phase, seconds in trace.phases.items():
+        _phase_seconds.labels(trace.command, phase).observe(seconds)
+    _phase_seconds.labels(trace.command, TOTAL).observe(total)
+    _commands.labels(trace.command, outcome).inc()
+    flight_recorder.record(flight_recorder.COMMAND, trace.command, outcome, total)
+
+    acknowledged = trace.deferred_after if trace.deferred_after is not None else total
+    if total >= SLOW_COMMAND_SECONDS or acknowledged >= INTERACTION_DEADLINE:
+        logger.warning(
+            "Slow command %s (%s): total %.2fs, defer %s, roblox %.2fs, database %.2fs",
+            trace.command, outcome, total,
+            '-' if trace.deferred_after is None else f'{trace.deferred_after:.2f}s',
+            trace.phases[ROBLOX], trace.phases[DATABASE]
+        )
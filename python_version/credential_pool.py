@@ -0,0 +1,255 @@
+"""Pool of Roblox ranking accounts for spreading rank writes"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+
+import cluster
+import deadline
+from deadline import DeadlineExceeded
+from metrics import REGISTRY
+from roblox_metrics import AUTH, RATE_LIMITED, classify_error
+
+logger = logging.getLogger('credential_pool')
+
+# Rank writes each account may make per minute before we hold it back
+ACCOUNT_WRITES_PER_MINUTE = float(os.getenv('ROBLOX_RANK_RATE', '60'))
+ACCOUNT_BURST = int(os.getenv('ROBLOX_RANK_BURST', '5'))
+
+# Consecutive auth failures before an account is quarantined, and for how long
+AUTH_FAILURE_THRESHOLD = int(os.getenv('ROBLOX_AUTH_FAILURES', '2'))
+QUARANTINE_SECONDS = float(os.getenv('ROBLOX_QUARANTINE', '900'))
+
+# Back-off applied to an account after Roblox answers 429
+RATE_LIMIT_BACKOFF = 60.0
+
+_accounts_gauge = REGISTRY.gauge(
+    'roblox_pool_accounts',
+    'Ranking accounts by state',
+    ('state',)
+)
+_writes = REGISTRY.counter(
+    'roblox_pool_writes_total',
+    'Rank writes dispatched per ranking account',
+    ('account',)
+)
+_quarantines = REGISTRY.counter(
+    'roblox_pool_quarantines_total',
+    'Times a ranking account was quarantined',
+    ('account',)
+)
+
+class NoHealthyAccountError(Exception):
+    """Raised when every ranking account is quarantined"""
+
+class AccountUnavailable(Exception):
+    """Raised when a write failed because of the account, not because of Roblox"""
+
+    def __init__(self, account, reason):
+        self.account = account
+        self.reason = reason
+        super().__init__(f'Ranking account {account.label} unavailable: {reason}')
+
+def cookies_from_env():
+    """Get ranking cookies from ROBLOX_COOKIE and ROBLOX_COOKIES
+
+    ROBLOX_COOKIES holds extra cookies separated by commas or newlines.
+    """
+    cookies = []
+    primary = os.getenv('ROBLOX_COOKIE')
+    if primary:
+        cookies.append(primary.strip())
+
+    for cookie in re.split(r'[,\n]', os.getenv('ROBLOX_COOKIES', '')):
+        cookie = cookie.strip()
+        if cookie and cookie not in cookies:
+            cookies.append(cookie)
+
+    return cookies
+
+class RankingAccount:
+    """One Roblox account with its own client, session, CSRF token and rate-limit state"""
+
+    def __init__(self, index, cookie, client):
+        self.index = index
+        self.label = str(index)
+        self.cookie = cookie
+        self.client = client
+        self.name = None
+
+        # Token bucket for writes
+        self._tokens = float(ACCOUNT_BURST)
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+
+        self.auth_failures = 0
+        self.quarantined_until = 0.0
+
+    async def authenticate(self):
+        """Check the cookie by fetching the authenticated user"""
+        try:
+            user = await self.client.get_authenticated_user()
+        except Exception as e:
+            logger.error("Authentication error for ranking account %s: %s", self.label, e)
+            self.quarantine()
+            return False
+
+        if not user:
+            logger.error("Failed to authenticate ranking account %s", self.label)
+            self.quarantine()
+            return False
+
+        self.name = user.name
+        logger.info("Logged into Roblox as %s (ID: %s) for ranking account %s", user.name, user.id, self.label)
+        return True
+
+    def is_quarantined(self, now):
+        return now < self.quarantined_until
+
+    def quarantine(self):
+        self.quarantined_until = time.monotonic() + QUARANTINE_SECONDS
+        _quarantines.labels(self.label).inc()
+        logger.warning("Quarantined ranking account %s for %.0fs", self.label, QUARANTINE_SECONDS)
+
+    def ready_in(self, now):
+        """Seconds until this account may send another write"""
+        self._refill(now)
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._tokens >= 1.0:
+            return 0.0
+        return (1.0 - self._tokens) * 60.0 / ACCOUNT_WRITES_PER_MINUTE
+
+    def spare(self):
+        """Writes available right now without waiting"""
+        return self._tokens
+
+    def block(self, seconds):
+        """Hold back writes from this account for `seconds`"""
+        self._blocked_until = time.monotonic() + seconds
+
+    def take(self):
+        self._tokens -= 1.0
+        _writes.labels(self.label).inc()
+
+    def _refill(self, now):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._tokens = min(ACCOUNT_BURST, self._tokens + elapsed * ACCOUNT_WRITES_PER_MINUTE / 60.0)
+
+class CredentialPool:
+    """Spreads rank writes across healthy ranking accounts"""
+
+    def __init__(self, cookies, client_factory):
+        self._accounts = [
+            RankingAccount(index, cookie, client_factory(cookie))
+            for index, cookie in enumerate(cookies)
+        ]
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._accounts)
+
+    async def initialize(self):
+        """Authenticate every account, quarantining the ones that fail"""
+        results = await asyncio.gather(*(account.authenticate() for account in self._accounts))
+        self._update_gauges()
+        healthy = sum(results)
+        logger.info("%s/%s Roblox ranking accounts authenticated", healthy, len(self._accounts))
+        return healthy
+
+    def primary(self):
+        """Get the first healthy account, used for reads"""
+        now = time.monotonic()
+        for account in self._accounts:
+            if not account.is_quarantined(now):
+                return account
+        return self._accounts[0]
+
+    def healthy_count(self):
+        now = time.monotonic()
+        return sum(1 for account in self._accounts if not account.is_quarantined(now))
+
+    async def acquire(self):
+        """Get an account that may send a write, waiting for rate limits if needed"""
+        account = await self._acquire_local()
+        if cluster.shared_limits_enabled():
+            await self._wait_for_shared(account)
+        return account
+
+    async def _wait_for_shared(self, account):
+        # Every cluster process holds its own pool, so the account's real
+        # budget is kept in Postgres; the local bucket only smooths bursts.
+        try:
+            wait = await cluster.reserve_shared(f'roblox_rank:{account.label}', ACCOUNT_WRITES_PER_MINUTE, ACCOUNT_BURST)
+        except Exception as e:
+            logger.warning("Shared rate limit unavailable, using local limit only: %s", e)
+            return
+
+        if wait <= 0:
+            return
+        left = deadline.remaining()
+        if left is not None and left < wait:
+            raise DeadlineExceeded('Shared ranking rate limit will not free up before the command deadline')
+        await asyncio.sleep(wait)
+
+    async def _acquire_local(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                best = None
+                best_wait = None
+                for account in self._accounts:
+                    if account.is_quarantined(now):
+                        continue
+                    wait = account.ready_in(now)
+                    # Prefer the account with the most spare capacity
+                    if best is None or wait < best_wait or (wait == best_wait and account.spare() > best.spare()):
+                        best, best_wait = account, wait
+
+                if best is None:
+                    self._update_gauges()
+                    raise NoHealthyAccountError('Every Roblox ranking account is quarantined')
+
+                if best_wait == 0:
+                    best.take()
+                    return best
+
+                left = deadline.remaining()
+                if left is not None and left < best_wait:
+                    raise DeadlineExceeded('No ranking account is free before the command deadline')
+                await asyncio.sleep(best_wait)
+
+    def record_success(self, account):
+        account.auth_failures = 0
+
+    def record_failure(self, account, error):
+        """Update account state after a failed write
+
+        Returns True when the failure was the account's fault and the write
+        should be retried on another account.
+        """
+        category = classify_error(error)
+        if category == RATE_LIMITED:
+            account.block(RATE_LIMIT_BACKOFF)
+            logger.warning("Ranking account %s was rate limited", account.label)
+            return True
+
+        # Only a rejected cookie is the account's fault. A permission error
+        # (e.g. ranking above the bot's rank) would fail on every account
+        if category == AUTH:
+            account.auth_failures += 1
+            if account.auth_failures >= AUTH_FAILURE_THRESHOLD:
+                account.auth_failures = 0
+                account.quarantine()
+                self._update_gauges()
+            return True
+
+        return False
+
+    def _update_gauges(self):
+        healthy = self.healthy_count()
+        _accounts_gauge.labels('healthy').set(healthy)
+        _accounts_gauge.labels('quarantined').set(len(self._accounts) - healthy)
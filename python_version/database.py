@@ -1,12 +1,22 @@
 import os
+import time
+import asyncio
 import logging
 import psycopg2
 from psycopg2 import pool
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+import command_tracing
+import flight_recorder
+
 logger = logging.getLogger('database')
 
+# Connections kept open per process. Calls run in worker threads, so they
+# queue for a connection instead of failing when every one is in use
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '10'))
+
+# Bounds the calls in flight to the pool size; created on first use, in the bot's event loop
+_slots = None
+
 class Database:
     """Database connection class for PostgreSQL"""
     
@@ -21,8 +31,9 @@ class Database:
                 logger.error("DATABASE_URL environment variable not set")
                 return False
                 
-            cls._connection_pool = pool.SimpleConnectionPool(
-                1, 10, database_url
+            # ThreadedConnectionPool: calls come from asyncio.to_thread workers
+            cls._connection_pool = pool.ThreadedConnectionPool(
+                1, DATABASE_POOL_SIZE, database_url
             )
             
             logger.info("PostgreSQL connection pool created")
@@ -32,13 +43,14 @@ class Database:
             
             return True
         except Exception as e:
-            logger.error(f"Error initializing database: {e}")
+            logger.error("Error initializing database: %s", e)
             return False
     
     @classmethod
     def _initialize_tables(cls):
         """Create necessary tables if they don't exist"""
-        with cls.get_connection() as conn:
+        conn = cls.get_connection()
+        try:
             with conn.cursor() as cursor:
                 # Create verified users table
                 cursor.execute("""
@@ -102,8 +114,166 @@ class Database:
                     )
                 """)
                 
+                # Create per-guild channel configuration table
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS guild_channels (
+                        guild_id VARCHAR(255) NOT NULL,
+                        role VARCHAR(255) NOT NULL,
+                        channel_id VARCHAR(255) NOT NULL,
+                        PRIMARY KEY (guild_id, role)
+                    )
+                """)
+                
+                # Create key/value table for bot runtime state
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_state (
+                        key VARCHAR(255) PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # Create shard cluster heartbeat table
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS cluster_heartbeats (
+                        cluster_id INTEGER PRIMARY KEY,
+                        status TEXT NOT NULL,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # Create token buckets shared by every cluster
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS shared_rate_limits (
+                        key VARCHAR(255) PRIMARY KEY,
+                        tokens DOUBLE PRECISION NOT NULL,
+                        updated_at TIMESTAMPTZ NOT NULL
+                    )
+                """)
+                
                 conn.commit()
                 logger.info("Database tables initialized")
+        finally:
+            cls.return_connection(conn)
+    
+    @classmethod
+    def is_initialized(cls):
+        """Check whether the connection pool has been created"""
+        return cls._connection_pool is not None
+    
+    @classmethod
+    def get_state(cls, key):
+        """Get a bot state value by key"""
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT value FROM bot_state WHERE key = %s", (key,))
+                row = cursor.fetchone()
+                return row[0] if row else None
+        finally:
+            cls.return_connection(conn)
+    
+    @classmethod
+    def set_state(cls, key, value):
+        """Set a bot state value by key"""
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO bot_state (key, value, updated_at)
+                    VALUES (%s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (key) DO UPDATE
+                    SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP
+                """, (key, value))
+            conn.commit()
+        finally:
+            cls.return_connection(conn)
+    
+    @classmethod
+    def delete_state(cls, key):
+        """Delete a bot state value by key"""
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM bot_state WHERE key = %s", (key,))
+            conn.commit()
+        finally:
+            cls.return_connection(conn)
+    
+    @classmethod
+    def get_guild_channels(cls):
+        """Get every configured (guild_id, role, channel_id)"""
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT guild_id, role, channel_id FROM guild_channels")
+                rows = cursor.fetchall()
+                
+                # Tryout channels set up before guild_channels existed
+                cursor.execute("SELECT guild_id, 'tryout', channel_id FROM tryout_channels")
+                return cursor.fetchall() + rows
+        finally:
+            cls.return_connection(conn)
+    
+    @classmethod
+    def set_guild_channel(cls, guild_id, role, channel_id):
+        """Configure the channel a guild uses for a role"""
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO guild_channels (guild_id, role, channel_id)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (guild_id, role) DO UPDATE SET channel_id = EXCLUDED.channel_id
+                """, (str(guild_id), role, str(channel_id)))
+            conn.commit()
+        finally:
+            cls.return_connection(conn)
+    
+    @classmethod
+    def record_cluster_heartbeat(cls, cluster_id, status):
+        """Record a shard cluster's latest heartbeat"""
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO cluster_heartbeats (cluster_id, status, updated_at)
+                    VALUES (%s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (cluster_id) DO UPDATE
+                    SET status = EXCLUDED.status, updated_at = CURRENT_TIMESTAMP
+                """, (cluster_id, status))
+            conn.commit()
+        finally:
+            cls.return_connection(conn)
+    
+    @classmethod
+    def take_shared_token(cls, key, rate, burst):
+        """Take one token from a shared bucket and return the balance left
+        
+        The refill and the take happen in a single upsert, so concurrent
+        processes never see the same token. A negative balance is debt the
+        caller pays off by waiting.
+        """
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO shared_rate_limits (key, tokens, updated_at)
+                    VALUES (%s, %s - 1, clock_timestamp())
+                    ON CONFLICT (key) DO UPDATE
+                    SET tokens = LEAST(
+                            %s,
+                            shared_rate_limits.tokens
+                            + EXTRACT(EPOCH FROM clock_timestamp() - shared_rate_limits.updated_at) * %s
+                        ) - 1,
+                        updated_at = clock_timestamp()
+                    RETURNING tokens
+                """, (key, burst, burst, rate))
+                tokens = cursor.fetchone()[0]
+            conn.commit()
+            return tokens
+        finally:
+            cls.return_connection(conn)
     
     @classmethod
     def get_connection(cls):
@@ -115,12 +285,39 @@ class Database:
         """Return a connection to the pool"""
         cls._connection_pool.putconn(connection)
     
+    @classmethod
+    def pool_stats(cls):
+        """Get (connections in use, idle connections, max connections)"""
+        connection_pool = cls._connection_pool
+        if connection_pool is None:
+            return 0, 0, 0
+        return len(connection_pool._used), len(connection_pool._pool), connection_pool.maxconn
+    
     @classmethod
     def close_all(cls):
         """Close all connections in the pool"""
         cls._connection_pool.closeall()
         logger.info("All database connections closed")
 
+async def _run(func, *args):
+    """Run a blocking database call in a thread, charging the time to the running command
+    
+    At most DATABASE_POOL_SIZE calls run at once; the rest wait here, in
+    the event loop, rather than holding a worker thread.
+    """
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(DATABASE_POOL_SIZE)
+    
+    started = time.monotonic()
+    try:
+        async with _slots:
+            return await asyncio.to_thread(func, *args)
+    finally:
+        elapsed = time.monotonic() - started
+        command_tracing.add_time(command_tracing.DATABASE, elapsed)
+        flight_recorder.record(flight_recorder.CALL, 'database', func.__name__, elapsed)
+
 # Example usage functions that would be implemented in full version
 async def get_verified_user(discord_id):
     """Get a verified user by Discord ID"""
@@ -136,4 +333,32 @@ async def get_verification_code(discord_id):
 
 async def set_verification_code(discord_id, code, roblox_username):
     """Set verification code for a user"""
-    pass
\ No newline at end of file
+    pass
+
+async def get_bot_state(key):
+    """Get a bot state value without blocking the event loop"""
+    return await _run(Database.get_state, key)
+
+async def set_bot_state(key, value):
+    """Set a bot state value without blocking the event loop"""
+    await _run(Database.set_state, key, value)
+
+async def delete_bot_state(key):
+    """Delete a bot state value without blocking the event loop"""
+    await _run(Database.delete_state, key)
+
+async def get_guild_channels():
+    """Get every configured guild channel without blocking the event loop"""
+    return await _run(Database.get_guild_channels)
+
+async def set_guild_channel(guild_id, role, channel_id):
+    """Configure a guild channel without blocking the event loop"""
+    await _run(Database.set_guild_channel, guild_id, role, channel_id)
+
+async def record_cluster_heartbeat(cluster_id, status):
+    """Record a shard cluster heartbeat without blocking the event loop"""
+    await _run(Database.record_cluster_heartbeat, cluster_id, status)
+
+async def take_shared_token(key, rate, burst):
+    """Take a shared rate limit token without blocking the event loop"""
+    return await _run(Database.take_shared_token, key, rate, burst)
\ No newline at end of file
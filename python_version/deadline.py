@@ -0,0 +1,62 @@
+"""Per-call deadlines propagated through asyncio tasks"""
+
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+
+# Absolute monotonic time by which the current command must finish
+_current_deadline = contextvars.ContextVar('deadline', default=None)
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when a call runs past the caller's deadline"""
+
+def _tightened(seconds):
+    """Get the expiry `seconds` from now, never later than the current deadline"""
+    expires_at = time.monotonic() + seconds
+    outer = _current_deadline.get()
+    if outer is not None:
+        expires_at = min(expires_at, outer)
+    return expires_at
+
+@contextmanager
+def deadline_scope(seconds):
+    """Bound every nested call to finish within `seconds`
+
+    Nested scopes can only tighten the deadline, never extend it. The deadline
+    follows the asyncio task (and tasks it creates), so RobloxAPI calls made
+    anywhere below a command pick it up without extra arguments.
+    """
+    token = _current_deadline.set(_tightened(seconds))
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+def remaining():
+    """Seconds left before the current deadline, or None when there is none"""
+    expires_at = _current_deadline.get()
+    if expires_at is None:
+        return None
+    return max(0.0, expires_at - time.monotonic())
+
+def timeout_for(default):
+    """Get the timeout for a call, capped by the current deadline
+
+    Returns (timeout, capped) where `capped` is True when the deadline, not
+    `default`, is the binding limit.
+    """
+    left = remaining()
+    if left is None or left >= default:
+        return default, False
+    if left <= 0:
+        raise DeadlineExceeded('Deadline already exceeded')
+    return left, True
+
+def start_deadline(seconds):
+    """Set a deadline for the rest of the current task
+
+    Meant for hooks such as `before_invoke` that run in the command's task
+    but can't wrap its body in `deadline_scope`.
+    """
+    _current_deadline.set(_tightened(seconds))
@@ -0,0 +1,242 @@
+"""Crash flight recorder for the bot process
+
+Keeps the recent history of the process in fixed-size ring buffers:
+gateway events, commands, Roblox and database calls with timings, event
+loop lag samples and log records. Recording appends one tuple to a deque
+and formats nothing, so it costs well under a microsecond.
+
+The buffers are written to the state directory when the process dies from
+an unhandled exception, and on SIGUSR2. Hard faults (segfaults, aborts)
+can't run Python code, so faulthandler writes the thread stacks to a
+separate file instead. The supervisor collects both after the process
+exits, moves them to the crashes directory and indexes them.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import signal
+import logging
+import threading
+import traceback
+import faulthandler
+from collections import deque
+
+# Kinds of entries
+EVENT = 'event'
+COMMAND = 'command'
+CALL = 'call'
+LAG = 'lag'
+LOG = 'log'
+
+# Entries kept per kind; a busy kind can't push out the others
+RING_SIZES = {
+    EVENT: 500,
+    COMMAND: 200,
+    CALL: 500,
+    LAG: 300,
+    LOG: 200
+}
+
+# Crash dumps kept by the supervisor
+MAX_CRASH_DUMPS = int(os.getenv('MAX_CRASH_DUMPS', '20'))
+
+CRASH_DIR_NAME = 'crashes'
+INDEX_NAME = 'index.jsonl'
+
+_rings = {kind: deque(maxlen=size) for kind, size in RING_SIZES.items()}
+_fault_file = None
+_dump_lock = threading.Lock()
+
+def record(kind, *fields):
+    """Add an entry; fields are stored as given and formatted only when dumped"""
+    _rings[kind].append((time.time(), fields))
+
+class RingHandler(logging.Handler):
+    """Keeps recent log records in the recorder"""
+
+    def emit(self, record):
+        _rings[LOG].append((record.created, (record.levelname, record.name, record)))
+
+def _state_dir():
+    # Imported here: state_store imports database, which records into this module
+    from state_store import STATE_DIR
+    return STATE_DIR
+
+def _cluster_id():
+    import cluster
+    return cluster.CLUSTER_ID
+
+def _format_entry(kind, fields):
+    if kind == LOG:
+        level, name, record = fields
+        try:
+            message = record.getMessage()
+        except Exception:
+            message = str(record.msg)
+        return [level, name, message]
+    return [field if isinstance(field, (int, float, str, bool, type(None))) else repr(field) for field in fields]
+
+def snapshot():
+    """Get the buffers as JSON-ready lists, newest last"""
+    now = time.time()
+    # list() copies a deque without releasing the GIL, so threads can keep appending
+    return {
+        kind: [{'ago': round(now - at, 3), 'entry': _format_entry(kind, fields)} for at, fields in list(ring)]
+        for kind, ring in _rings.items()
+    }
+
+def _thread_stacks():
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    return {
+        names.get(ident, str(ident)): ''.join(traceback.format_stack(frame))
+        for ident, frame in sys._current_frames().items()
+    }
+
+def dump(reason, exc_info=None):
+    """Write the buffers, thread stacks and the exception to a file; returns its path
+
+    Returns None if a dump is already being written, e.g. when a signal
+    arrives during a crash dump.
+    """
+    if not _dump_lock.acquire(blocking=False):
+        return None
+    try:
+        state_dir = _state_dir()
+        os.makedirs(state_dir, exist_ok=True)
+        now = time.time()
+        recording = {
+            'reason': reason,
+            'time': now,
+            'pid': os.getpid(),
+            'cluster_id': _cluster_id(),
+            'exception': ''.join(traceback.format_exception(*exc_info)) if exc_info else None,
+            'threads': _thread_stacks(),
+            'buffers': snapshot()
+        }
+        path = os.path.join(state_dir, f'flight-{_cluster_id()}-{os.getpid()}-{int(now * 1000)}.json')
+        with open(path, 'w') as f:
+            json.dump(recording, f)
+    finally:
+        _dump_lock.release()
+    return path
+
+def fault_path(cluster_id, pid):
+    return os.path.join(_state_dir(), f'fault-{cluster_id}-{pid}.log')
+
+def _excepthook(exc_type, exc, tb):
+    if not issubclass(exc_type, (KeyboardInterrupt, SystemExit)):
+        try:
+            path = dump('unhandled_exception', (exc_type, exc, tb))
+            print(f'Flight recording written to {path}', file=sys.stderr)
+        except Exception:
+            pass
+    sys.__excepthook__(exc_type, exc, tb)
+
+def _on_dump_signal(signum, frame):
+    # Not logged: the signal may have interrupted a thread holding a logging lock
+    path = dump(signal.Signals(signum).name)
+    if path:
+        os.write(2, f'Flight recording written to {path}\n'.encode())
+
+def _close_fault_file():
+    # An empty fault file means the process didn't fault
+    if _fault_file is not None:
+        _fault_file.close()
+        if os.path.getsize(_fault_file.name) == 0:
+            os.remove(_fault_file.name)
+
+def install():
+    """Record log records and dump on crash, on hard faults and on SIGUSR2"""
+    global _fault_file
+    logging.getLogger().addHandler(RingHandler())
+    sys.excepthook = _excepthook
+
+    os.makedirs(_state_dir(), exist_ok=True)
+    _fault_file = open(fault_path(_cluster_id(), os.getpid()), 'w')
+    faulthandler.enable(_fault_file, all_threads=True)
+
+    # A plain handler, not the event loop's, so a dump works while the loop
+    # is stuck in Python code. faulthandler writes the raw stacks first,
+    # which works even when it is stuck in C
+    signal.signal(signal.SIGUSR2, _on_dump_signal)
+    faulthandler.register(signal.SIGUSR2, _fault_file, all_threads=True, chain=True)
+    atexit.register(_close_fault_file)
+
+def collect(cluster_id, pid, exit_code, exit_reason):
+    """Move a dead process's dumps to the crashes directory and index them
+
+    Called by the supervisor. Returns the index entry, or None when the
+    process left nothing behind.
+    """
+    state_dir = _state_dir()
+    prefix = f'flight-{cluster_id}-{pid}-'
+    recordings = sorted(name for name in os.listdir(state_dir) if name.startswith(prefix)) if os.path.isdir(state_dir) else []
+
+    fault = fault_path(cluster_id, pid)
+    if os.path.exists(fault) and os.path.getsize(fault) == 0:
+        os.remove(fault)
+    if not recordings and not os.path.exists(fault):
+        return None
+
+    crash_dir = os.path.join(state_dir, CRASH_DIR_NAME)
+    os.makedirs(crash_dir, exist_ok=True)
+    entry = {
+        'time': time.time(),
+        'cluster_id': cluster_id,
+        'pid': pid,
+        'exit_code': exit_code,
+        'exit_reason': exit_reason,
+        'recordings': [],
+        'fault_log': None,
+        'summary': None
+    }
+
+    for name in recordings:
+        os.replace(os.path.join(state_dir, name), os.path.join(crash_dir, name))
+        entry['recordings'].append(name)
+        with open(os.path.join(crash_dir, name)) as f:
+            recording = json.load(f)
+        if recording.get('exception'):
+            entry['summary'] = recording['exception'].strip().splitlines()[-1]
+        elif entry['summary'] is None:
+            entry['summary'] = recording.get('reason')
+
+    if os.path.exists(fault):
+        name = os.path.basename(fault)
+        os.replace(fault, os.path.join(crash_dir, name))
+        entry['fault_log'] = name
+        with open(os.path.join(crash_dir, name), errors='replace') as f:
+            first_line = f.readline().strip()
+        # faulthandler starts with this line for a hard fault, and with the
+        # stacks for a SIGUSR2 dump
+        if first_line.startswith('Fatal Python error'):
+            entry['summary'] = first_line
+
+    _append_index(crash_dir, entry)
+    return entry
+
+def _append_index(crash_dir, entry):
+    """Add an entry to the index and drop the files of the oldest crashes"""
+    index_path = os.path.join(crash_dir, INDEX_NAME)
+    entries = []
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    entries.append(entry)
+
+    for old in entries[:-MAX_CRASH_DUMPS]:
+        for name in old['recordings'] + ([old['fault_log']] if old['fault_log'] else []):
+            try:
+                os.remove(os.path.join(crash_dir, name))
+            except FileNotFoundError:
+                pass
+    entries = entries[-MAX_CRASH_DUMPS:]
+
+    temp_path = f'{index_path}.tmp'
+    with open(temp_path, 'w') as f:
+        for kept in entries:
+            f.write(json.dumps(kept) + '\n')
+    os.replace(temp_path, index_path)
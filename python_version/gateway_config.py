@@ -0,0 +1,64 @@
+"""Gateway intents and cache policy read from the environment"""
+
+import os
+import logging
+
+import discord
+
+logger = logging.getLogger('gateway_config')
+
+def _env_flag(name, default):
+    return os.getenv(name, str(default)).lower() == 'true'
+
+def build_intents():
+    """Build gateway intents
+
+    Members is needed for on_member_join and message content for prefix
+    commands; presences stays off unless asked for since it is by far the
+    most expensive intent.
+    """
+    intents = discord.Intents.default()
+    intents.members = _env_flag('INTENT_MEMBERS', True)
+    intents.message_content = _env_flag('INTENT_MESSAGE_CONTENT', True)
+    intents.presences = _env_flag('INTENT_PRESENCES', False)
+    return intents
+
+def build_member_cache_flags(intents):
+    """Build member cache flags from MEMBER_CACHE
+
+    MEMBER_CACHE is 'none' (default), 'all', or a comma-separated list of
+    flags such as 'joined,voice'. Members outside the cache are fetched on
+    demand through member_cache.MemberCache.
+    """
+    setting = os.getenv('MEMBER_CACHE', 'none').strip().lower()
+    if setting == 'all':
+        return discord.MemberCacheFlags.from_intents(intents)
+    if setting in ('', 'none'):
+        return discord.MemberCacheFlags.none()
+
+    flags = discord.MemberCacheFlags.none()
+    for name in setting.split(','):
+        name = name.strip()
+        if not hasattr(flags, name):
+            logger.warning("Ignoring unknown member cache flag: %s", name)
+            continue
+        setattr(flags, name, True)
+    return flags
+
+def build_client_options():
+    """Get keyword arguments for the bot's gateway intents and caches"""
+    intents = build_intents()
+    options = {
+        'intents': intents,
+        'member_cache_flags': build_member_cache_flags(intents),
+        # Chunking downloads every member of every guild at startup
+        'chunk_guilds_at_startup': _env_flag('CHUNK_GUILDS_AT_STARTUP', False),
+        'max_messages': int(os.getenv('MESSAGE_CACHE_SIZE', '100')) or None
+    }
+    logger.info(
+        "Gateway config: members=%s, message_content=%s, presences=%s, member_cache=%s, "
+        "chunk_at_startup=%s, message_cache=%s",
+        intents.members, intents.message_content, intents.presences, os.getenv('MEMBER_CACHE', 'none'),
+        options['chunk_guilds_at_startup'], options['max_messages']
+    )
+    return options
@@ -0,0 +1,255 @@
+"""Gateway session resume across process restarts
+
+On graceful shutdown the bot closes its gateway connection with a code
+that keeps the session alive, and saves each shard's session ID, sequence
+and resume URL. The next process rebuilds the guild cache over REST and
+sends RESUME instead of IDENTIFY, so Discord replays the events from the
+gap and no identify or guild chunking is needed. If Discord rejects the
+session, discord.py falls back to IDENTIFY on its own.
+
+discord.py has no public hooks for this, so the module wraps
+DiscordWebSocket.from_client and uses a few private attributes. Anything
+that goes wrong before connecting leaves the normal IDENTIFY in place.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+
+import aiohttp
+import discord
+import yarl
+from discord.gateway import DiscordWebSocket
+
+import cluster
+import state_store
+from metrics import REGISTRY
+
+logger = logging.getLogger('gateway_resume')
+
+GATEWAY_RESUME = os.getenv('GATEWAY_RESUME', 'true').lower() == 'true'
+
+# Discord only keeps a disconnected session resumable for a short while
+RESUME_MAX_AGE = float(os.getenv('GATEWAY_RESUME_MAX_AGE', '120'))
+
+# Time allowed for rebuilding the guild cache, and guilds fetched at once
+HYDRATE_TIMEOUT = float(os.getenv('GATEWAY_HYDRATE_TIMEOUT', '20'))
+HYDRATE_CONCURRENCY = 5
+
+# Closing with 1000 or 1001 ends the session; any other code keeps it
+RESUMABLE_CLOSE_CODE = 4000
+
+GUILDS_PAGE_SIZE = 200
+
+STATE_KEY = f'gateway_session:{cluster.CLUSTER_ID}'
+
+_resumes = REGISTRY.counter(
+    'gateway_resumes_total',
+    'Attempts to resume the previous process gateway session, by result',
+    ('result',)
+)
+
+# Shard ID -> saved session, taken by the first connection of that shard
+_pending = {}
+# Shards that sent RESUME and are waiting for RESUMED
+_resuming = set()
+# Guilds built from REST, announced once every shard has resumed
+_hydrated = []
+_installed = False
+
+def _websockets(bot):
+    """Get {shard ID: websocket} for the bot's connections; None for an unsharded bot"""
+    if isinstance(bot, discord.AutoShardedClient):
+        return {shard_id: info._parent.ws for shard_id, info in bot.shards.items()}
+    return {None: bot.ws} if bot.ws is not None else {}
+
+def _shard_ids(bot):
+    if isinstance(bot, discord.AutoShardedClient):
+        if bot.shard_count is None:
+            return None
+        return list(bot.shard_ids or range(bot.shard_count))
+    return [None]
+
+def _keep_session_on_close(ws):
+    # Client.close always closes with 1000, which would end the session
+    close = ws.close
+
+    async def close_keeping_session(code=RESUMABLE_CLOSE_CODE):
+        await close(code=RESUMABLE_CLOSE_CODE)
+
+    ws.close = close_keeping_session
+
+def _run_before_http_close(bot, step):
+    # Client.close closes the gateway, then the HTTP session; run the step in
+    # between, when no more events arrive but REST calls still work
+    close_http = bot.http.close
+
+    async def close_http_after_step():
+        try:
+            await step()
+        except Exception as e:
+            logger.error('Failed to run %s before closing HTTP: %s', getattr(step, '__name__', step), str(e) or type(e).__name__)
+        finally:
+            await close_http()
+
+    bot.http.close = close_http_after_step
+
+async def close(bot, before_http_close=None):
+    """Close the gateway and save the sessions for the next process to resume
+
+    before_http_close, if given, is awaited once the gateway is closed but
+    before the HTTP session is, e.g. to send messages for the last events
+    """
+    if before_http_close is not None:
+        _run_before_http_close(bot, before_http_close)
+    if not GATEWAY_RESUME:
+        await bot.close()
+        return
+
+    sockets = _websockets(bot)
+    for ws in sockets.values():
+        _keep_session_on_close(ws)
+    await bot.close()
+
+    # Read after closing, so events handled during the close are not replayed
+    shards = [
+        {'shard_id': shard_id, 'session_id': ws.session_id, 'sequence': ws.sequence, 'resume_url': str(ws.gateway)}
+        for shard_id, ws in sockets.items()
+        if ws.session_id and ws.sequence is not None
+    ]
+    if not shards:
+        return
+    await state_store.set_value(STATE_KEY, json.dumps({
+        'saved_at': time.time(),
+        'shard_count': bot.shard_count,
+        'shards': shards
+    }))
+    logger.info("Saved gateway session for %s shards to resume after restart", len(shards))
+
+async def _fetch_guild(bot, guild_id, semaphore):
+    async with semaphore:
+        data, channels, me = await asyncio.gather(
+            bot.http.get_guild(guild_id),
+            bot.http.get_all_guild_channels(guild_id),
+            bot.http.get_member(guild_id, bot.user.id)
+        )
+    # Shaped like the GUILD_CREATE payload the library normally builds guilds from
+    data['channels'] = channels
+    data['members'] = [me]
+    data.setdefault('member_count', data.get('approximate_member_count'))
+    return data
+
+async def _hydrate(bot, shard_ids):
+    """Build the guild cache from REST for the guilds on these shards"""
+    partial = []
+    after = None
+    while True:
+        page = await bot.http.get_guilds(GUILDS_PAGE_SIZE, after=after, with_counts=False)
+        partial.extend(page)
+        if len(page) < GUILDS_PAGE_SIZE:
+            break
+        after = page[-1]['id']
+
+    if shard_ids != [None]:
+        partial = [guild for guild in partial if (int(guild['id']) >> 22) % bot.shard_count in shard_ids]
+
+    semaphore = asyncio.Semaphore(HYDRATE_CONCURRENCY)
+    payloads = await asyncio.gather(*(_fetch_guild(bot, guild['id'], semaphore) for guild in partial))
+
+    # Only touch the cache once every guild was fetched
+    state = bot._connection
+    return [state._add_guild_from_data(data) for data in payloads]
+
+def _install():
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    original = DiscordWebSocket.from_client
+
+    async def from_client(cls, client, *, shard_id=None, **kwargs):
+        saved = _pending.pop(shard_id, None)
+        if saved is not None:
+            kwargs.update(
+                gateway=yarl.URL(saved['resume_url']),
+                session=saved['session_id'],
+                sequence=saved['sequence'],
+                resume=True
+            )
+            _resuming.add(shard_id)
+            logger.info("Resuming gateway session for shard %s at sequence %s", shard_id, saved['sequence'])
+        elif shard_id in _resuming and not kwargs.get('resume'):
+            # Discord rejected the session; the library identifies instead
+            _resuming.discard(shard_id)
+            _resumes.labels('invalidated').inc()
+            logger.warning("Gateway session for shard %s could not be resumed, identifying", shard_id)
+        return await original(client, shard_id=shard_id, **kwargs)
+
+    DiscordWebSocket.from_client = classmethod(from_client)
+
+def _on_resumed(bot, shard_id):
+    if shard_id not in _resuming:
+        return
+    _resuming.discard(shard_id)
+    _resumes.labels('resumed').inc()
+    if _resuming or _pending:
+        return
+
+    # RESUMED doesn't carry READY or GUILD_CREATE, so announce the cache here
+    guilds = [guild for guild in _hydrated if bot.get_guild(guild.id) is guild]
+    _hydrated.clear()
+    logger.info("Resumed gateway session with %s guilds from REST", len(guilds))
+    for guild in guilds:
+        bot.dispatch('guild_available', guild)
+    bot._connection.call_handlers('ready')
+    bot.dispatch('ready')
+
+async def prepare(bot):
+    """Take the saved session and arrange to resume it; returns whether RESUME will be sent
+
+    Call after login and before connecting, e.g. in setup_hook. A saved
+    session is used at most once.
+    """
+    if not GATEWAY_RESUME:
+        return False
+    text = await state_store.get_value(STATE_KEY)
+    if not text:
+        return False
+    await state_store.set_value(STATE_KEY, None)
+    saved = json.loads(text)
+
+    age = time.time() - saved['saved_at']
+    if age > RESUME_MAX_AGE:
+        _resumes.labels('stale').inc()
+        logger.info("Saved gateway session is %.0fs old, identifying", age)
+        return False
+
+    shard_ids = _shard_ids(bot)
+    if saved['shard_count'] != bot.shard_count or shard_ids != [shard['shard_id'] for shard in saved['shards']]:
+        _resumes.labels('mismatch').inc()
+        logger.info("Saved gateway session is for other shards, identifying")
+        return False
+
+    started = time.monotonic()
+    try:
+        guilds = await asyncio.wait_for(_hydrate(bot, shard_ids), HYDRATE_TIMEOUT)
+    except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+        _resumes.labels('hydrate_failed').inc()
+        logger.warning("Could not rebuild the guild cache, identifying: %s", str(e) or type(e).__name__)
+        return False
+    logger.info("Rebuilt %s guilds from REST in %.2fs", len(guilds), time.monotonic() - started)
+
+    _hydrated[:] = guilds
+    _pending.update({shard['shard_id']: shard for shard in saved['shards']})
+    _install()
+    if shard_ids == [None]:
+        async def on_resumed():
+            _on_resumed(bot, None)
+        bot.add_listener(on_resumed)
+    else:
+        async def on_shard_resumed(shard_id):
+            _on_resumed(bot, shard_id)
+        bot.add_listener(on_shard_resumed)
+    return True
@@ -0,0 +1,159 @@
+"""Coordinated shutdown of the bot process
+
+On SIGTERM (a supervisor restart, or Render stopping the service) the bot
+stops accepting commands and waits up to SHUTDOWN_GRACE seconds for
+commands and background jobs already running. It then runs the cleanup
+steps in the order they were added, and logs whatever it had to abandon.
+The drain and the cleanup share one deadline, SHUTDOWN_TIMEOUT, so the
+process finishes before whoever sent SIGTERM kills it.
+"""
+
+import os
+import time
+import signal
+import asyncio
+import logging
+
+from discord.ext import commands
+
+from metrics import REGISTRY
+
+logger = logging.getLogger('graceful_shutdown')
+
+# Seconds the whole shutdown may take, cleanup included. The supervisor sets
+# this from its own kill timeout; the default fits Render's 30 second window
+SHUTDOWN_TIMEOUT_ENV = 'BOT_SHUTDOWN_TIMEOUT'
+SHUTDOWN_TIMEOUT = float(os.getenv(SHUTDOWN_TIMEOUT_ENV, '25'))
+
+# Seconds of SHUTDOWN_TIMEOUT kept back from the drain for the cleanup steps
+CLEANUP_RESERVE = 8
+
+# Seconds in-flight work gets to finish; cut short to leave CLEANUP_RESERVE
+SHUTDOWN_GRACE = float(os.getenv('SHUTDOWN_GRACE', '15'))
+
+# Most seconds one cleanup step gets, within what is left of the timeout
+CLEANUP_STEP_TIMEOUT = 5
+
+# Seconds cancelled work gets to unwind
+CANCEL_TIMEOUT = 1
+
+_abandoned = REGISTRY.counter(
+    'shutdown_abandoned_total',
+    'Work cancelled because it was still running when the shutdown grace period ended',
+    ('kind',)
+)
+
+class ShuttingDown(commands.CheckFailure):
+    """A command arrived after shutdown started"""
+
+    def __init__(self):
+        super().__init__("The bot is restarting, please try again in a moment.")
+
+class GracefulShutdown:
+    """Tracks in-flight work and drains it when the process is asked to stop"""
+
+    def __init__(self, grace=SHUTDOWN_GRACE, timeout=SHUTDOWN_TIMEOUT):
+        self.timeout = timeout
+        self.grace = max(0.0, min(grace, timeout - CLEANUP_RESERVE))
+        self.draining = False
+
+        # Task running a command -> description
+        self._commands = {}
+        # (kind, function returning the running tasks of that kind)
+        self._job_sources = []
+        # (name, coroutine function), run in order
+        self._steps = []
+        self._task = None
+
+    def check(self, ctx):
+        """Global command check that turns commands away while draining"""
+        if self.draining:
+            raise ShuttingDown()
+        return True
+
+    def command_started(self, ctx):
+        task = asyncio.current_task()
+        if task is not None:
+            self._commands[task] = f'/{ctx.command.qualified_name} for {ctx.author} ({ctx.author.id})'
+            # After-invoke hooks don't run for slash commands that raise, so
+            # the task's end is what reliably drops the entry
+            task.add_done_callback(self._forget_command)
+
+    def command_finished(self, ctx):
+        self._commands.pop(asyncio.current_task(), None)
+
+    def _forget_command(self, task):
+        self._commands.pop(task, None)
+
+    def add_jobs(self, kind, source):
+        """Wait for the tasks `source()` returns before cleaning up"""
+        self._job_sources.append((kind, source))
+
+    def add_step(self, name, step):
+        """Run `await step()` during shutdown, after earlier steps"""
+        self._steps.append((name, step))
+
+    def install(self):
+        """Start the shutdown on SIGTERM or SIGINT"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.start, sig.name)
+
+    def start(self, reason):
+        if self._task is not None:
+            logger.info("Already shutting down, ignoring %s", reason)
+            return
+        self._task = asyncio.create_task(self._run(reason))
+
+    async def wait(self):
+        """Wait for a shutdown in progress to finish"""
+        if self._task is not None:
+            await self._task
+
+    def _in_flight(self):
+        work = {task: ('command', description) for task, description in self._commands.items()}
+        for kind, source in self._job_sources:
+            for task in source():
+                work[task] = (kind, task.get_name())
+        return {task: entry for task, entry in work.items() if not task.done()}
+
+    async def _run(self, reason):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        self.draining = True
+        work = self._in_flight()
+        logger.info("Received %s, draining %s in-flight tasks (up to %ss)", reason, len(work), self.grace)
+
+        abandoned = []
+        if work:
+            _, pending = await asyncio.wait(set(work), timeout=self.grace)
+            for task in pending:
+                kind, description = work[task]
+                abandoned.append(f'{kind}: {description}')
+                _abandoned.labels(kind).inc()
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending, timeout=CANCEL_TIMEOUT)
+
+        for name, step in self._steps:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                logger.error("Shutdown step '%s' skipped, out of time", name)
+                abandoned.append(f'cleanup: {name}')
+                _abandoned.labels('cleanup').inc()
+                continue
+            try:
+                await asyncio.wait_for(step(), min(CLEANUP_STEP_TIMEOUT, left))
+            except Exception as e:
+                logger.error("Shutdown step '%s' failed: %s", name, str(e) or type(e).__name__)
+                abandoned.append(f'cleanup: {name}')
+                _abandoned.labels('cleanup').inc()
+
+        elapsed = time.monotonic() - started
+        if abandoned:
+            logger.warning(
+                "Shutdown finished in %.1fs, abandoned %s:\n  %s",
+                elapsed, len(abandoned), '\n  '.join(abandoned)
+            )
+        else:
+            logger.info("Shutdown finished in %.1fs, all %s in-flight tasks completed", elapsed, len(work))
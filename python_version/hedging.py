@@ -0,0 +1,86 @@
+"""Hedged requests for idempotent reads"""
+
+import asyncio
+import logging
+
+from metrics import REGISTRY
+
+logger = logging.getLogger('hedging')
+
+_hedges_sent = REGISTRY.counter(
+    'hedged_requests_total',
+    'Duplicate requests sent after the hedge delay',
+    ('endpoint',)
+)
+_hedges_won = REGISTRY.counter(
+    'hedged_requests_won_total',
+    'Hedged requests that answered before the original',
+    ('endpoint',)
+)
+_hedges_denied = REGISTRY.counter(
+    'hedged_requests_denied_total',
+    'Hedges skipped because the hedge budget was exhausted',
+    ('endpoint',)
+)
+
+class HedgeBudget:
+    """Token budget capping hedges to a fraction of total requests
+
+    Every request deposits `fraction` of a token and every hedge spends one,
+    so hedges can never exceed `fraction` of traffic (plus the small
+    `burst` allowance).
+    """
+
+    def __init__(self, fraction=0.05, burst=5):
+        self.fraction = fraction
+        self.burst = burst
+        self._tokens = 0.0
+
+    def record_request(self):
+        """Credit the budget for one request"""
+        self._tokens = min(self.burst, self._tokens + self.fraction)
+
+    def try_acquire(self):
+        """Spend a token for a hedge if one is available"""
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+async def hedged(endpoint, fetch, delay, budget):
+    """Run `fetch`, sending a duplicate if it hasn't answered after `delay`
+
+    Returns whichever attempt answers first. If the first attempt to finish
+    fails while the other is still running, the other one is awaited instead.
+    """
+    budget.record_request()
+    primary = asyncio.ensure_future(fetch())
+    attempts = [primary]
+
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if done:
+            return primary.result()
+
+        if not budget.try_acquire():
+            _hedges_denied.labels(endpoint).inc()
+            return await primary
+
+        _hedges_sent.labels(endpoint).inc()
+        attempts.append(asyncio.ensure_future(fetch()))
+
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        _hedges_won.labels(endpoint).inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
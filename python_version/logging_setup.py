@@ -0,0 +1,154 @@
+"""Shared logging setup for the bot and the supervisor
+
+Loggers hand records to a bounded in-memory queue; a QueueListener thread
+formats and writes them, so a log call on the event loop never waits on
+stderr. When the queue is full, records are dropped and counted rather than
+blocking the caller.
+
+Environment:
+    LOG_LEVEL       root level (default INFO)
+    LOG_FORMAT      'text' (default) or 'json'
+    LOG_SAMPLING    per-logger sampling of records below WARNING, e.g.
+                    'discord.gateway=0.1,welcomer=0.5' keeps 10% and 50%
+    LOG_QUEUE_SIZE  records buffered before dropping (default 10000)
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from metrics import REGISTRY
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+_dropped = REGISTRY.counter(
+    'log_records_dropped_total',
+    'Log records dropped because the logging queue was full'
+)
+_sampled_out = REGISTRY.counter(
+    'log_records_sampled_out_total',
+    'Log records skipped by per-logger sampling',
+    ('logger',)
+)
+
+_listener = None
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in N records below WARNING for the configured loggers
+
+    Rules apply to the named logger and its children. Counting rather than
+    random sampling keeps the filter cheap and the output predictable.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return name, self.rates[name]
+            name = name.rpartition('.')[0]
+        return None, 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rule, rate = self._rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            _sampled_out.labels(rule).inc()
+            return False
+
+        every = round(1 / rate)
+        with self._lock:
+            count = self._counts.get(rule, 0)
+            self._counts[rule] = count + 1
+        if count % every == 0:
+            return True
+        _sampled_out.labels(rule).inc()
+        return False
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that defers formatting to the listener thread and never waits"""
+
+    def prepare(self, record):
+        # The stock handler formats the message here, on the caller's thread.
+        # Records stay in this process, so the listener can format them later
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped.inc()
+
+def parse_sampling(text):
+    """Parse 'name=rate,name=rate' into a dict"""
+    rates = {}
+    for part in (text or '').split(','):
+        name, _, rate = part.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+def setup_logging():
+    """Route all logging through the queue; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    rates = parse_sampling(os.getenv('LOG_SAMPLING'))
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
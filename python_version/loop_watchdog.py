@@ -0,0 +1,185 @@
+"""Event loop lag watchdog that finds the code blocking the loop
+
+A task on the loop ticks every TICK_INTERVAL. A helper thread watches the
+ticks; when one is late by more than the threshold, the loop is stuck in
+synchronous code, so the thread grabs the loop thread's stack right then.
+Stalls are tallied per call site into an offender leaderboard, and full
+stacks are logged at most once per REPORT_INTERVAL per site.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+
+import flight_recorder
+from metrics import REGISTRY
+
+logger = logging.getLogger('loop_watchdog')
+
+# Lag that counts as a stall, in seconds
+LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.25'))
+
+# Seconds between full stack reports for the same call site
+REPORT_INTERVAL = float(os.getenv('LOOP_STALL_REPORT_INTERVAL', '60'))
+
+TICK_INTERVAL = 0.1
+CHECK_INTERVAL = 0.05
+
+# Call sites tracked individually; the rest are counted as 'other'
+MAX_SITES = 50
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_loop_lag = REGISTRY.gauge(
+    'event_loop_lag_seconds',
+    'How late the last event loop tick woke up'
+)
+_loop_lag_histogram = REGISTRY.histogram(
+    'event_loop_lag_sample_seconds',
+    'Event loop lag samples',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+_stalls = REGISTRY.counter(
+    'event_loop_stalls_total',
+    'Event loop stalls over the threshold by blocking call site',
+    ('site',)
+)
+
+def _call_site(frame):
+    """Get (site, stack) for a frame, where site is the innermost bot frame
+
+    The innermost frame is usually inside a library (psycopg2, logging,
+    time.sleep); the bot frame that called into it is what needs fixing.
+    """
+    stack = traceback.extract_stack(frame)
+    site = stack[-1]
+    for entry in reversed(stack):
+        if entry.filename.startswith(PROJECT_DIR) and entry.filename != __file__:
+            site = entry
+            break
+    leaf = stack[-1]
+    name = f'{os.path.basename(site.filename)}:{site.lineno} in {site.name}'
+    if leaf is not site:
+        name += f' -> {leaf.name}'
+    return name, stack
+
+class StallSite:
+    """Tally of stalls at one call site"""
+
+    def __init__(self, site):
+        self.site = site
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_reported = 0.0
+
+    def to_dict(self):
+        return {
+            'site': self.site,
+            'count': self.count,
+            'total_seconds': round(self.total_seconds, 3),
+            'max_seconds': round(self.max_seconds, 3)
+        }
+
+class LoopWatchdog:
+    """Measures event loop lag and reports what blocked it"""
+
+    def __init__(self, threshold=LOOP_LAG_THRESHOLD, report_interval=REPORT_INTERVAL):
+        self.threshold = threshold
+        self.report_interval = report_interval
+
+        self._sites = {}
+        self._sites_lock = threading.Lock()
+        self._last_tick = time.monotonic()
+        self._loop_thread_id = None
+        self._tick_task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start watching the running loop"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._tick_task = asyncio.create_task(self._tick())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info("Loop watchdog started (threshold %ss)", self.threshold)
+
+    def stop(self):
+        self._stop.set()
+        if self._tick_task is not None:
+            self._tick_task.cancel()
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + TICK_INTERVAL
+            await asyncio.sleep(TICK_INTERVAL)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_tick = now
+            _loop_lag.set(lag)
+            _loop_lag_histogram.observe(lag)
+            flight_recorder.record(flight_recorder.LAG, lag)
+
+    def _watch(self):
+        stall_site = None
+        stall_seconds = 0.0
+
+        while not self._stop.wait(CHECK_INTERVAL):
+            behind = time.monotonic() - self._last_tick - TICK_INTERVAL
+            if behind >= self.threshold:
+                if stall_site is None:
+                    stall_site = self._capture()
+                stall_seconds = behind
+            elif stall_site is not None:
+                self._record(stall_site, stall_seconds)
+                stall_site = None
+
+    def _capture(self):
+        """Grab the loop thread's stack while it is still blocked"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        try:
+            site, stack = _call_site(frame)
+        finally:
+            del frame
+
+        with self._sites_lock:
+            entry = self._sites.get(site)
+            if entry is None:
+                if len(self._sites) >= MAX_SITES:
+                    site = 'other'
+                    entry = self._sites.setdefault(site, StallSite(site))
+                else:
+                    entry = self._sites[site] = StallSite(site)
+
+        now = time.monotonic()
+        if now - entry.last_reported >= self.report_interval:
+            entry.last_reported = now
+            logger.warning(
+                "Event loop blocked for over %ss at %s (seen %s times before)\n%s",
+                self.threshold, site, entry.count, ''.join(traceback.format_list(stack))
+            )
+        return entry
+
+    def _record(self, entry, seconds):
+        if entry is None:
+            return
+        with self._sites_lock:
+            entry.count += 1
+            entry.total_seconds += seconds
+            entry.max_seconds = max(entry.max_seconds, seconds)
+        _stalls.labels(entry.site).inc()
+
+    def leaderboard(self, limit=10):
+        """Get the call sites that blocked the loop longest in total"""
+        with self._sites_lock:
+            sites = [entry.to_dict() for entry in self._sites.values() if entry.count]
+        sites.sort(key=lambda entry: entry['total_seconds'], reverse=True)
+        return sites[:limit]
@@ -0,0 +1,135 @@
+"""Small LRU of recently seen members, fetched lazily on demand
+
+Run this module directly to benchmark member memory for a 50k-member
+guild under full caching versus the lazy LRU:
+
+    python python_version/member_cache.py [member_count]
+"""
+
+import os
+import sys
+import logging
+from collections import OrderedDict
+
+import discord
+
+from metrics import REGISTRY
+
+logger = logging.getLogger('member_cache')
+
+MEMBER_LRU_SIZE = int(os.getenv('MEMBER_LRU_SIZE', '1000'))
+
+_lookups = REGISTRY.counter(
+    'member_cache_lookups_total',
+    'Member lookups by where they were answered (cache, lru, fetch, missing)',
+    ('result',)
+)
+
+class MemberCache:
+    """Recently seen members keyed by (guild_id, user_id)"""
+
+    _members = OrderedDict()
+
+    @classmethod
+    def remember(cls, member):
+        """Keep a member we just saw, e.g. from a join or a command"""
+        key = (member.guild.id, member.id)
+        cls._members[key] = member
+        cls._members.move_to_end(key)
+        if len(cls._members) > MEMBER_LRU_SIZE:
+            cls._members.popitem(last=False)
+
+    @classmethod
+    def forget(cls, guild_id, user_id):
+        """Drop a member who left"""
+        cls._members.pop((guild_id, user_id), None)
+
+    @classmethod
+    async def get(cls, guild, user_id):
+        """Get a member from discord.py's cache, the LRU or the API, in that order"""
+        member = guild.get_member(user_id)
+        if member is not None:
+            _lookups.labels('cache').inc()
+            return member
+
+        key = (guild.id, user_id)
+        member = cls._members.get(key)
+        if member is not None:
+            cls._members.move_to_end(key)
+            _lookups.labels('lru').inc()
+            return member
+
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            _lookups.labels('missing').inc()
+            return None
+
+        _lookups.labels('fetch').inc()
+        cls.remember(member)
+        return member
+
+def _benchmark(member_count):
+    """Compare memory held by a fully cached guild with the lazy LRU"""
+    import gc
+    import tracemalloc
+
+    class _BenchState:
+        """Just enough of discord.py's ConnectionState to build members"""
+
+        def __init__(self):
+            self._users = {}
+
+        def store_user(self, data, *, cache=True):
+            user = discord.User(state=self, data=data)
+            self._users[user.id] = user
+            return user
+
+        def deref_user(self, user_id):
+            self._users.pop(user_id, None)
+
+    class _BenchGuild:
+        id = 1
+
+    def payload(index):
+        return {
+            'user': {
+                'id': str(10 ** 17 + index),
+                'username': f'recruit{index}',
+                'discriminator': '0',
+                'global_name': f'Recruit {index}',
+                'avatar': 'a' * 32
+            },
+            'roles': [str(10 ** 17 + 1), str(10 ** 17 + 2)],
+            'joined_at': '2024-01-01T00:00:00+00:00',
+            'nick': None,
+            'flags': 0
+        }
+
+    def measure(keep):
+        gc.collect()
+        tracemalloc.start()
+        state = _BenchState()
+        guild = _BenchGuild()
+        held = OrderedDict()
+        for index in range(member_count):
+            member = discord.Member(data=payload(index), guild=guild, state=state)
+            held[member.id] = member
+            if len(held) > keep:
+                _, evicted = held.popitem(last=False)
+                state._users.pop(evicted.id, None)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return current, peak
+
+    results = [
+        ('full member cache', measure(member_count)),
+        (f'lazy + LRU ({MEMBER_LRU_SIZE})', measure(MEMBER_LRU_SIZE))
+    ]
+
+    print(f'Members simulated: {member_count}')
+    for name, (current, peak) in results:
+        print(f'{name:<24} retained {current / 1024 / 1024:8.2f} MiB   peak {peak / 1024 / 1024:8.2f} MiB')
+
+if __name__ == '__main__':
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
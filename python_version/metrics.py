@@ -0,0 +1,280 @@
+"""In-process metrics registry shared by the bot and its helpers"""
+
+import bisect
+import threading
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Metric:
+    """Base class for a metric family with optional labels"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        """Get the child metric for a set of label values"""
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(value) for value in values)
+
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}')
+
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def _default(self):
+        """Get the unlabelled child"""
+        if self.labelnames:
+            raise ValueError(f'{self.name} requires labels {self.labelnames}')
+        return self.labels()
+
+    def samples(self):
+        """Get a snapshot of (label values, child) pairs"""
+        with self._lock:
+            return list(self._children.items())
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def get(self):
+        return self._value
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def get(self):
+        return self._value
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def get(self):
+        """Get (cumulative bucket counts, sum, count)"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative = []
+        running = 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, total, count
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside the matching bucket"""
+        cumulative, _, count = self.get()
+        if not count:
+            return None
+
+        target = q * count
+        lower_bound = 0.0
+        previous = 0
+        for index, running in enumerate(cumulative):
+            if running >= target:
+                if index >= len(self._buckets):
+                    # Overflow bucket has no upper bound, so report the last edge
+                    return self._buckets[-1]
+                upper_bound = self._buckets[index]
+                in_bucket = running - previous
+                fraction = (target - previous) / in_bucket if in_bucket else 1.0
+                return lower_bound + (upper_bound - lower_bound) * fraction
+            previous = running
+            lower_bound = self._buckets[index]
+        return self._buckets[-1]
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+class MetricsRegistry:
+    """Registry of named metric families"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f'Metric {name} already registered as {metric.kind}')
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Get or create a counter"""
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Get or create a gauge"""
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Get or create a histogram"""
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name):
+        """Get a registered metric by name"""
+        return self._metrics.get(name)
+
+    def collect(self):
+        """Get all registered metric families"""
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        """Get current values as plain data, keyed by metric name then label values
+
+        Counters and gauges map to numbers; histograms map to a dict with
+        cumulative bucket counts, sum, count and estimated p50/p95/p99.
+        """
+        result = {}
+        for metric in self.collect():
+            values = {}
+            for label_values, child in metric.samples():
+                if metric.kind == 'histogram':
+                    cumulative, total, count = child.get()
+                    values[label_values] = {
+                        'buckets': dict(zip(metric.buckets + (float('inf'),), cumulative)),
+                        'sum': total,
+                        'count': count,
+                        'p50': child.quantile(0.5),
+                        'p95': child.quantile(0.95),
+                        'p99': child.quantile(0.99)
+                    }
+                else:
+                    values[label_values] = child.get()
+            result[metric.name] = values
+        return result
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def render_text(registry):
+    """Render every metric in the Prometheus text exposition format
+
+    Only reads the registry under its per-metric locks, so it is safe to
+    call from a worker thread.
+    """
+    lines = []
+    for metric in registry.collect():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for label_values, child in metric.samples():
+            if metric.kind == 'histogram':
+                cumulative, total, count = child.get()
+                for bound, running in zip(metric.buckets + (float('inf'),), cumulative):
+                    labels = _format_labels(metric.labelnames, label_values, (('le', _format_value(bound)),))
+                    lines.append(f'{metric.name}_bucket{labels} {running}')
+                labels = _format_labels(metric.labelnames, label_values)
+                lines.append(f'{metric.name}_sum{labels} {_format_value(total)}')
+                lines.append(f'{metric.name}_count{labels} {count}')
+            else:
+                labels = _format_labels(metric.labelnames, label_values)
+                lines.append(f'{metric.name}{labels} {_format_value(child.get())}')
+    return '\n'.join(lines) + '\n'
+
+# Process-wide registry
+REGISTRY = MetricsRegistry()
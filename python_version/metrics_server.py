@@ -0,0 +1,137 @@
+"""HTTP endpoint serving bot metrics and health
+
+Serves /metrics in the Prometheus text format and /health for Render's
+health check, so the Python bot can run as a Render web service without
+the web-server.js keep-alive.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from aiohttp import web
+
+import startup_profiler
+from database import Database
+from metrics import REGISTRY, render_text
+
+logger = logging.getLogger('metrics_server')
+
+# METRICS_PORT wins over Render's PORT; with neither set no server is started
+METRICS_PORT = os.getenv('METRICS_PORT') or os.getenv('PORT')
+
+# Seconds between refreshes of the bot-level gauges
+STATS_INTERVAL = 15
+
+_gateway_latency = REGISTRY.gauge(
+    'discord_gateway_latency_seconds',
+    'Heartbeat latency per shard',
+    ('shard',)
+)
+_guilds = REGISTRY.gauge('discord_guilds', 'Guilds this process serves')
+_members = REGISTRY.gauge('discord_members', 'Members across guilds this process serves, from guild member counts')
+_cached_users = REGISTRY.gauge('discord_cached_users', 'Users held in the discord.py cache')
+_db_connections = REGISTRY.gauge(
+    'database_pool_connections',
+    'Database pool connections by state',
+    ('state',)
+)
+_uptime = REGISTRY.gauge('process_uptime_seconds', 'Seconds since the bot process started')
+
+# Set by the supervisor when it starts this process
+_supervisor_restarts = REGISTRY.gauge('supervisor_restarts', 'Times the supervisor restarted this cluster before this process')
+_supervisor_restarts.set(int(os.getenv('SUPERVISOR_RESTARTS', '0')))
+
+class MetricsServer:
+    """Serves metrics for one bot process"""
+
+    def __init__(self, bot, watchdog=None):
+        self.bot = bot
+        self.watchdog = watchdog
+        self.started_at = time.time()
+        self._runner = None
+        self._tasks = []
+
+    async def start(self, port):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_get('/healthz', self.handle_health)
+        app.router.add_get('/debug/stalls', self.handle_stalls)
+        app.router.add_get('/debug/startup', self.handle_startup)
+        app.router.add_get('/', self.handle_root)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '0.0.0.0', port).start()
+
+        self._tasks = [asyncio.create_task(self._refresh_stats())]
+        logger.info("Metrics server listening on port %s", port)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _refresh_stats(self):
+        # Gauges are refreshed on a timer rather than per scrape, so scrapes
+        # never walk the guild cache on the event loop
+        while True:
+            try:
+                self.update_gauges()
+            except Exception as e:
+                logger.warning("Error refreshing metrics: %s", e)
+            await asyncio.sleep(STATS_INTERVAL)
+
+    def update_gauges(self):
+        bot = self.bot
+        latencies = getattr(bot, 'latencies', None) or [(0, bot.latency)]
+        for shard_id, latency in latencies:
+            # discord.py reports inf/nan before the first heartbeat
+            if latency == latency and latency != float('inf'):
+                _gateway_latency.labels(shard_id).set(latency)
+
+        _guilds.set(len(bot.guilds))
+        _members.set(sum(guild.member_count or 0 for guild in bot.guilds))
+        _cached_users.set(len(bot.users))
+
+        in_use, idle, max_connections = Database.pool_stats()
+        _db_connections.labels('in_use').set(in_use)
+        _db_connections.labels('idle').set(idle)
+        _db_connections.labels('max').set(max_connections)
+
+        _uptime.set(time.time() - self.started_at)
+
+    async def handle_metrics(self, request):
+        # Formatting runs in a worker thread, off the event loop
+        body = await asyncio.to_thread(render_text, REGISTRY)
+        return web.Response(
+            body=body.encode(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
+
+    async def handle_health(self, request):
+        ready = self.bot.is_ready() and not self.bot.is_closed()
+        latency = self.bot.latency
+        return web.json_response({
+            'status': 'ok' if ready else 'starting',
+            'service': 'discord-bot',
+            'ready': ready,
+            'latency': latency if latency == latency and latency != float('inf') else None,
+            'guilds': len(self.bot.guilds),
+            'uptime': round(time.time() - self.started_at)
+        }, status=200 if ready else 503)
+
+    async def handle_stalls(self, request):
+        # Offender leaderboard from the loop watchdog
+        sites = self.watchdog.leaderboard(int(request.query.get('limit', '10'))) if self.watchdog else []
+        return web.json_response({'sites': sites})
+
+    async def handle_startup(self, request):
+        return web.json_response(startup_profiler.report())
+
+    async def handle_root(self, request):
+        return web.Response(text='Discord bot is running')
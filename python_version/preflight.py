@@ -0,0 +1,180 @@
+"""Startup checks run by the supervisor before any bot process starts
+
+Every check runs concurrently under one time budget. A check that fails
+because of configuration (bad token, expired cookie, wrong group) stops the
+deployment with a specific reason instead of letting the bot crash-loop.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+import aiohttp
+import psycopg2
+
+from credential_pool import cookies_from_env
+
+logger = logging.getLogger('preflight')
+
+# Total seconds the checks may take together
+PREFLIGHT_BUDGET = float(os.getenv('PREFLIGHT_BUDGET', '15'))
+
+DISCORD_API = 'https://discord.com/api/v10'
+ROBLOX_USERS_API = 'https://users.roblox.com/v1'
+ROBLOX_GROUPS_API = 'https://groups.roblox.com/v1'
+
+class PreflightError(Exception):
+    """A check failed
+
+    `fatal` is True when retrying can't help and the configuration must be
+    fixed, and False for outages that may pass.
+    """
+
+    def __init__(self, message, fatal=True):
+        super().__init__(message)
+        self.fatal = fatal
+
+class CheckResult:
+    def __init__(self, name, ok, seconds, detail, fatal=False):
+        self.name = name
+        self.ok = ok
+        self.seconds = seconds
+        self.detail = detail
+        self.fatal = fatal
+
+async def _get_json(session, url, **kwargs):
+    async with session.get(url, **kwargs) as response:
+        if response.status >= 500 or response.status == 429:
+            raise PreflightError(f'{url} returned {response.status}', fatal=False)
+        try:
+            return response.status, await response.json(content_type=None)
+        except ValueError as e:
+            # e.g. an HTML error page from a proxy in front of the API
+            raise PreflightError(f'{url} returned {response.status} with a body that is not JSON', fatal=False) from e
+
+async def check_discord(session):
+    """Validate the bot token"""
+    status, data = await _get_json(
+        session, f'{DISCORD_API}/users/@me',
+        headers={'Authorization': f"Bot {os.getenv('DISCORD_TOKEN')}"}
+    )
+    if status == 401:
+        raise PreflightError('DISCORD_TOKEN was rejected by Discord')
+    if status != 200:
+        raise PreflightError(f'Discord returned {status} for the bot user')
+
+    application_id = os.getenv('APPLICATION_ID')
+    if application_id and application_id != data['id']:
+        raise PreflightError(f"APPLICATION_ID {application_id} doesn't match the token's bot ({data['id']})")
+    return f"bot user {data['username']} ({data['id']})"
+
+def _check_database():
+    try:
+        connection = psycopg2.connect(os.getenv('DATABASE_URL'), connect_timeout=5)
+    except psycopg2.OperationalError as e:
+        message = str(e).strip().splitlines()[0] if str(e).strip() else 'connection failed'
+        fatal = any(text in message for text in ('authentication failed', 'does not exist', 'invalid'))
+        raise PreflightError(f'DATABASE_URL: {message}', fatal=fatal)
+    except psycopg2.ProgrammingError as e:
+        raise PreflightError(f'DATABASE_URL is not a valid connection string: {e}')
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW server_version')
+            version = cursor.fetchone()[0]
+    finally:
+        connection.close()
+    return f'PostgreSQL {version}'
+
+async def check_database(session):
+    """Open and close one database connection"""
+    return await asyncio.to_thread(_check_database)
+
+async def check_roblox_auth(session):
+    """Authenticate every ranking cookie; at least one must work"""
+    async def authenticate(cookie):
+        status, data = await _get_json(
+            session, f'{ROBLOX_USERS_API}/users/authenticated',
+            cookies={'.ROBLOSECURITY': cookie}
+        )
+        return data['name'] if status == 200 else None
+
+    cookies = cookies_from_env()
+    names = await asyncio.gather(*(authenticate(cookie) for cookie in cookies))
+    valid = [name for name in names if name]
+    if not valid:
+        raise PreflightError('ROBLOX_COOKIE is expired or invalid')
+    if len(valid) < len(cookies):
+        logger.warning("%s of %s Roblox cookies were rejected", len(cookies) - len(valid), len(cookies))
+    return f"logged in as {', '.join(valid)}"
+
+async def check_roblox_group(session):
+    """Resolve ROBLOX_GROUP_ID"""
+    group_id = os.getenv('ROBLOX_GROUP_ID', '')
+    if not group_id.isdigit():
+        raise PreflightError(f'ROBLOX_GROUP_ID must be a number, got {group_id!r}')
+
+    status, data = await _get_json(session, f'{ROBLOX_GROUPS_API}/groups/{group_id}')
+    if status != 200:
+        raise PreflightError(f'ROBLOX_GROUP_ID {group_id} was not found on Roblox')
+    return f"group {data['name']}"
+
+CHECKS = {
+    'discord': check_discord,
+    'database': check_database,
+    'roblox_auth': check_roblox_auth,
+    'roblox_group': check_roblox_group
+}
+
+async def _timed(name, check, session):
+    started = time.monotonic()
+    try:
+        detail = await check(session)
+        return CheckResult(name, True, time.monotonic() - started, detail)
+    except PreflightError as e:
+        return CheckResult(name, False, time.monotonic() - started, str(e), e.fatal)
+    except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+        return CheckResult(name, False, time.monotonic() - started, f'{type(e).__name__}: {e}')
+
+async def run_preflight(budget=PREFLIGHT_BUDGET, on_result=None):
+    """Run every check concurrently and return their results
+
+    Stops early when a check fails fatally; checks still running at that
+    point, or when the budget runs out, are reported as not finished.
+    `on_result` is called with each CheckResult as its check finishes.
+    """
+    started = time.monotonic()
+    results = {}
+    timeout = aiohttp.ClientTimeout(total=budget)
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        tasks = {asyncio.create_task(_timed(name, check, session)): name for name, check in CHECKS.items()}
+        pending = set(tasks)
+        while pending:
+            left = budget - (time.monotonic() - started)
+            if left <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                results[result.name] = result
+                if on_result is not None:
+                    on_result(result)
+            if any(result.fatal for result in results.values()):
+                break
+
+        fatal = any(result.fatal for result in results.values())
+        for task in pending:
+            task.cancel()
+            name = tasks[task]
+            reason = 'cancelled after a fatal failure' if fatal else f'did not finish within {budget:.0f}s'
+            results[name] = CheckResult(name, False, time.monotonic() - started, reason)
+
+    elapsed = time.monotonic() - started
+    logger.info("Preflight finished in %.2fs (budget %.0fs)", elapsed, budget)
+    for name in CHECKS:
+        result = results[name]
+        log = logger.info if result.ok else logger.error
+        log("  %-12s %-4s %6.2fs  %s", name, 'OK' if result.ok else 'FAIL', result.seconds, result.detail)
+    return [results[name] for name in CHECKS]
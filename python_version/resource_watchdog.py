@@ -0,0 +1,200 @@
+"""Resource watchdog the supervisor runs over each bot process
+
+Samples the child's RSS, CPU time, open file descriptors and threads from
+/proc at a low rate and recycles the process before it degrades: on a hard
+limit, on sustained CPU spin, or when memory grows steadily enough to hit
+the limit soon. The last samples are kept in a ring buffer and saved with
+every recycle so it can be explained afterwards.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque, namedtuple
+
+from metrics import REGISTRY
+from state_store import STATE_DIR
+
+logger = logging.getLogger('resource_watchdog')
+
+RESOURCE_SAMPLE_INTERVAL = float(os.getenv('RESOURCE_SAMPLE_INTERVAL', '30'))
+
+# Hard limits; Render's free instances have 512 MB
+RSS_LIMIT_MB = float(os.getenv('RSS_LIMIT_MB', '450'))
+FD_LIMIT = int(os.getenv('FD_LIMIT', '1000'))
+THREAD_LIMIT = int(os.getenv('THREAD_LIMIT', '200'))
+
+# CPU at or above this percentage for this many samples in a row is a spin
+CPU_SPIN_PERCENT = float(os.getenv('CPU_SPIN_PERCENT', '95'))
+CPU_SPIN_SAMPLES = int(os.getenv('CPU_SPIN_SAMPLES', '4'))
+
+# Recycle when the RSS trend reaches the limit within this many seconds
+LEAK_HORIZON = float(os.getenv('LEAK_HORIZON', '1800'))
+
+# Samples used for the trend, and how steady the growth must be
+TREND_SAMPLES = 20
+TREND_MIN_R2 = 0.8
+
+# Samples kept in memory, and recycle reports kept on disk
+HISTORY_SIZE = 120
+MAX_RECYCLE_REPORTS = 10
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+ResourceSample = namedtuple('ResourceSample', 'time rss_bytes cpu_seconds cpu_percent fds threads')
+
+_rss = REGISTRY.gauge('child_rss_bytes', 'Resident memory of the bot process', ('cluster',))
+_cpu = REGISTRY.gauge('child_cpu_percent', 'CPU use of the bot process over the last sample', ('cluster',))
+_fds = REGISTRY.gauge('child_open_fds', 'Open file descriptors of the bot process', ('cluster',))
+_threads = REGISTRY.gauge('child_threads', 'Threads in the bot process', ('cluster',))
+_recycles = REGISTRY.counter(
+    'child_recycles_total',
+    'Bot processes recycled by the resource watchdog',
+    ('cluster', 'reason')
+)
+
+def proc_available():
+    return os.path.isdir('/proc/self')
+
+def read_sample(pid, previous=None):
+    """Read one ResourceSample for a process from /proc"""
+    now = time.monotonic()
+    with open(f'/proc/{pid}/stat') as f:
+        # The command name can contain spaces, so split after its closing paren
+        fields = f.read().rsplit(')', 1)[1].split()
+    # utime and stime are fields 14 and 15; the split starts at field 3
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    threads = int(fields[17])
+
+    with open(f'/proc/{pid}/statm') as f:
+        rss_bytes = int(f.read().split()[1]) * PAGE_SIZE
+
+    fds = len(os.listdir(f'/proc/{pid}/fd'))
+
+    cpu_percent = 0.0
+    if previous is not None and now > previous.time:
+        cpu_percent = 100.0 * (cpu_seconds - previous.cpu_seconds) / (now - previous.time)
+
+    return ResourceSample(now, rss_bytes, cpu_seconds, cpu_percent, fds, threads)
+
+def rss_trend(samples):
+    """Get (bytes per second, r squared) of a least-squares fit over RSS"""
+    if len(samples) < 3:
+        return 0.0, 0.0
+
+    times = [sample.time for sample in samples]
+    values = [sample.rss_bytes for sample in samples]
+    mean_t = sum(times) / len(times)
+    mean_v = sum(values) / len(values)
+    var_t = sum((t - mean_t) ** 2 for t in times)
+    var_v = sum((v - mean_v) ** 2 for v in values)
+    if not var_t or not var_v:
+        return 0.0, 0.0
+
+    covariance = sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values))
+    slope = covariance / var_t
+    r2 = covariance ** 2 / (var_t * var_v)
+    return slope, r2
+
+class ResourceWatchdog:
+    """Watches one bot process and decides when to recycle it"""
+
+    def __init__(self, cluster_id, interval=RESOURCE_SAMPLE_INTERVAL):
+        self.cluster_id = str(cluster_id)
+        self.interval = interval
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.recycle_reason = None
+        self._spinning = 0
+
+    def check(self, sample):
+        """Get (kind, description) of the reason to recycle after a new sample, or None"""
+        self.history.append(sample)
+        rss_limit = RSS_LIMIT_MB * 1024 * 1024
+
+        if sample.rss_bytes >= rss_limit:
+            return 'rss_limit', f'rss {sample.rss_bytes / 1048576:.0f} MB over {RSS_LIMIT_MB:.0f} MB limit'
+        if sample.fds >= FD_LIMIT:
+            return 'fd_limit', f'{sample.fds} open file descriptors over {FD_LIMIT} limit'
+        if sample.threads >= THREAD_LIMIT:
+            return 'thread_limit', f'{sample.threads} threads over {THREAD_LIMIT} limit'
+
+        self._spinning = self._spinning + 1 if sample.cpu_percent >= CPU_SPIN_PERCENT else 0
+        if self._spinning >= CPU_SPIN_SAMPLES:
+            return 'cpu_spin', f'cpu at {sample.cpu_percent:.0f}% for {self._spinning} samples'
+
+        recent = list(self.history)[-TREND_SAMPLES:]
+        if len(recent) == TREND_SAMPLES:
+            slope, r2 = rss_trend(recent)
+            if slope > 0 and r2 >= TREND_MIN_R2:
+                seconds_to_limit = (rss_limit - sample.rss_bytes) / slope
+                if seconds_to_limit <= LEAK_HORIZON:
+                    description = (f'rss growing {slope * 3600 / 1048576:.1f} MB/h (r2 {r2:.2f}), '
+                                   f'limit in {seconds_to_limit / 60:.0f} min')
+                    return 'rss_trend', description
+        return None
+
+    def _update_gauges(self, sample):
+        _rss.labels(self.cluster_id).set(sample.rss_bytes)
+        _cpu.labels(self.cluster_id).set(sample.cpu_percent)
+        _fds.labels(self.cluster_id).set(sample.fds)
+        _threads.labels(self.cluster_id).set(sample.threads)
+
+    async def watch(self, process, recycle):
+        """Sample `process` until it exits; await `recycle()` when a limit is hit"""
+        if not proc_available():
+            logger.info("No /proc on this platform, resource watchdog disabled")
+            return
+
+        previous = None
+        while process.returncode is None:
+            await asyncio.sleep(self.interval)
+            try:
+                sample = read_sample(process.pid, previous)
+            except (OSError, IndexError, ValueError):
+                # Exited between checks
+                return
+            previous = sample
+            self._update_gauges(sample)
+
+            reason = self.check(sample)
+            if reason is not None:
+                kind, description = reason
+                self.recycle_reason = kind
+                _recycles.labels(self.cluster_id, kind).inc()
+                logger.warning("Recycling cluster %s (PID %s): %s", self.cluster_id, process.pid, description)
+                await asyncio.to_thread(self.save_report, process.pid, description)
+                await recycle()
+                return
+
+    def save_report(self, pid, reason):
+        """Write the sample history behind a recycle to the state directory"""
+        os.makedirs(STATE_DIR, exist_ok=True)
+        now = time.time()
+        report = {
+            'cluster_id': self.cluster_id,
+            'pid': pid,
+            'reason': reason,
+            'time': now,
+            'samples': [
+                {
+                    'age': round(self.history[-1].time - sample.time, 1),
+                    'rss_mb': round(sample.rss_bytes / 1048576, 1),
+                    'cpu_percent': round(sample.cpu_percent, 1),
+                    'fds': sample.fds,
+                    'threads': sample.threads
+                }
+                for sample in self.history
+            ]
+        }
+        path = os.path.join(STATE_DIR, f'recycle-{self.cluster_id}-{int(now)}.json')
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        # Keep only the newest reports
+        prefix = f'recycle-{self.cluster_id}-'
+        reports = sorted(name for name in os.listdir(STATE_DIR) if name.startswith(prefix))
+        for name in reports[:-MAX_RECYCLE_REPORTS]:
+            os.remove(os.path.join(STATE_DIR, name))
@@ -0,0 +1,149 @@
+"""When and how soon the supervisor restarts a bot process
+
+Exit codes are shared with bot.py, which exits with EXIT_CONFIG_ERROR when
+retrying can't help (bad token, missing privileged intents).
+"""
+
+import os
+import random
+import signal
+import logging
+from collections import deque
+
+from metrics import REGISTRY
+
+logger = logging.getLogger('restart_policy')
+
+# Exit codes
+EXIT_OK = 0
+EXIT_CONFIG_ERROR = 78  # EX_CONFIG from sysexits.h
+
+# Decisions
+RESTART = 'restart'
+GIVE_UP = 'give_up'
+
+# Reasons
+CLEAN_EXIT = 'clean_exit'
+CRASH = 'crash'
+KILLED = 'killed'
+CONFIG_ERROR = 'config_error'
+CRASH_LOOP = 'crash_loop'
+
+RESTART_BASE_DELAY = float(os.getenv('RESTART_BASE_DELAY', '1'))
+RESTART_MAX_DELAY = float(os.getenv('RESTART_MAX_DELAY', '300'))
+
+# Most doublings of the base delay, already far past RESTART_MAX_DELAY; an
+# uncapped exponent overflows a float after 1024 failures in a row
+MAX_BACKOFF_EXPONENT = 30
+
+# A process that stays up this long resets the backoff
+RESTART_STABLE_AFTER = float(os.getenv('RESTART_STABLE_AFTER', '600'))
+
+# This many crashes within the window counts as a crash loop
+CRASH_LOOP_THRESHOLD = int(os.getenv('CRASH_LOOP_THRESHOLD', '5'))
+CRASH_LOOP_WINDOW = float(os.getenv('CRASH_LOOP_WINDOW', '300'))
+CRASH_LOOP_COOLDOWN = float(os.getenv('CRASH_LOOP_COOLDOWN', '900'))
+
+_restarts = REGISTRY.counter(
+    'supervisor_restarts_total',
+    'Bot process restarts by reason',
+    ('cluster', 'reason')
+)
+_last_exit_code = REGISTRY.gauge(
+    'supervisor_last_exit_code',
+    'Exit code of the last bot process',
+    ('cluster',)
+)
+_consecutive_failures = REGISTRY.gauge(
+    'supervisor_consecutive_failures',
+    'Failures since the bot process last ran stably',
+    ('cluster',)
+)
+
+def classify_exit(exit_code):
+    """Get the reason for an exit code"""
+    if exit_code == EXIT_OK:
+        return CLEAN_EXIT
+    if exit_code == EXIT_CONFIG_ERROR:
+        return CONFIG_ERROR
+    if exit_code in (-signal.SIGKILL, -signal.SIGTERM, 128 + signal.SIGKILL, 128 + signal.SIGTERM):
+        # Usually the OOM killer or the platform, not a bug in startup
+        return KILLED
+    return CRASH
+
+class RestartPolicy:
+    """Exponential backoff with jitter, reset by stable uptime
+
+    Each failure doubles the delay up to `max_delay`; the delay is drawn from
+    the top half of that range so restarts of several clusters spread out.
+    Too many crashes within `crash_loop_window` escalate to a long cooldown.
+    Config errors are never retried.
+    """
+
+    def __init__(self, cluster_id=0, base_delay=RESTART_BASE_DELAY, max_delay=RESTART_MAX_DELAY,
+                 stable_after=RESTART_STABLE_AFTER, crash_loop_threshold=CRASH_LOOP_THRESHOLD,
+                 crash_loop_window=CRASH_LOOP_WINDOW, crash_loop_cooldown=CRASH_LOOP_COOLDOWN):
+        self.cluster_id = str(cluster_id)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stable_after = stable_after
+        self.crash_loop_threshold = crash_loop_threshold
+        self.crash_loop_window = crash_loop_window
+        self.crash_loop_cooldown = crash_loop_cooldown
+
+        self.failures = 0
+        self.restarts = 0
+        self.last_exit_code = None
+        self._started_at = None
+        self._crashes = deque()
+
+    def record_start(self, now):
+        self._started_at = now
+
+    def next_action(self, exit_code, now):
+        """Decide what to do after the process exited
+
+        Returns (decision, delay in seconds, reason).
+        """
+        reason = classify_exit(exit_code)
+        self.last_exit_code = exit_code
+        _last_exit_code.labels(self.cluster_id).set(exit_code)
+
+        if reason == CONFIG_ERROR:
+            _restarts.labels(self.cluster_id, reason).inc()
+            return GIVE_UP, 0.0, reason
+
+        uptime = now - self._started_at if self._started_at is not None else 0.0
+        if uptime >= self.stable_after:
+            self.failures = 0
+            self._crashes.clear()
+        else:
+            self._crashes.append(now)
+        while self._crashes and now - self._crashes[0] > self.crash_loop_window:
+            self._crashes.popleft()
+
+        if len(self._crashes) >= self.crash_loop_threshold:
+            self._crashes.clear()
+            reason = CRASH_LOOP
+            delay = self.crash_loop_cooldown
+        else:
+            ceiling = min(self.max_delay, self.base_delay * (2 ** min(self.failures, MAX_BACKOFF_EXPONENT)))
+            delay = random.uniform(ceiling / 2, ceiling)
+
+        self.failures += 1
+        self.restarts += 1
+        _restarts.labels(self.cluster_id, reason).inc()
+        _consecutive_failures.labels(self.cluster_id).set(self.failures)
+        return RESTART, delay, reason
+
+    def record_recycle(self, reason):
+        """Count a deliberate recycle; it restarts at once and isn't a failure"""
+        self.restarts += 1
+        _restarts.labels(self.cluster_id, f'recycled_{reason}').inc()
+
+    def child_env(self):
+        """Environment that lets the bot report restart counts on its metrics endpoint"""
+        env = {'SUPERVISOR_RESTARTS': str(self.restarts)}
+        if self.last_exit_code is not None:
+            env['SUPERVISOR_LAST_EXIT_CODE'] = str(self.last_exit_code)
+        return env
@@ -1,28 +1,112 @@
 import os
+import json
+import time
+import hashlib
 import logging
 import aiohttp
 import asyncio
-from ro_py.client import Client
+from collections import OrderedDict
+
+import deadline
+import roblox_metrics
+import startup_profiler
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from credential_pool import AccountUnavailable, CredentialPool, NoHealthyAccountError, cookies_from_env
+from deadline import DeadlineExceeded
+from hedging import HedgeBudget, hedged
+from metrics import REGISTRY
+from roblox_metrics import classify_error
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('roblox_api')
 
+# Per-call timeout for Roblox requests, in seconds
+ROBLOX_TIMEOUT = float(os.getenv('ROBLOX_TIMEOUT', '10'))
+
+# Circuit breaker tuning shared by every endpoint family
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('ROBLOX_BREAKER_THRESHOLD', '5'))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv('ROBLOX_BREAKER_RECOVERY', '30'))
+
+# Error categories that say Roblox is unhealthy and count against a breaker,
+# and ones that show it answered normally to a bad request (e.g. a mistyped
+# username). Anything else leaves the breaker as it was
+BREAKER_FAILURES = (roblox_metrics.TIMEOUT, roblox_metrics.SERVER, roblox_metrics.RATE_LIMITED)
+BREAKER_ANSWERED = (roblox_metrics.NOT_FOUND, roblox_metrics.CLIENT, roblox_metrics.PERMISSION, roblox_metrics.AUTH)
+
+# How long a cached read may be served while Roblox is unavailable
+STALE_TTL = float(os.getenv('ROBLOX_STALE_TTL', '3600'))
+STALE_CACHE_SIZE = 2048
+
+# Optional hedging for idempotent reads
+HEDGING_ENABLED = os.getenv('ROBLOX_HEDGING', 'false').lower() == 'true'
+HEDGE_BUDGET_FRACTION = float(os.getenv('ROBLOX_HEDGE_BUDGET', '0.05'))
+# Hedge delay used until an endpoint has enough samples for a p95
+HEDGE_DEFAULT_DELAY = float(os.getenv('ROBLOX_HEDGE_DELAY', '0.5'))
+HEDGE_MIN_SAMPLES = 20
+
+# Public Roblox web APIs used by the refresh paths
+GROUPS_API = 'https://groups.roblox.com'
+USERS_API = 'https://users.roblox.com'
+
+_revalidations = REGISTRY.counter(
+    'roblox_revalidations_total',
+    'Refresh requests by outcome (modified, not_modified, unchanged)',
+    ('endpoint', 'result')
+)
+_bytes_saved = REGISTRY.counter(
+    'roblox_revalidation_bytes_saved_total',
+    'Response bytes not downloaded thanks to 304 Not Modified',
+    ('endpoint',)
+)
+
+def _make_client(cookie):
+    # ro_py and its dependencies take a while to import, so load them with
+    # the first client rather than with this module
+    from ro_py.client import Client
+    client = Client()
+    client.set_cookie(cookie)
+    roblox_metrics.instrument_client(client)
+    return client
+
+def _make_breaker(family):
+    return CircuitBreaker(
+        f'roblox_{family}',
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout=BREAKER_RECOVERY_TIMEOUT
+    )
+
 class RobloxAPI:
     """Roblox API handler class"""
     
     _client = None
     _group_id = None
+    _pool = None
+    _session = None
+
+    # One breaker per endpoint family so a users.roblox.com outage
+    # doesn't block group reads and vice versa
+    _breakers = {
+        'users': _make_breaker('users'),
+        'avatars': _make_breaker('avatars'),
+        'groups': _make_breaker('groups')
+    }
+
+    # Last good result per read, served with a staleness flag during outages
+    _stale_cache = OrderedDict()
+
+    _hedge_budget = HedgeBudget(HEDGE_BUDGET_FRACTION)
+
+    # Validators and fingerprints of the last response per refresh URL
+    _validators = OrderedDict()
     
     @classmethod
     async def initialize(cls):
         """Initialize Roblox client"""
         try:
-            # Get Roblox cookie and group ID from environment
-            cookie = os.getenv('ROBLOX_COOKIE')
+            # Get Roblox cookies and group ID from environment
+            cookies = cookies_from_env()
             cls._group_id = os.getenv('ROBLOX_GROUP_ID')
             
-            if not cookie:
+            if not cookies:
                 logger.error("ROBLOX_COOKIE environment variable not set")
                 return False
                 
@@ -30,33 +114,226 @@ class RobloxAPI:
                 logger.error("ROBLOX_GROUP_ID environment variable not set")
                 return False
             
-            # Create Roblox client
-            cls._client = Client()
-            cls._client.set_cookie(cookie)
-            
-            # Get current user to check if authentication worked
-            try:
-                current_user = await cls._client.get_authenticated_user()
-                
-                if current_user:
-                    logger.info(f"Logged into Roblox as {current_user.name} (ID: {current_user.id})")
-                    logger.info("Successfully authenticated with Roblox")
-                    return True
-                else:
-                    logger.error("Failed to authenticate with Roblox")
-                    return False
-            except Exception as auth_error:
-                logger.error(f"Authentication error: {auth_error}")
+            # Create one Roblox client per ranking account and check each cookie
+            cls._pool = CredentialPool(cookies, _make_client)
+            with startup_profiler.phase('roblox_auth'):
+                authenticated = await cls._pool.initialize()
+            if not authenticated:
+                logger.error("Failed to authenticate with Roblox")
                 return False
+            
+            # Reads go through the first healthy account
+            cls._client = cls._pool.primary().client
+            logger.info("Successfully authenticated with Roblox")
+            return True
                 
         except Exception as e:
-            logger.error(f"Error initializing Roblox API: {e}")
+            logger.error("Error initializing Roblox API: %s", e)
             return False
     
+    @classmethod
+    async def _call(cls, family, endpoint, fetch, hedge=False):
+        """Run a Roblox call through its endpoint family's circuit breaker
+        
+        The call is bounded by ROBLOX_TIMEOUT and by the caller's deadline,
+        whichever is sooner. Only timeouts, server errors and rate limits
+        count against the breaker, and not timeouts caused by a tight caller
+        deadline.
+        """
+        breaker = cls._breakers[family]
+        started = time.monotonic()
+        try:
+            breaker.check()
+        except CircuitOpenError as e:
+            roblox_metrics.record_call(endpoint, started, e)
+            raise
+        
+        try:
+            timeout, capped = deadline.timeout_for(ROBLOX_TIMEOUT)
+        except DeadlineExceeded as e:
+            # Out of time before sending anything; says nothing about Roblox
+            roblox_metrics.record_call(endpoint, started, e)
+            breaker.record_abandoned()
+            raise
+        
+        if hedge and HEDGING_ENABLED:
+            call = hedged(endpoint, fetch, cls._hedge_delay(endpoint), cls._hedge_budget)
+        else:
+            call = fetch()
+        
+        try:
+            result = await asyncio.wait_for(call, timeout)
+        except DeadlineExceeded as e:
+            # Raised inside the call, e.g. waiting for a ranking account
+            roblox_metrics.record_call(endpoint, started, e)
+            breaker.record_abandoned()
+            raise
+        except asyncio.TimeoutError as e:
+            if capped:
+                error = DeadlineExceeded(f'{endpoint} did not finish before the command deadline')
+                roblox_metrics.record_call(endpoint, started, error)
+                breaker.record_abandoned()
+                raise error from e
+            roblox_metrics.record_call(endpoint, started, e)
+            breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            breaker.record_abandoned()
+            raise
+        except AccountUnavailable as e:
+            # The account was at fault, which says nothing about Roblox's health
+            roblox_metrics.record_call(endpoint, started, e.__cause__ or e)
+            breaker.record_abandoned()
+            raise
+        except Exception as e:
+            category = roblox_metrics.record_call(endpoint, started, e)
+            if category in BREAKER_FAILURES:
+                breaker.record_failure()
+            elif category in BREAKER_ANSWERED:
+                # Roblox answered; the request itself was wrong
+                breaker.record_success()
+            else:
+                breaker.record_abandoned()
+            raise
+        
+        roblox_metrics.record_call(endpoint, started)
+        breaker.record_success()
+        return result
+    
+    @classmethod
+    def _hedge_delay(cls, endpoint):
+        """Delay before hedging a read, derived from the endpoint's p95 latency"""
+        child = roblox_metrics.call_latency.labels(endpoint)
+        _, _, count = child.get()
+        if count < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(0.05, child.quantile(0.95))
+    
+    @classmethod
+    async def _read(cls, family, key, fetch):
+        """Run an idempotent read, serving stale cached data if Roblox is unavailable"""
+        try:
+            result = await cls._call(family, key[0], fetch, hedge=True)
+        except Exception as e:
+            stale = cls._get_stale(key)
+            if stale is None:
+                raise
+            
+            logger.warning("Serving stale %s data because Roblox call failed: %s", key[0], e)
+            return stale
+        
+        cls._store(key, result)
+        return result
+    
+    @classmethod
+    def _store(cls, key, result):
+        """Remember a successful read for stale fallback"""
+        if result is None or (isinstance(result, dict) and result.get('success') is False):
+            return
+        
+        cls._stale_cache[key] = (time.monotonic(), result)
+        cls._stale_cache.move_to_end(key)
+        while len(cls._stale_cache) > STALE_CACHE_SIZE:
+            cls._stale_cache.popitem(last=False)
+    
+    @classmethod
+    def _get_stale(cls, key):
+        """Get a cached read, flagged as stale, if it is still usable"""
+        entry = cls._stale_cache.get(key)
+        if entry is None:
+            return None
+        
+        stored_at, result = entry
+        age = time.monotonic() - stored_at
+        if age > STALE_TTL:
+            del cls._stale_cache[key]
+            return None
+        
+        # Plain values (e.g. avatar URLs) can't carry a flag and are returned as-is
+        if isinstance(result, dict):
+            stale = dict(result, stale=True, staleSeconds=int(age))
+            if 'changed' in stale:
+                # Nothing new was fetched, so refresh callers have nothing to apply
+                stale['changed'] = False
+            return stale
+        return result
+    
+    @classmethod
+    def _invalidate(cls, key):
+        """Drop a cached read after a write changed it"""
+        cls._stale_cache.pop(key, None)
+    
+    @classmethod
+    def _get_session(cls):
+        """Get the shared HTTP session for direct web API calls"""
+        if cls._session is None or cls._session.closed:
+            cls._session = aiohttp.ClientSession(trace_configs=[roblox_metrics.aiohttp_trace_config()])
+        return cls._session
+    
+    @classmethod
+    async def close(cls):
+        """Close the shared HTTP session"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+    
+    @classmethod
+    async def _conditional_get(cls, endpoint, url, params=None):
+        """GET a JSON endpoint, revalidating against the last response for the same URL
+        
+        Sends If-None-Match / If-Modified-Since when Roblox gave us validators.
+        Endpoints without validators are fingerprinted instead, so an identical
+        body skips JSON parsing. Returns (data, changed).
+        """
+        key = (url, tuple(sorted((params or {}).items())))
+        cached = cls._validators.get(key)
+        
+        headers = {}
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['lastModified']:
+                headers['If-Modified-Since'] = cached['lastModified']
+        
+        async with cls._get_session().get(url, params=params, headers=headers) as response:
+            if response.status == 304 and cached:
+                _revalidations.labels(endpoint, 'not_modified').inc()
+                _bytes_saved.labels(endpoint).inc(cached['size'])
+                cls._validators.move_to_end(key)
+                return cached['data'], False
+            
+            response.raise_for_status()
+            body = await response.read()
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        
+        fingerprint = hashlib.blake2b(body, digest_size=16).digest()
+        if cached and cached['fingerprint'] == fingerprint:
+            _revalidations.labels(endpoint, 'unchanged').inc()
+            cached['etag'] = etag
+            cached['lastModified'] = last_modified
+            cls._validators.move_to_end(key)
+            return cached['data'], False
+        
+        data = json.loads(body)
+        cls._validators[key] = {
+            'etag': etag,
+            'lastModified': last_modified,
+            'fingerprint': fingerprint,
+            'size': len(body),
+            'data': data
+        }
+        cls._validators.move_to_end(key)
+        while len(cls._validators) > STALE_CACHE_SIZE:
+            cls._validators.popitem(last=False)
+        
+        _revalidations.labels(endpoint, 'modified').inc()
+        return data, True
+    
     @classmethod
     async def get_user_info(cls, username):
         """Get user info by username"""
-        try:
+        async def fetch():
             user = await cls._client.get_user_by_username(username)
             if not user:
                 return None
@@ -71,28 +348,38 @@ class RobloxAPI:
                 'displayName': display_name,
                 'created': created.strftime('%Y-%m-%d') if created else 'Unknown'
             }
+        
+        try:
+            return await cls._read('users', ('user_info', username.lower()), fetch)
         except Exception as e:
-            logger.error(f"Error getting user info: {e}")
+            logger.error("Error getting user info (%s): %s", classify_error(e), e)
             return None
     
     @classmethod
     async def get_player_avatar(cls, user_id):
         """Get player's avatar URL"""
-        try:
+        async def fetch():
             user = await cls._client.get_user(int(user_id))
             avatar = await user.get_avatar_image()
             return avatar.image_url
+        
+        try:
+            return await cls._read('avatars', ('avatar', str(user_id)), fetch)
         except Exception as e:
-            logger.error(f"Error getting player avatar: {e}")
+            logger.error("Error getting player avatar (%s): %s", classify_error(e), e)
             return None
     
     @classmethod
     async def check_blacklisted_groups(cls, user_id, blacklisted_groups):
         """Check if user is in any blacklisted groups"""
-        try:
+        async def fetch():
             user = await cls._client.get_user(int(user_id))
             # Get user's groups
-            user_groups = await user.get_group_memberships()
+            return await user.get_group_memberships()
+        
+        try:
+            # Cache the raw memberships so a changed blacklist still applies to stale data
+            user_groups = await cls._read('groups', ('group_memberships', str(user_id)), fetch)
             
             found_groups = []
             for group_id, membership in user_groups.items():
@@ -110,7 +397,7 @@ class RobloxAPI:
                 'groups': found_groups
             }
         except Exception as e:
-            logger.error(f"Error checking blacklisted groups: {e}")
+            logger.error("Error checking blacklisted groups (%s): %s", classify_error(e), e)
             return {
                 'inBlacklistedGroup': False,
                 'groups': [],
@@ -120,8 +407,8 @@ class RobloxAPI:
     @classmethod
     async def rank_user(cls, user_id, rank_id):
         """Rank user in Roblox group"""
-        try:
-            group = await cls._client.get_group(int(cls._group_id))
+        async def apply_rank(client):
+            group = await client.get_group(int(cls._group_id))
             
             # Get member's current role
             try:
@@ -159,17 +446,73 @@ class RobloxAPI:
                 'oldRole': old_role.name,
                 'newRole': updated_member.role.name
             }
+        
+        try:
+            # Retry on another account when the failure was the account's fault
+            for _ in range(len(cls._pool)):
+                account = await cls._pool.acquire()
+                
+                async def write():
+                    try:
+                        return await apply_rank(account.client)
+                    except Exception as e:
+                        if cls._pool.record_failure(account, e):
+                            raise AccountUnavailable(account, str(e)) from e
+                        raise
+                
+                try:
+                    result = await cls._call('groups', 'rank_user', write)
+                except AccountUnavailable as e:
+                    logger.warning("Retrying rank write on another account: %s", e)
+                    roblox_metrics.record_retry('rank_user', classify_error(e.__cause__ or e))
+                    continue
+                
+                cls._pool.record_success(account)
+                if result['success']:
+                    cls._invalidate(('user_rank', str(user_id)))
+                return result
+            
+            return {
+                'success': False,
+                'error': 'No Roblox ranking account could apply the rank'
+            }
+        except NoHealthyAccountError:
+            return {
+                'success': False,
+                'error': 'All Roblox ranking accounts are failing authentication'
+            }
+        except CircuitOpenError as e:
+            # Writes are never served from cache, so fail fast with a clear reason
+            return {
+                'success': False,
+                'error': f'Roblox is currently unavailable, please try again in {e.retry_after:.0f} seconds'
+            }
         except Exception as e:
-            logger.error(f"Error ranking user: {e}")
+            logger.error("Error ranking user (%s): %s", classify_error(e), e)
             return {
                 'success': False,
                 'error': str(e)
             }
     
+    @classmethod
+    async def rank_users(cls, user_ranks):
+        """Rank several users, spreading the writes over the ranking accounts
+        
+        Takes (user_id, rank_id) pairs and returns results in the same order.
+        Concurrency scales with the number of healthy ranking accounts.
+        """
+        semaphore = asyncio.Semaphore(max(1, cls._pool.healthy_count()) * 2)
+        
+        async def rank_one(user_id, rank_id):
+            async with semaphore:
+                return await cls.rank_user(user_id, rank_id)
+        
+        return await asyncio.gather(*(rank_one(user_id, rank_id) for user_id, rank_id in user_ranks))
+    
     @classmethod
     async def get_user_rank(cls, user_id):
         """Get user's current rank in the group"""
-        try:
+        async def fetch():
             group = await cls._client.get_group(int(cls._group_id))
             
             try:
@@ -188,8 +531,88 @@ class RobloxAPI:
                 'groupId': group.id,
                 'groupName': group.name
             }
+        
+        try:
+            return await cls._read('groups', ('user_rank', str(user_id)), fetch)
+        except Exception as e:
+            logger.error("Error getting user rank (%s): %s", classify_error(e), e)
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    @classmethod
+    async def refresh_group_roles(cls):
+        """Get the group's roles, flagging whether they changed since the last refresh"""
+        url = f'{GROUPS_API}/v1/groups/{cls._group_id}/roles'
+        
+        async def fetch():
+            data, changed = await cls._conditional_get('group_roles', url)
+            return {
+                'success': True,
+                'changed': changed,
+                'roles': data.get('roles', [])
+            }
+        
+        try:
+            return await cls._read('groups', ('group_roles', url), fetch)
+        except Exception as e:
+            logger.error("Error refreshing group roles (%s): %s", classify_error(e), e)
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    @classmethod
+    async def get_roster_page(cls, role_id, cursor=None):
+        """Get one page of members holding a group role
+        
+        `changed` is False when the page is identical to the last fetch, so
+        roster caches and nickname updates for it can be skipped.
+        """
+        url = f'{GROUPS_API}/v1/groups/{cls._group_id}/roles/{role_id}/users'
+        params = {'limit': 100, 'sortOrder': 'Asc'}
+        if cursor:
+            params['cursor'] = cursor
+        
+        async def fetch():
+            data, changed = await cls._conditional_get('roster_page', url, params)
+            return {
+                'success': True,
+                'changed': changed,
+                'members': data.get('data', []),
+                'nextCursor': data.get('nextPageCursor')
+            }
+        
+        try:
+            return await cls._read('groups', ('roster_page', url, cursor), fetch)
+        except Exception as e:
+            logger.error("Error getting roster page (%s): %s", classify_error(e), e)
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    @classmethod
+    async def refresh_user_profile(cls, user_id):
+        """Get a user's profile, flagging whether it changed since the last refresh"""
+        url = f'{USERS_API}/v1/users/{int(user_id)}'
+        
+        async def fetch():
+            data, changed = await cls._conditional_get('user_profile', url)
+            return {
+                'success': True,
+                'changed': changed,
+                'id': data.get('id'),
+                'username': data.get('name'),
+                'displayName': data.get('displayName'),
+                'created': (data.get('created') or 'Unknown')[:10]
+            }
+        
+        try:
+            return await cls._read('users', ('user_profile', str(user_id)), fetch)
         except Exception as e:
-            logger.error(f"Error getting user rank: {e}")
+            logger.error("Error refreshing user profile (%s): %s", classify_error(e), e)
             return {
                 'success': False,
                 'error': str(e)
@@ -0,0 +1,214 @@
+"""Instrumentation and error taxonomy for outgoing Roblox calls"""
+
+import re
+import time
+import asyncio
+import logging
+
+import aiohttp
+
+import command_tracing
+import flight_recorder
+from circuit_breaker import CircuitOpenError
+from deadline import DeadlineExceeded
+from metrics import REGISTRY
+
+logger = logging.getLogger('roblox_metrics')
+
+# Error categories
+RATE_LIMITED = 'rate_limited'
+AUTH = 'auth'
+PERMISSION = 'permission'
+NOT_FOUND = 'not_found'
+TIMEOUT = 'timeout'
+# The caller's deadline ran out, before or during the call
+DEADLINE_EXCEEDED = 'deadline_exceeded'
+SERVER = 'server'
+CLIENT = 'client'
+CIRCUIT_OPEN = 'circuit_open'
+UNKNOWN = 'unknown'
+
+# Buckets tuned for Roblox web API latencies
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0)
+
+call_latency = REGISTRY.histogram(
+    'roblox_call_duration_seconds',
+    'Latency of successful Roblox calls',
+    ('endpoint',),
+    buckets=LATENCY_BUCKETS
+)
+call_errors = REGISTRY.counter(
+    'roblox_call_errors_total',
+    'Failed Roblox calls by error category',
+    ('endpoint', 'category')
+)
+call_retries = REGISTRY.counter(
+    'roblox_call_retries_total',
+    'Roblox calls sent again after a failed attempt',
+    ('endpoint', 'reason')
+)
+http_responses = REGISTRY.counter(
+    'roblox_http_responses_total',
+    'HTTP responses from Roblox by route and status code',
+    ('route', 'status')
+)
+http_bytes = REGISTRY.counter(
+    'roblox_http_response_bytes_total',
+    'Response bytes received from Roblox',
+    ('route',)
+)
+http_latency = REGISTRY.histogram(
+    'roblox_http_request_duration_seconds',
+    'Latency of individual HTTP requests to Roblox',
+    ('route',),
+    buckets=LATENCY_BUCKETS
+)
+
+# Roblox's message for an expired or invalid cookie, sent with 401 or 403
+_INVALID_COOKIE = 'Authorization has been denied'
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+def route_for(url):
+    """Collapse a URL into a low-cardinality route label, e.g. groups.roblox.com/v1/groups/{id}/roles"""
+    url = str(url).split('?', 1)[0]
+    url = url.split('://', 1)[-1]
+    return _ID_SEGMENT.sub('/{id}', url)
+
+# A status code in an error message, for errors that carry no status attribute
+_STATUS_IN_TEXT = re.compile(r'\b([45]\d\d)\b')
+
+def status_of(error):
+    """Get the HTTP status code carried by an error, if any"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status
+    status = getattr(error, 'status', None) or getattr(error, 'status_code', None)
+    if status is None:
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+    return status if isinstance(status, int) else None
+
+def _category_for_status(status, text):
+    if status == 429:
+        return RATE_LIMITED
+    if status == 401 or _INVALID_COOKIE in text:
+        return AUTH
+    if status == 403:
+        # A valid account without the rights for this action, e.g. ranking
+        # someone above the bot's own rank
+        return PERMISSION
+    if status == 404:
+        return NOT_FOUND
+    if status >= 500:
+        return SERVER
+    if status >= 400:
+        return CLIENT
+    return None
+
+def classify_error(error):
+    """Sort an error from a Roblox call into a category"""
+    if isinstance(error, CircuitOpenError):
+        return CIRCUIT_OPEN
+    if isinstance(error, DeadlineExceeded):
+        return DEADLINE_EXCEEDED
+    if isinstance(error, asyncio.TimeoutError) or 'Timeout' in type(error).__name__:
+        return TIMEOUT
+
+    text = str(error)
+    status = status_of(error)
+    if status is not None:
+        category = _category_for_status(status, text)
+        if category is not None:
+            return category
+
+    if 'TooManyRequests' in text or 'Too many requests' in text:
+        return RATE_LIMITED
+    if 'Unauthorized' in text or _INVALID_COOKIE in text:
+        return AUTH
+    if 'NotFound' in type(error).__name__ or 'DoesNotExist' in type(error).__name__:
+        return NOT_FOUND
+    if isinstance(error, (aiohttp.ClientConnectionError, ConnectionError)):
+        return SERVER
+
+    # Last resort: some ro_py errors only carry the status in their message.
+    # Anything else there, like an ID, could be taken for one
+    match = _STATUS_IN_TEXT.search(text)
+    if match:
+        return _category_for_status(int(match.group(1)), text) or UNKNOWN
+    return UNKNOWN
+
+def record_call(endpoint, started, error=None):
+    """Record the outcome of one RobloxAPI call, returning the error category"""
+    elapsed = time.monotonic() - started
+    command_tracing.add_time(command_tracing.ROBLOX, elapsed)
+    if error is None:
+        call_latency.labels(endpoint).observe(elapsed)
+        flight_recorder.record(flight_recorder.CALL, 'roblox', endpoint, elapsed, 'ok')
+        return None
+
+    category = classify_error(error)
+    flight_recorder.record(flight_recorder.CALL, 'roblox', endpoint, elapsed, category)
+    call_errors.labels(endpoint, category).inc()
+    return category
+
+def record_retry(endpoint, reason):
+    """Record that a call is being sent again"""
+    call_retries.labels(endpoint, reason).inc()
+
+def record_response(url, status, size, duration=None):
+    """Record one HTTP response from Roblox"""
+    route = route_for(url)
+    http_responses.labels(route, status).inc()
+    if size:
+        http_bytes.labels(route).inc(size)
+    if duration is not None:
+        http_latency.labels(route).observe(duration)
+
+def aiohttp_trace_config():
+    """Trace config that records every request made through an aiohttp session"""
+    async def on_request_start(session, context, params):
+        context.started = time.monotonic()
+
+    async def on_request_end(session, context, params):
+        response = params.response
+        record_response(params.url, response.status, response.content_length, time.monotonic() - context.started)
+
+    async def on_request_exception(session, context, params):
+        http_responses.labels(route_for(params.url), 'error').inc()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+def instrument_client(client):
+    """Hook response recording into a ro_py client's HTTP session
+
+    ro_py keeps its HTTP client private, so this is best effort: if the
+    session can't be found only method-level metrics are recorded.
+    """
+    requests = getattr(client, 'requests', None)
+    session = getattr(requests, 'session', None)
+    event_hooks = getattr(session, 'event_hooks', None)
+    if event_hooks is None:
+        logger.debug("Could not find ro_py HTTP session to instrument")
+        return False
+
+    async def on_response(response):
+        size = response.headers.get('content-length')
+        started = response.request.extensions.get('roblox_started')
+        duration = time.monotonic() - started if started else None
+        record_response(response.request.url, response.status_code, int(size) if size else 0, duration)
+
+        # ro_py repeats the request with a fresh X-CSRF-TOKEN after this response
+        if response.status_code == 403 and 'x-csrf-token' in response.headers:
+            record_retry(route_for(response.request.url), 'csrf')
+
+    async def on_request(request):
+        request.extensions['roblox_started'] = time.monotonic()
+
+    event_hooks.setdefault('request', []).append(on_request)
+    event_hooks.setdefault('response', []).append(on_response)
+    session.event_hooks = event_hooks
+    return True
@@ -4,24 +4,37 @@ Render Python Bot Starter Script
 
 This script is designed specifically for Render deployment:
 1. Validates environment variables
-2. Synchronizes slash commands
-3. Starts the bot with crash recovery
-4. Implements heartbeat mechanism to keep the bot active
+2. Checks Discord, the database and Roblox in parallel
+3. Synchronizes slash commands
+4. Starts the bot with crash recovery
+5. Implements heartbeat mechanism to keep the bot active
 """
 
 import os
 import sys
 import time
+import json
+import signal
 import asyncio
 import logging
-import subprocess
+import importlib
+import urllib.request
 from datetime import datetime
 
+from aiohttp import web
+
+import cluster
+import command_sync
+import flight_recorder
+from graceful_shutdown import SHUTDOWN_TIMEOUT_ENV
+from metrics import REGISTRY, render_text
+from preflight import run_preflight
+from logging_setup import setup_logging
+from resource_watchdog import ResourceWatchdog
+from restart_policy import CRASH_LOOP, EXIT_CONFIG_ERROR, GIVE_UP, RestartPolicy, classify_exit
+
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 logger = logging.getLogger('bot_starter')
 
 # Required environment variables
@@ -41,9 +54,9 @@ def check_environment():
     for var in REQUIRED_ENV_VARS:
         if not os.getenv(var):
             missing_vars.append(var)
-            logger.error(f"Missing required environment variable: {var}")
+            logger.error("Missing required environment variable: %s", var)
         else:
-            logger.info(f"[OK] Found {var}")
+            logger.info("[OK] Found %s", var)
     
     if missing_vars:
         logger.error("Missing required environment variables. Exiting.")
@@ -51,86 +64,468 @@ def check_environment():
     
     return True
 
-async def sync_commands():
-    """Sync slash commands with Discord."""
+async def sync_commands(token_checked=None):
+    """Sync slash commands with Discord over REST, without logging in.
+    
+    With `token_checked`, a future resolved by the preflight's Discord check,
+    nothing is written to Discord until the token is known to be good.
+    """
     logger.info("Synchronizing slash commands...")
-    # This would be implemented to sync commands with Discord API
-    # For now, we'll just simulate success
-    await asyncio.sleep(1)
-    logger.info("Commands synchronized successfully!")
+    # The command definitions live apart from bot.py, so building the tree
+    # here doesn't start anything bot.py does on import
+    bot_commands = await asyncio.to_thread(importlib.import_module, "bot_commands")
+    tree = await asyncio.to_thread(bot_commands.build_tree)
+    async def before_write():
+        if token_checked is not None and not await token_checked:
+            raise RuntimeError("Discord check failed, not writing commands")
+    
+    digest = await command_sync.sync_via_rest(
+        tree,
+        os.getenv('DISCORD_TOKEN'),
+        os.getenv('APPLICATION_ID'),
+        os.getenv('COMMAND_SYNC_GUILD_ID'),
+        before_write
+    )
+    
+    # Bot processes inherit this and skip their own sync
+    os.environ[command_sync.SYNCED_FINGERPRINT_ENV] = digest
     return True
 
-def start_bot_process():
+# Port for the supervisor's own metrics: restarts, exit codes and the bot
+# processes' memory and CPU. Bot processes serve theirs on METRICS_PORT
+# plus their cluster ID, so pick a port outside that range; unset, not served
+SUPERVISOR_METRICS_PORT = os.getenv('SUPERVISOR_METRICS_PORT')
+
+# A cluster whose heartbeat is older than this is restarted
+HEARTBEAT_TIMEOUT = cluster.HEARTBEAT_INTERVAL * 4
+
+# Time a new process gets to log in and send its first heartbeat
+STARTUP_GRACE = 120
+
+# Delay between starting clusters, so they don't all IDENTIFY at once
+CLUSTER_START_DELAY = 5
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+# Child output lines buffered before the readers stop reading the pipes
+LOG_BUFFER_LINES = int(os.getenv('SUPERVISOR_LOG_BUFFER', '1000'))
+
+# Most lines written in one batch
+LOG_BATCH_LINES = 200
+
+# Longest line read from the child before it is split
+MAX_LINE_BYTES = 1024 * 1024
+
+# Keep a second bot process parked before login, to take over on a crash
+WARM_STANDBY = os.getenv('WARM_STANDBY', 'false').lower() == 'true'
+
+# Delay before starting a standby, so it doesn't compete with a cold start
+STANDBY_SPAWN_DELAY = float(os.getenv('STANDBY_SPAWN_DELAY', '30'))
+
+# Time a recycled process gets to finish in-flight work after SIGTERM
+RECYCLE_GRACE = float(os.getenv('RECYCLE_GRACE', '30'))
+
+# Time a hung process gets to write its flight recording after SIGUSR2
+FLIGHT_DUMP_WAIT = 2
+
+# Time bot processes get to drain when the supervisor itself is stopped;
+# Render kills the service 30 seconds after its SIGTERM
+SHUTDOWN_TIMEOUT = float(os.getenv('SUPERVISOR_SHUTDOWN_TIMEOUT', '25'))
+
+# Deadline passed to bot processes for their own shutdown, cleanup included:
+# inside both timeouts above, with a margin for the process to exit
+BOT_SHUTDOWN_TIMEOUT = max(1.0, min(RECYCLE_GRACE, SHUTDOWN_TIMEOUT) - 2)
+
+# Set when the supervisor is stopping; clusters stop restarting their process
+stopping = asyncio.Event()
+
+# Bot processes still running, including standbys
+running_processes = set()
+
+def fetch_recommended_shards():
+    """Ask Discord how many shards the bot should run."""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {os.getenv('DISCORD_TOKEN')}"}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+async def plan_clusters():
+    """Get the environment for each bot process.
+    
+    With CLUSTER_COUNT unset or 1 and no SHARD_COUNT this is a single
+    process running the bot as before. Otherwise the shards are split into
+    contiguous ranges, one per process.
+    """
+    cluster_count = int(os.getenv('CLUSTER_COUNT', '1'))
+    shard_count = os.getenv('SHARD_COUNT')
+    if cluster_count <= 1 and not shard_count:
+        return [{}]
+    
+    if shard_count:
+        shard_count = int(shard_count)
+    else:
+        shard_count = await asyncio.to_thread(fetch_recommended_shards)
+        logger.info("Discord recommends %s shards", shard_count)
+    
+    ranges = cluster.shard_ranges(shard_count, cluster_count)
+    plan = []
+    for cluster_id, shard_ids in enumerate(ranges):
+        plan.append({
+            'CLUSTER_ID': str(cluster_id),
+            'CLUSTER_COUNT': str(len(ranges)),
+            'SHARD_COUNT': str(shard_count),
+            'SHARD_IDS': f"{shard_ids[0]}-{shard_ids[-1]}"
+        })
+        logger.info("Cluster %s: shards %s-%s of %s", cluster_id, shard_ids[0], shard_ids[-1], shard_count)
+    return plan
+
+class LogForwarder:
+    """Copies a child's stdout and stderr to our stderr in batches.
+    
+    Both pipes are read concurrently into one bounded buffer. When the
+    buffer is full the readers stop reading, so a flood of output fills the
+    pipe and slows the child's writer instead of growing our memory.
+    """
+    
+    def __init__(self, name, output=None):
+        self.name = name
+        self.output = output or sys.stderr
+        # Set when a standby child reports it is parked
+        self.ready = asyncio.Event()
+        self._buffer = asyncio.Queue(LOG_BUFFER_LINES)
+    
+    async def _read(self, stream):
+        while True:
+            try:
+                line = await stream.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                # The pipe closed, maybe mid-line
+                line = e.partial
+            except asyncio.LimitOverrunError as e:
+                # Longer than MAX_LINE_BYTES: pass on the part read so far as
+                # its own line; readline() would have dropped it
+                line = await stream.readexactly(e.consumed)
+            if not line:
+                return
+            if line.startswith(cluster.STANDBY_READY_MARKER.encode()):
+                self.ready.set()
+                continue
+            await self._buffer.put(line)
+    
+    def _write(self, lines):
+        prefix = f"[{self.name}] "
+        self.output.write("".join(prefix + line.decode(errors="replace").rstrip("\n") + "\n" for line in lines))
+        self.output.flush()
+    
+    async def _drain(self):
+        finished = False
+        while not finished:
+            lines = [await self._buffer.get()]
+            while len(lines) < LOG_BATCH_LINES and not self._buffer.empty():
+                lines.append(self._buffer.get_nowait())
+            
+            # None marks the end of both pipes
+            if lines[-1] is None:
+                lines.pop()
+                finished = True
+            if lines:
+                # The write can block on a slow terminal or log collector, so
+                # it runs in a thread; the buffer fills meanwhile and pushes back
+                await asyncio.to_thread(self._write, lines)
+    
+    async def forward(self, process):
+        """Forward output until both pipes close."""
+        drain = asyncio.create_task(self._drain())
+        try:
+            await asyncio.gather(self._read(process.stdout), self._read(process.stderr))
+            await self._buffer.put(None)
+            await drain
+        finally:
+            drain.cancel()
+
+async def start_bot_process(extra_env=None):
     """Start the bot as a subprocess and return the process object."""
     logger.info("Starting Discord bot...")
-    # Start bot.py as a subprocess
-    process = subprocess.Popen(
-        [sys.executable, "python_version/bot.py"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        universal_newlines=True
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, BOT_SCRIPT,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, SHUTDOWN_TIMEOUT_ENV: str(BOT_SHUTDOWN_TIMEOUT), **(extra_env or {})},
+        limit=MAX_LINE_BYTES
     )
     
-    logger.info(f"Bot started with PID: {process.pid}")
+    logger.info("Bot started with PID: %s", process.pid)
+    running_processes.add(process)
     return process
 
-def monitor_process(process):
-    """Monitor the bot process and log its output."""
-    while True:
-        # Read output from stdout
-        stdout_line = process.stdout.readline()
-        if stdout_line:
-            logger.info(f"[BOT] {stdout_line.strip()}")
-        
-        # Read output from stderr
-        stderr_line = process.stderr.readline()
-        if stderr_line:
-            logger.error(f"[BOT ERROR] {stderr_line.strip()}")
-        
-        # Check if process has exited
-        if process.poll() is not None:
-            return_code = process.poll()
-            logger.warning(f"Bot process exited with code {return_code}")
-            break
-        
-        # Small sleep to prevent high CPU usage
-        time.sleep(0.1)
+async def monitor_process(process, name="BOT", forwarder=None):
+    """Forward the bot's output until it exits, and return its exit code."""
+    await (forwarder or LogForwarder(name)).forward(process)
+    return_code = await process.wait()
+    running_processes.discard(process)
+    logger.warning("Bot process exited with code %s", return_code)
+    return return_code
+
+async def stop_process(process, timeout=10):
+    """Ask a process to exit, killing it if it doesn't within `timeout`."""
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+class Standby:
+    """A bot process imported and connected to the database, parked before login.
+    
+    Promoting it skips interpreter start-up, imports and pool creation, so
+    a cluster is back on the gateway moments after its process dies.
+    """
+    
+    def __init__(self, name, extra_env):
+        self.name = name
+        self.extra_env = {**extra_env, 'BOT_STANDBY': '1'}
+        self.forwarder = LogForwarder(f"{name} STANDBY")
+        self.process = None
+        self.monitor = None
+        self._launch = None
+    
+    def launch(self, delay):
+        self._launch = asyncio.create_task(self._start(delay))
+    
+    async def _start(self, delay):
+        await asyncio.sleep(delay)
+        if stopping.is_set():
+            return
+        self.process = await start_bot_process(self.extra_env)
+        self.monitor = asyncio.create_task(monitor_process(self.process, forwarder=self.forwarder))
+    
+    def is_ready(self):
+        return (self.process is not None and self.process.returncode is None
+                and self.forwarder.ready.is_set())
+    
+    def promote(self):
+        """Let the parked process log in; returns its monitor task."""
+        self.forwarder.name = self.name
+        self.process.send_signal(signal.SIGUSR1)
+        return self.monitor
+    
+    async def discard(self):
+        if self._launch is not None:
+            self._launch.cancel()
+        if self.process is not None:
+            await stop_process(self.process)
 
 async def heartbeat():
     """Send periodic heartbeats to keep the process alive."""
     while True:
-        logger.info(f"[HEARTBEAT] Bot is still running at {datetime.now().isoformat()}")
+        logger.info("[HEARTBEAT] Bot is still running at %s", datetime.now().isoformat())
         await asyncio.sleep(300)  # Send heartbeat every 5 minutes
 
+async def watch_heartbeat(cluster_id, process):
+    """Terminate a cluster process that stops sending heartbeats."""
+    started = time.time()
+    while process.returncode is None:
+        await asyncio.sleep(cluster.HEARTBEAT_INTERVAL)
+        
+        beat = cluster.read_heartbeat(cluster_id)
+        if beat and beat.get('pid') == process.pid:
+            stale_at = beat['time'] + HEARTBEAT_TIMEOUT
+        else:
+            stale_at = started + STARTUP_GRACE
+        
+        if time.time() > stale_at and process.returncode is None:
+            logger.error("Cluster %s (PID %s) stopped sending heartbeats, restarting it", cluster_id, process.pid)
+            # Ask for a flight recording and thread stacks before stopping it
+            process.send_signal(signal.SIGUSR2)
+            await asyncio.sleep(FLIGHT_DUMP_WAIT)
+            await stop_process(process)
+            return
+
+async def run_cluster(cluster_id, extra_env):
+    """Run one cluster process, restarting only it when it exits.
+    
+    Returns the exit code when the process failed in a way restarting
+    can't fix.
+    """
+    name = f"BOT {cluster_id}" if extra_env else "BOT"
+    policy = RestartPolicy(cluster_id)
+    standby = None
+    crashed_at = None
+    while True:
+        try:
+            env = {**extra_env, **policy.child_env()}
+            promote = standby is not None and standby.is_ready()
+            if crashed_at is not None:
+                # The new process reports how long until its first command
+                cluster.record_failover(cluster_id, crashed_at, "standby" if promote else "cold")
+            if promote:
+                process = standby.process
+                monitor = standby.promote()
+                logger.info("Promoted warm standby (PID %s) for cluster %s", process.pid, cluster_id)
+            else:
+                if standby is not None:
+                    await standby.discard()
+                process = await start_bot_process(env)
+                monitor = asyncio.create_task(monitor_process(process, name))
+            started = time.monotonic()
+            policy.record_start(started)
+            
+            standby = None
+            if WARM_STANDBY:
+                standby = Standby(name, env)
+                standby.launch(STANDBY_SPAWN_DELAY)
+            
+            resources = ResourceWatchdog(cluster_id)
+            watchdogs = [
+                asyncio.create_task(watch_heartbeat(cluster_id, process)),
+                asyncio.create_task(resources.watch(process, lambda: stop_process(process, RECYCLE_GRACE)))
+            ]
+            try:
+                exit_code = await monitor
+            finally:
+                for task in watchdogs:
+                    task.cancel()
+            
+            crash = await asyncio.to_thread(flight_recorder.collect, cluster_id, process.pid, exit_code, classify_exit(exit_code))
+            if crash is not None:
+                logger.error("Cluster %s (PID %s) exited with code %s: %s (flight recording in %s)",
+                             cluster_id, process.pid, exit_code, crash['summary'],
+                             os.path.join(flight_recorder.CRASH_DIR_NAME, (crash['recordings'] or [crash['fault_log']])[-1]))
+        except Exception as e:
+            logger.error("Error in cluster %s process: %s", cluster_id, e)
+            resources = None
+            exit_code = 1
+        crashed_at = time.time()
+        
+        if stopping.is_set():
+            if standby is not None:
+                await standby.discard()
+            return None
+        
+        # A recycle after a stable run is planned maintenance: restart
+        # straight away. One soon after start goes through the backoff
+        if resources is not None and resources.recycle_reason and time.monotonic() - started >= policy.stable_after:
+            policy.record_recycle(resources.recycle_reason)
+            continue
+        
+        decision, delay, reason = policy.next_action(exit_code, time.monotonic())
+        if decision == GIVE_UP:
+            if standby is not None:
+                await standby.discard()
+            logger.error("Cluster %s exited with a configuration error (code %s), not restarting", cluster_id, exit_code)
+            return exit_code
+        
+        # A crash loop would take the standby down with it; start cold after the cooldown
+        if reason == CRASH_LOOP and standby is not None:
+            await standby.discard()
+            standby = None
+        
+        if standby is not None and standby.is_ready():
+            continue
+        
+        logger.info("Restarting cluster %s in %.1f seconds (%s, %s failures)...", cluster_id, delay, reason, policy.failures)
+        try:
+            await asyncio.wait_for(stopping.wait(), delay)
+            return None
+        except asyncio.TimeoutError:
+            pass
+
+async def shutdown(reason):
+    """Stop restarting and give every bot process time to drain."""
+    if stopping.is_set():
+        return
+    stopping.set()
+    logger.info("Received %s, stopping %s bot processes", reason, len(running_processes))
+    await asyncio.gather(*(stop_process(process, SHUTDOWN_TIMEOUT) for process in list(running_processes)))
+
+async def start_clusters(plan):
+    """Start every cluster, staggered so their shards connect in turn."""
+    tasks = []
+    for cluster_id, extra_env in enumerate(plan):
+        if cluster_id:
+            await asyncio.sleep(CLUSTER_START_DELAY)
+        tasks.append(asyncio.create_task(run_cluster(cluster_id, extra_env)))
+    return await asyncio.gather(*tasks)
+
+async def serve_metrics(port):
+    """Serve the supervisor's metrics at /metrics; returns the runner to clean up"""
+    async def handle_metrics(request):
+        body = await asyncio.to_thread(render_text, REGISTRY)
+        return web.Response(
+            body=body.encode(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
+    
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    logger.info("Supervisor metrics listening on port %s", port)
+    return runner
+
 async def main():
     """Main function to run the bot with restart capability."""
     # Check environment variables
     if not check_environment():
         sys.exit(1)
     
-    # Sync commands
-    try:
-        await sync_commands()
-    except Exception as e:
-        logger.error(f"Error synchronizing commands: {e}")
-        # Continue even if command sync fails
+    # Check credentials, sync commands and work out the shard layout at the
+    # same time; the sync only writes to Discord once the token checked out
+    token_checked = asyncio.get_running_loop().create_future()
+    
+    def on_check(result):
+        if result.name == 'discord' and not token_checked.done():
+            token_checked.set_result(result.ok)
+    
+    setup = asyncio.gather(sync_commands(token_checked), plan_clusters(), return_exceptions=True)
+    checks = await run_preflight(on_result=on_check)
+    failed = [check for check in checks if not check.ok]
+    if failed:
+        logger.error("Not starting the bot: %s", '; '.join(check.detail for check in failed))
+        # Bad configuration won't fix itself; anything else may be an outage worth retrying
+        setup.cancel()
+        sys.exit(EXIT_CONFIG_ERROR if any(check.fatal for check in failed) else 1)
+
+    sync_result, plan = await setup
+    if isinstance(sync_result, Exception):
+        # Continue even if command sync fails; the bot will try again
+        logger.error("Error synchronizing commands: %s", sync_result)
+    if isinstance(plan, Exception):
+        logger.error("Error planning shard clusters: %s", plan)
+        sys.exit(1)
     
     # Start heartbeat task
     heartbeat_task = asyncio.create_task(heartbeat())
     
-    # Start bot with restart logic
-    while True:
+    metrics_runner = None
+    if SUPERVISOR_METRICS_PORT:
         try:
-            process = start_bot_process()
-            monitor_process(process)
-            
-            # If we reach here, the process has exited
-            logger.info("Restarting bot in 10 seconds...")
-            await asyncio.sleep(10)
+            metrics_runner = await serve_metrics(int(SUPERVISOR_METRICS_PORT))
         except Exception as e:
-            logger.error(f"Error in bot process: {e}")
-            logger.info("Restarting bot in 10 seconds...")
-            await asyncio.sleep(10)
+            logger.error("Failed to start supervisor metrics: %s", e)
+    
+    # Pass SIGTERM on to the bots so they can finish in-flight commands
+    loop = asyncio.get_running_loop()
+    stop_tasks = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda name=sig.name: stop_tasks.append(asyncio.create_task(shutdown(name))))
+    
+    # Start bots with restart logic; returns when stopped or every cluster gave up
+    await start_clusters(plan)
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    if stopping.is_set():
+        await asyncio.gather(*stop_tasks)
+        logger.info("All bot processes stopped")
+        return
+    logger.error("Bot configuration is invalid, fix it and redeploy")
+    sys.exit(EXIT_CONFIG_ERROR)
 
 if __name__ == "__main__":
     try:
@@ -139,5 +534,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("Bot startup script terminated by user")
     except Exception as e:
-        logger.error(f"Unhandled exception in startup script: {e}")
+        logger.error("Unhandled exception in startup script: %s", e)
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""Startup profiler for the bot process
+
+Import this module first: it times every module imported after it, then
+records how long each startup phase takes and when the bot reached each
+milestone (logged in, ready, first command served). The report is logged
+once the bot is ready, again after the first command, saved to the state
+directory and served on /debug/startup.
+
+Run it directly to check import time against a budget, e.g. in CI:
+
+    python startup_profiler.py --budget 2.5
+
+It imports bot.py in fresh interpreters and exits with status 1 when the
+median import time is over budget. The test suite runs the same check
+against STARTUP_IMPORT_BUDGET (tests/test_startup_budget.py).
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import builtins
+import threading
+import argparse
+import subprocess
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+logger = logging.getLogger('startup_profiler')
+
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', 'true').lower() == 'true'
+
+# Median seconds importing bot.py may take, checked by --budget and the tests
+STARTUP_IMPORT_BUDGET = float(os.getenv('STARTUP_IMPORT_BUDGET', '3'))
+
+# Modules listed in the report
+REPORT_IMPORTS = 15
+
+# Milestones
+IMPORTS = 'imports'
+LOGIN = 'login'
+READY = 'ready'
+FIRST_COMMAND = 'first_command'
+
+_started = time.perf_counter()
+
+_phase_seconds = REGISTRY.gauge(
+    'startup_phase_seconds',
+    'Wall time of each startup phase of this process',
+    ('phase',)
+)
+_milestone_seconds = REGISTRY.gauge(
+    'startup_milestone_seconds',
+    'Seconds from process start to each startup milestone',
+    ('milestone',)
+)
+
+# Module name -> [seconds including nested imports, seconds of its own]
+_imports = {}
+# Per thread, seconds spent in nested imports of each import in progress;
+# a thread importing at the same time must not add to another's entries
+_import_stacks = threading.local()
+_builtin_import = builtins.__import__
+
+_phases = {}
+_milestones = {}
+
+def elapsed():
+    return time.perf_counter() - _started
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Already imported or relative: nothing to time
+    if level or name in sys.modules:
+        return _builtin_import(name, globals, locals, fromlist, level)
+
+    stack = _import_stacks.__dict__.setdefault('stack', [])
+    stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        return _builtin_import(name, globals, locals, fromlist, level)
+    finally:
+        total = time.perf_counter() - started
+        nested = stack.pop()
+        if stack:
+            stack[-1] += total
+        _imports[name] = [total, total - nested]
+
+def install_import_hook():
+    """Time imports from here on; call before importing anything heavy"""
+    if STARTUP_PROFILE:
+        builtins.__import__ = _timed_import
+
+def remove_import_hook():
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _builtin_import
+
+@contextmanager
+def phase(name):
+    """Time a block of startup work"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        _phases[name] = seconds
+        _phase_seconds.labels(name).set(seconds)
+
+def mark(milestone):
+    """Record the first time the process reaches a milestone
+
+    Returns True the first time, so callers can report once.
+    """
+    if milestone in _milestones:
+        return False
+    if milestone == IMPORTS:
+        remove_import_hook()
+    _milestones[milestone] = elapsed()
+    _milestone_seconds.labels(milestone).set(_milestones[milestone])
+    return True
+
+def slowest_imports(limit=REPORT_IMPORTS):
+    """Get (module, total seconds, own seconds) of the slowest top-level imports
+
+    Only top-level packages are listed; each total includes the modules the
+    package imported for the first time.
+    """
+    entries = [(name, total, own) for name, (total, own) in _imports.items() if '.' not in name]
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    return entries[:limit]
+
+def report():
+    """Get the startup profile as a dict"""
+    import cluster
+    return {
+        'cluster_id': cluster.CLUSTER_ID,
+        'pid': os.getpid(),
+        'milestones': {name: round(seconds, 3) for name, seconds in _milestones.items()},
+        'phases': {name: round(seconds, 3) for name, seconds in _phases.items()},
+        'imports': [
+            {'module': name, 'seconds': round(total, 4), 'own_seconds': round(own, 4)}
+            for name, total, own in slowest_imports()
+        ]
+    }
+
+def _save(profile):
+    from state_store import STATE_DIR
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, f"startup-{profile['cluster_id']}.json")
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+
+def log_report():
+    """Log the startup profile and save it to the state directory"""
+    profile = report()
+    lines = [f"Startup profile (cluster {profile['cluster_id']}):"]
+    for name, seconds in profile['milestones'].items():
+        lines.append(f'  {name:<16} at {seconds:7.2f}s')
+    for name, seconds in profile['phases'].items():
+        lines.append(f'  {name:<16} took {seconds:6.2f}s')
+    if profile['imports']:
+        lines.append('  slowest imports:')
+        for entry in profile['imports']:
+            lines.append(f"    {entry['module']:<22} {entry['seconds']:6.3f}s")
+    logger.info('\n'.join(lines))
+
+    try:
+        _save(profile)
+    except OSError as e:
+        logger.warning("Could not save startup profile: %s", e)
+
+def _measure_import(module):
+    """Import `module` in a fresh interpreter and get its profile"""
+    code = (
+        'import json, startup_profiler\n'
+        'startup_profiler.install_import_hook()\n'
+        f'import {module}\n'
+        'startup_profiler.mark(startup_profiler.IMPORTS)\n'
+        'print(json.dumps({"seconds": startup_profiler.elapsed(), "imports": startup_profiler.slowest_imports()}))\n'
+    )
+    env = dict(os.environ, STARTUP_PROFILE='true')
+    output = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def check_budget(budget, module='bot', runs=3):
+    """Check the median import time of `module` against `budget` seconds"""
+    results = sorted((_measure_import(module) for _ in range(runs)), key=lambda result: result['seconds'])
+    median = results[len(results) // 2]
+
+    print(f"import {module}: median {median['seconds']:.3f}s over {runs} runs (budget {budget:.3f}s)")
+    for name, total, own in median['imports']:
+        print(f'  {name:<22} {total:6.3f}s  (own {own:.3f}s)')
+
+    if median['seconds'] > budget:
+        print(f'FAIL: import time is {median["seconds"] - budget:.3f}s over budget')
+        return False
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check bot import time against a budget')
+    parser.add_argument('--budget', type=float, default=STARTUP_IMPORT_BUDGET,
+                        help='maximum median import time in seconds')
+    parser.add_argument('--module', default='bot', help='module to import')
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters to measure')
+    args = parser.parse_args()
+    sys.exit(0 if check_budget(args.budget, args.module, args.runs) else 1)
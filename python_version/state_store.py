@@ -0,0 +1,69 @@
+"""Small persistent key/value store for bot runtime state
+
+Values live in Postgres when the database pool is up, and in a JSON file
+under BOT_STATE_DIR otherwise, so state survives restarts either way.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import threading
+
+import database
+from database import Database
+
+logger = logging.getLogger('state_store')
+
+STATE_DIR = os.getenv('BOT_STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.state'))
+STATE_FILE = os.path.join(STATE_DIR, 'bot_state.json')
+
+# Serializes read-modify-write cycles on the state file
+_file_lock = threading.Lock()
+
+def _read_file():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable state file %s: %s", STATE_FILE, e)
+        return {}
+
+def _write_file(key, value):
+    with _file_lock:
+        state = _read_file()
+        if value is None:
+            state.pop(key, None)
+        else:
+            state[key] = value
+
+        # Write to a temporary file first so a crash can't leave half a file behind
+        os.makedirs(STATE_DIR, exist_ok=True)
+        temp_path = f'{STATE_FILE}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, STATE_FILE)
+
+async def get_value(key):
+    """Get a stored value, or None"""
+    if Database.is_initialized():
+        try:
+            return await database.get_bot_state(key)
+        except Exception as e:
+            logger.warning("Falling back to local state for %s: %s", key, e)
+    return await asyncio.to_thread(lambda: _read_file().get(key))
+
+async def set_value(key, value):
+    """Store a string value, or delete the key when value is None"""
+    if Database.is_initialized():
+        try:
+            if value is None:
+                await database.delete_bot_state(key)
+            else:
+                await database.set_bot_state(key, value)
+            return
+        except Exception as e:
+            logger.warning("Falling back to local state for %s: %s", key, e)
+    await asyncio.to_thread(_write_file, key, value)
@@ -0,0 +1,71 @@
+"""Sliding-window join counting for raid detection
+
+Checks JoinRateCounter against a plain count of the joins in the last
+`window` seconds, including joins that age out one bucket at a time,
+gaps longer than the window and clocks that don't start at zero.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from antiraid import JoinRateCounter
+
+WINDOW = 10
+START = 1_700_000_000.0
+
+class JoinRateCounterTest(unittest.TestCase):
+
+    def test_joins_within_the_window_add_up(self):
+        counter = JoinRateCounter(WINDOW)
+        for join in range(1, 6):
+            self.assertEqual(counter.add(START + join * 0.5), join)
+
+    def test_joins_age_out_a_second_at_a_time(self):
+        counter = JoinRateCounter(WINDOW)
+        for second in range(WINDOW):
+            counter.add(START + second)
+        self.assertEqual(counter.total(START + WINDOW - 1), WINDOW)
+
+        for passed in range(1, WINDOW + 1):
+            self.assertEqual(counter.total(START + WINDOW - 1 + passed), WINDOW - passed)
+
+    def test_gap_longer_than_the_window_clears_everything(self):
+        counter = JoinRateCounter(WINDOW)
+        for _ in range(50):
+            counter.add(START)
+        self.assertEqual(counter.total(START + WINDOW * 3), 0)
+        self.assertEqual(counter.add(START + WINDOW * 3), 1)
+
+    def test_late_reading_does_not_go_backwards(self):
+        counter = JoinRateCounter(WINDOW)
+        counter.add(START + 5)
+        # A timestamp from before the current second counts in the current one
+        self.assertEqual(counter.add(START + 4), 2)
+        self.assertEqual(counter.total(START + 5 + WINDOW), 0)
+
+    def test_reset(self):
+        counter = JoinRateCounter(WINDOW)
+        for second in range(5):
+            counter.add(START + second)
+        counter.reset()
+        self.assertEqual(counter.total(START + 5), 0)
+
+    def test_matches_a_plain_count(self):
+        rng = random.Random(1)
+        counter = JoinRateCounter(WINDOW)
+        joins = []
+        now = START
+        for _ in range(2000):
+            now += rng.choice((0, 0, 0.1, 0.7, 1.3, 4, 15))
+            joins.append(int(now))
+            expected = sum(1 for second in joins if int(now) - second < WINDOW)
+            self.assertEqual(counter.add(now), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Comparison of local slash commands with the ones Discord has registered
+
+Feeds diff_commands the local tree and copies of it shaped like Discord's
+GET response, and checks that only real changes count.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import os
+import sys
+import copy
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot_commands
+from command_sync import diff_commands, serialize_tree
+
+def as_registered(payload):
+    """Shape local payloads the way Discord returns them: ids added,
+    unset fields filled in or left out, defaults spelled out"""
+    registered = []
+    for index, data in enumerate(copy.deepcopy(payload)):
+        data.update(id=str(1000 + index), application_id='1', version='1')
+        data['integration_types'] = [0]
+        data['dm_permission'] = True
+        data.pop('nsfw', None)
+        for option in data.get('options', []):
+            if not option.get('required'):
+                option.pop('required', None)
+        registered.append(data)
+    return registered
+
+def command(registered, name):
+    return next(data for data in registered if data['name'] == name)
+
+def option(data, *path):
+    for name in path:
+        data = next(option for option in data['options'] if option['name'] == name)
+    return data
+
+class DiffCommandsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.local = serialize_tree(bot_commands.build_tree())
+
+    def setUp(self):
+        self.remote = as_registered(self.local)
+
+    def test_echoed_tree_matches(self):
+        self.assertEqual(diff_commands(self.local, self.remote), ([], [], []))
+
+    def test_added_and_removed_commands(self):
+        remote = [data for data in self.remote if data['name'] != 'verify']
+        remote.append({'type': 1, 'name': 'retired', 'description': 'Gone'})
+        self.assertEqual(diff_commands(self.local, remote), (['verify'], ['retired'], []))
+
+    def test_zero_minimum_is_compared(self):
+        # /antiraid enable min_account_age has min_value 0
+        min_age = option(command(self.remote, 'antiraid'), 'enable', 'min_account_age')
+        self.assertEqual(min_age['min_value'], 0)
+        del min_age['min_value']
+        self.assertEqual(diff_commands(self.local, self.remote), ([], [], ['antiraid']))
+
+    def test_reordered_channel_types_match(self):
+        local = copy.deepcopy(self.local)
+        option(command(local, 'setchannel'), 'channel').setdefault('channel_types', [0, 5])
+        option(command(self.remote, 'setchannel'), 'channel')['channel_types'] = [5, 0]
+        self.assertEqual(diff_commands(local, self.remote), ([], [], []))
+
+    def test_changed_fields(self):
+        changes = (
+            ('dm_permission', False),
+            ('nsfw', True),
+            ('contexts', [0]),
+            ('integration_types', [0, 1]),
+            ('default_member_permissions', '8'),
+            ('description_localizations', {'fr': 'Vérifier'})
+        )
+        for key, value in changes:
+            with self.subTest(key=key):
+                remote = as_registered(self.local)
+                command(remote, 'verify')[key] = value
+                self.assertEqual(diff_commands(self.local, remote), ([], [], ['verify']))
+
+    def test_empty_localizations_match_missing_ones(self):
+        command(self.remote, 'verify')['name_localizations'] = None
+        command(self.remote, 'update')['description_localizations'] = {}
+        self.assertEqual(diff_commands(self.local, self.remote), ([], [], []))
+
+if __name__ == '__main__':
+    unittest.main()
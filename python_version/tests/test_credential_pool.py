@@ -0,0 +1,96 @@
+"""Ranking account health in the credential pool
+
+Feeds CredentialPool the errors Roblox answers rank writes with and checks
+which ones count against the account: rejected cookies quarantine it after
+AUTH_FAILURE_THRESHOLD in a row, 429s hold it back, and a 403 for missing
+rank rights, which every account would get, leaves it alone.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+from aiohttp import ClientResponseError, RequestInfo
+from multidict import CIMultiDict
+from yarl import URL
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from credential_pool import AUTH_FAILURE_THRESHOLD, CredentialPool, NoHealthyAccountError
+
+RANK_URL = URL('https://groups.roblox.com/v1/groups/1/users/1')
+
+def http_error(status, message=''):
+    request_info = RequestInfo(RANK_URL, 'PATCH', CIMultiDict(), RANK_URL)
+    return ClientResponseError(request_info, (), status=status, message=message)
+
+INVALID_COOKIE = http_error(403, 'Authorization has been denied for this request.')
+NO_RANK_RIGHTS = http_error(403, 'You do not have permission to manage this member.')
+
+class StandInClient:
+
+    def __init__(self, cookie):
+        self.cookie = cookie
+
+    async def get_authenticated_user(self):
+        if self.cookie.startswith('bad'):
+            raise INVALID_COOKIE
+        return SimpleNamespace(name=f'ranker_{self.cookie}', id=1)
+
+class CredentialPoolTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.pool = CredentialPool(['a', 'b'], StandInClient)
+        await self.pool.initialize()
+        self.first, self.second = self.pool._accounts
+
+    async def test_failed_login_quarantines_the_account(self):
+        pool = CredentialPool(['a', 'bad'], StandInClient)
+        self.assertEqual(await pool.initialize(), 1)
+        self.assertEqual(pool.healthy_count(), 1)
+        self.assertEqual(pool.primary().cookie, 'a')
+
+    async def test_rejected_cookie_quarantines_after_the_threshold(self):
+        for failure in range(1, AUTH_FAILURE_THRESHOLD + 1):
+            self.assertTrue(self.pool.record_failure(self.first, INVALID_COOKIE))
+            self.assertEqual(self.pool.healthy_count(), 1 if failure == AUTH_FAILURE_THRESHOLD else 2)
+
+        # Writes go to the other account from now on
+        self.assertIs(await self.pool.acquire(), self.second)
+
+    async def test_success_resets_the_auth_failures(self):
+        for _ in range(AUTH_FAILURE_THRESHOLD - 1):
+            self.pool.record_failure(self.first, INVALID_COOKIE)
+        self.pool.record_success(self.first)
+        self.pool.record_failure(self.first, INVALID_COOKIE)
+        self.assertEqual(self.pool.healthy_count(), 2)
+
+    async def test_missing_rank_rights_are_not_the_accounts_fault(self):
+        for _ in range(AUTH_FAILURE_THRESHOLD * 3):
+            self.assertFalse(self.pool.record_failure(self.first, NO_RANK_RIGHTS))
+        self.assertEqual(self.pool.healthy_count(), 2)
+        self.assertEqual(self.first.auth_failures, 0)
+
+    async def test_unauthorized_counts_as_a_rejected_cookie(self):
+        self.assertTrue(self.pool.record_failure(self.first, http_error(401)))
+        self.assertEqual(self.first.auth_failures, 1)
+
+    async def test_rate_limited_account_is_held_back(self):
+        self.assertTrue(self.pool.record_failure(self.first, http_error(429)))
+        self.assertEqual(self.pool.healthy_count(), 2)
+        self.assertIs(await self.pool.acquire(), self.second)
+
+    async def test_server_errors_are_not_retried_on_another_account(self):
+        self.assertFalse(self.pool.record_failure(self.first, http_error(503)))
+
+    async def test_no_healthy_account(self):
+        for account in (self.first, self.second):
+            account.quarantine()
+        with self.assertRaises(NoHealthyAccountError):
+            await self.pool.acquire()
+
+if __name__ == '__main__':
+    unittest.main()
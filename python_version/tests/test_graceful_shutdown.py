@@ -0,0 +1,119 @@
+"""Drain and cleanup deadlines of GracefulShutdown
+
+Checks the drain is cut short to leave CLEANUP_RESERVE for the cleanup
+steps, that steps still waiting when the shutdown runs out of time are
+skipped, and that commands are forgotten once their task ends.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import graceful_shutdown
+from graceful_shutdown import CLEANUP_RESERVE, GracefulShutdown
+
+def fake_ctx():
+    author = SimpleNamespace(id=1, __str__=lambda self: 'someone')
+    return SimpleNamespace(command=SimpleNamespace(qualified_name='verify'), author=author)
+
+class DeadlineSplitTest(unittest.TestCase):
+
+    def test_grace_leaves_the_cleanup_reserve(self):
+        shutdown = GracefulShutdown(grace=15, timeout=20)
+        self.assertEqual(shutdown.grace, 20 - CLEANUP_RESERVE)
+
+    def test_short_grace_is_kept(self):
+        shutdown = GracefulShutdown(grace=3, timeout=20)
+        self.assertEqual(shutdown.grace, 3)
+
+    def test_grace_is_never_negative(self):
+        shutdown = GracefulShutdown(grace=15, timeout=CLEANUP_RESERVE / 2)
+        self.assertEqual(shutdown.grace, 0)
+
+class ShutdownRunTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.patches = [
+            mock.patch.object(graceful_shutdown, 'CLEANUP_RESERVE', 0.2),
+            mock.patch.object(graceful_shutdown, 'CANCEL_TIMEOUT', 0.05)
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    async def asyncTearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+
+    async def test_steps_are_skipped_once_out_of_time(self):
+        shutdown = GracefulShutdown(grace=10, timeout=0.3)
+        self.assertAlmostEqual(shutdown.grace, 0.1)
+
+        ran = []
+
+        async def slow():
+            ran.append('slow')
+            await asyncio.sleep(10)
+
+        async def late():
+            ran.append('late')
+
+        job = asyncio.create_task(asyncio.sleep(10))
+        shutdown.add_jobs('job', lambda: [job])
+        shutdown.add_step('slow', slow)
+        shutdown.add_step('late', late)
+
+        with self.assertLogs('graceful_shutdown', 'INFO') as logs:
+            shutdown.start('SIGTERM')
+            await shutdown.wait()
+
+        self.assertTrue(job.cancelled())
+        self.assertEqual(ran, ['slow'])
+        output = '\n'.join(logs.output)
+        self.assertIn("'slow' failed: TimeoutError", output)
+        self.assertIn("'late' skipped, out of time", output)
+        self.assertIn('abandoned 3', output)
+
+    async def test_steps_run_in_order_with_time_left(self):
+        shutdown = GracefulShutdown(grace=10, timeout=5)
+        ran = []
+
+        for name in ('first', 'second'):
+            async def step(name=name):
+                ran.append(name)
+            shutdown.add_step(name, step)
+
+        shutdown.start('SIGTERM')
+        await shutdown.wait()
+        self.assertEqual(ran, ['first', 'second'])
+
+    async def test_commands_are_forgotten_when_their_task_ends(self):
+        shutdown = GracefulShutdown()
+
+        async def failing_command():
+            shutdown.command_started(fake_ctx())
+            raise RuntimeError('command failed without reaching after_invoke')
+
+        task = asyncio.create_task(failing_command())
+        with self.assertRaises(RuntimeError):
+            await task
+        await asyncio.sleep(0)
+        self.assertEqual(shutdown._commands, {})
+
+    async def test_new_commands_are_turned_away_while_draining(self):
+        shutdown = GracefulShutdown(grace=0, timeout=1)
+        self.assertTrue(shutdown.check(fake_ctx()))
+        shutdown.start('SIGTERM')
+        await asyncio.sleep(0)
+        with self.assertRaises(graceful_shutdown.ShuttingDown):
+            shutdown.check(fake_ctx())
+        await shutdown.wait()
+
+if __name__ == '__main__':
+    unittest.main()
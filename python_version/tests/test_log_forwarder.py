@@ -0,0 +1,64 @@
+"""Forwarding of bot process output by the supervisor
+
+Runs small child processes and checks that LogForwarder passes their
+lines on with the cluster prefix, including lines longer than the pipe
+reader's limit, which are split rather than dropped.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import io
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cluster
+from start_bot import LogForwarder
+
+LIMIT = 1024
+
+async def forward(script):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, '-c', script,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=LIMIT
+    )
+    output = io.StringIO()
+    forwarder = LogForwarder('cluster 0', output)
+    await asyncio.wait_for(forwarder.forward(process), 10)
+    await process.wait()
+    return forwarder, output.getvalue().splitlines()
+
+class LogForwarderTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_lines_are_prefixed(self):
+        _, lines = await forward("import sys; print('out'); print('err', file=sys.stderr)")
+        self.assertEqual(sorted(lines), ['[cluster 0] err', '[cluster 0] out'])
+
+    async def test_long_line_is_split_not_dropped(self):
+        long_line = ''.join(chr(ord('a') + i % 26) for i in range(LIMIT * 3 + 100))
+        _, lines = await forward(f"print({long_line!r}); print('after')")
+
+        prefix = '[cluster 0] '
+        self.assertTrue(all(line.startswith(prefix) for line in lines))
+        parts = [line[len(prefix):] for line in lines]
+        self.assertGreater(len(parts), 2)
+        self.assertTrue(parts[0].startswith(long_line[:100]))
+        self.assertEqual(''.join(parts[:-1]), long_line)
+        self.assertEqual(parts[-1], 'after')
+
+    async def test_last_line_without_newline(self):
+        _, lines = await forward("import sys; sys.stdout.write('no newline')")
+        self.assertEqual(lines, ['[cluster 0] no newline'])
+
+    async def test_standby_marker_is_not_forwarded(self):
+        forwarder, lines = await forward(f"print({cluster.STANDBY_READY_MARKER!r}); print('parked')")
+        self.assertTrue(forwarder.ready.is_set())
+        self.assertEqual(lines, ['[cluster 0] parked'])
+
+if __name__ == '__main__':
+    unittest.main()
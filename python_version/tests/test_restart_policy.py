@@ -0,0 +1,97 @@
+"""Restart decisions of the supervisor
+
+Drives RestartPolicy with simulated exits and clock readings, and checks
+the backoff stays within its bounds however long a cluster keeps failing,
+that a crash loop escalates to the cooldown, and that stable uptime and
+config errors are handled.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import os
+import sys
+import signal
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from restart_policy import (
+    CLEAN_EXIT, CONFIG_ERROR, CRASH, CRASH_LOOP, EXIT_CONFIG_ERROR, GIVE_UP, KILLED, RESTART,
+    RestartPolicy, classify_exit
+)
+
+BASE = 1.0
+MAX = 300.0
+COOLDOWN = 900.0
+
+def policy(**overrides):
+    options = dict(
+        base_delay=BASE, max_delay=MAX, stable_after=600, crash_loop_threshold=5,
+        crash_loop_window=300, crash_loop_cooldown=COOLDOWN
+    )
+    options.update(overrides)
+    return RestartPolicy(**options)
+
+class RestartPolicyTest(unittest.TestCase):
+
+    def crash(self, policy, now, uptime=1.0):
+        policy.record_start(now - uptime)
+        return policy.next_action(1, now)
+
+    def test_delay_doubles_within_jitter(self):
+        restarts = policy(crash_loop_threshold=1000)
+        for failures in range(8):
+            decision, delay, reason = self.crash(restarts, now=1000.0 * failures)
+            ceiling = min(MAX, BASE * 2 ** failures)
+            self.assertEqual((decision, reason), (RESTART, CRASH))
+            self.assertTrue(ceiling / 2 <= delay <= ceiling, (failures, delay))
+
+    def test_delay_stays_capped_after_many_failures(self):
+        restarts = policy(crash_loop_threshold=10 ** 6)
+        # Far past the point where 2 ** failures overflows a float
+        restarts.failures = 5000
+        for step in range(3):
+            decision, delay, _ = self.crash(restarts, now=1000.0 * step)
+            self.assertEqual(decision, RESTART)
+            self.assertTrue(MAX / 2 <= delay <= MAX, delay)
+        self.assertEqual(restarts.failures, 5003)
+
+    def test_crash_loop_gets_the_cooldown(self):
+        restarts = policy()
+        delays = [self.crash(restarts, now=10.0 * attempt) for attempt in range(5)]
+        self.assertTrue(all(reason == CRASH for _, _, reason in delays[:4]))
+        self.assertEqual(delays[4], (RESTART, COOLDOWN, CRASH_LOOP))
+
+        # The count starts over after the cooldown
+        decision, delay, reason = self.crash(restarts, now=50.0 + COOLDOWN)
+        self.assertEqual(reason, CRASH)
+        self.assertLess(delay, COOLDOWN)
+
+    def test_crashes_spread_over_the_window_are_not_a_loop(self):
+        restarts = policy()
+        for attempt in range(10):
+            _, _, reason = self.crash(restarts, now=100.0 * attempt)
+            self.assertNotEqual(reason, CRASH_LOOP)
+
+    def test_stable_uptime_resets_the_backoff(self):
+        restarts = policy(crash_loop_threshold=1000)
+        for attempt in range(6):
+            self.crash(restarts, now=10.0 * attempt)
+        _, delay, _ = self.crash(restarts, now=10000.0, uptime=700.0)
+        self.assertTrue(BASE / 2 <= delay <= BASE, delay)
+        self.assertEqual(restarts.failures, 1)
+
+    def test_config_error_gives_up(self):
+        restarts = policy()
+        restarts.record_start(0.0)
+        self.assertEqual(restarts.next_action(EXIT_CONFIG_ERROR, 1.0), (GIVE_UP, 0.0, CONFIG_ERROR))
+
+    def test_classify_exit(self):
+        self.assertEqual(classify_exit(0), CLEAN_EXIT)
+        self.assertEqual(classify_exit(1), CRASH)
+        self.assertEqual(classify_exit(-signal.SIGKILL), KILLED)
+        self.assertEqual(classify_exit(128 + signal.SIGTERM), KILLED)
+        self.assertEqual(classify_exit(EXIT_CONFIG_ERROR), CONFIG_ERROR)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+"""Fault injection for the RobloxAPI circuit breakers
+
+Points the refresh paths at a local aiohttp server that answers with
+errors or hangs on demand, and checks the breaker moves from closed to
+open, half-open and closed again, that reads fall back to stale data,
+that writes fail fast while the circuit is open and that calls cut short
+by the caller's deadline don't count against Roblox.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import roblox_api
+import roblox_metrics
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from credential_pool import CredentialPool
+from deadline import deadline_scope
+from roblox_api import RobloxAPI
+
+THRESHOLD = 3
+RECOVERY = 0.3
+TIMEOUT = 0.2
+
+class StandInRoblox:
+    """Serves the users and groups endpoints, failing as told"""
+
+    def __init__(self):
+        # 'ok', 'hang' or an HTTP status to answer with
+        self.mode = 'ok'
+        self.requests = 0
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.mode == 'hang':
+            await asyncio.sleep(TIMEOUT * 10)
+        elif self.mode != 'ok':
+            return web.json_response({'errors': [{'message': 'injected'}]}, status=self.mode)
+
+        if request.path.endswith('/roles'):
+            return web.json_response({'roles': [{'id': 1, 'name': 'Member', 'rank': 1}]})
+        return web.json_response({'id': 1, 'name': 'builderman', 'displayName': 'Builderman', 'created': '2006-02-27T21:06:40Z'})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/{path:.*}', self.handle)
+        return app
+
+class BreakerFaultInjectionTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.roblox = StandInRoblox()
+        self.server = TestServer(self.roblox.app())
+        await self.server.start_server()
+        url = str(self.server.make_url('')).rstrip('/')
+
+        self.patches = [
+            mock.patch.object(roblox_api, 'USERS_API', url),
+            mock.patch.object(roblox_api, 'GROUPS_API', url),
+            mock.patch.object(roblox_api, 'ROBLOX_TIMEOUT', TIMEOUT),
+            mock.patch.object(RobloxAPI, '_group_id', '1'),
+            mock.patch.object(RobloxAPI, '_session', None),
+            mock.patch.object(RobloxAPI, '_stale_cache', roblox_api.OrderedDict()),
+            mock.patch.object(RobloxAPI, '_validators', roblox_api.OrderedDict()),
+            mock.patch.object(RobloxAPI, '_breakers', {
+                family: CircuitBreaker(f'test_{family}', failure_threshold=THRESHOLD, recovery_timeout=RECOVERY)
+                for family in ('users', 'avatars', 'groups')
+            })
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    async def asyncTearDown(self):
+        await RobloxAPI.close()
+        for patch in reversed(self.patches):
+            patch.stop()
+        await self.server.close()
+
+    def breaker(self, family):
+        return RobloxAPI._breakers[family]
+
+    async def fail_until_open(self, family='users'):
+        for _ in range(THRESHOLD):
+            if family == 'users':
+                result = await RobloxAPI.refresh_user_profile(1)
+            else:
+                result = await RobloxAPI.refresh_group_roles()
+            self.assertFalse(result['success'])
+        self.assertEqual(self.breaker(family).state, OPEN)
+
+    async def test_server_errors_open_and_a_good_probe_closes(self):
+        self.roblox.mode = 503
+        await self.fail_until_open()
+
+        # Open: calls are rejected without reaching Roblox
+        sent = self.roblox.requests
+        result = await RobloxAPI.refresh_user_profile(1)
+        self.assertFalse(result['success'])
+        self.assertIn('is open', result['error'])
+        self.assertEqual(self.roblox.requests, sent)
+
+        await asyncio.sleep(RECOVERY)
+        self.assertEqual(self.breaker('users').state, HALF_OPEN)
+
+        self.roblox.mode = 'ok'
+        result = await RobloxAPI.refresh_user_profile(1)
+        self.assertTrue(result['success'])
+        self.assertEqual(self.breaker('users').state, CLOSED)
+
+    async def test_timeouts_open_and_a_failed_probe_reopens(self):
+        self.roblox.mode = 'hang'
+        await self.fail_until_open()
+
+        await asyncio.sleep(RECOVERY)
+        self.roblox.mode = 500
+        await RobloxAPI.refresh_user_profile(1)
+        self.assertEqual(self.breaker('users').state, OPEN)
+
+    async def test_client_errors_leave_the_breaker_closed(self):
+        for status in (404, 400, 403):
+            self.roblox.mode = status
+            for _ in range(THRESHOLD * 2):
+                result = await RobloxAPI.refresh_user_profile(1)
+                self.assertFalse(result['success'])
+        self.assertEqual(self.breaker('users').state, CLOSED)
+
+    async def test_reads_fall_back_to_stale_data(self):
+        fresh = await RobloxAPI.refresh_user_profile(1)
+        self.assertTrue(fresh['changed'])
+
+        self.roblox.mode = 503
+        stale = await RobloxAPI.refresh_user_profile(1)
+        self.assertTrue(stale['success'])
+        self.assertTrue(stale['stale'])
+        self.assertFalse(stale['changed'])
+        self.assertEqual(stale['username'], 'builderman')
+
+        # Still served once the circuit is open, without reaching Roblox
+        for _ in range(THRESHOLD):
+            await RobloxAPI.refresh_user_profile(1)
+        self.assertEqual(self.breaker('users').state, OPEN)
+        sent = self.roblox.requests
+        stale = await RobloxAPI.refresh_user_profile(1)
+        self.assertTrue(stale['stale'])
+        self.assertEqual(self.roblox.requests, sent)
+
+    async def test_writes_fail_fast_while_open(self):
+        self.roblox.mode = 503
+        await self.fail_until_open('groups')
+
+        pool = CredentialPool(['cookie'], lambda cookie: None)
+        with mock.patch.object(RobloxAPI, '_pool', pool):
+            result = await RobloxAPI.rank_user(1, 1)
+        self.assertFalse(result['success'])
+        self.assertIn('currently unavailable', result['error'])
+
+    async def test_calls_past_the_deadline_are_abandoned(self):
+        self.roblox.mode = 'hang'
+        for _ in range(THRESHOLD * 2):
+            with deadline_scope(TIMEOUT / 4):
+                result = await RobloxAPI.refresh_user_profile(1)
+            self.assertFalse(result['success'])
+        self.assertEqual(self.breaker('users').state, CLOSED)
+
+    async def test_expired_deadline_is_recorded_and_gives_the_probe_back(self):
+        self.roblox.mode = 503
+        await self.fail_until_open()
+        await asyncio.sleep(RECOVERY)
+
+        expired = roblox_metrics.call_errors.labels('user_profile', roblox_metrics.DEADLINE_EXCEEDED)
+        before = expired.get()
+        sent = self.roblox.requests
+        with deadline_scope(0):
+            result = await RobloxAPI.refresh_user_profile(1)
+        self.assertFalse(result['success'])
+        self.assertEqual(self.roblox.requests, sent)
+        self.assertEqual(expired.get(), before + 1)
+
+        # The half-open probe slot was given back, so the next call can close the circuit
+        self.roblox.mode = 'ok'
+        result = await RobloxAPI.refresh_user_profile(1)
+        self.assertTrue(result['success'])
+        self.assertEqual(self.breaker('users').state, CLOSED)
+
+if __name__ == '__main__':
+    unittest.main()
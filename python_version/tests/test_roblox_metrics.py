@@ -0,0 +1,70 @@
+"""Error categories for Roblox calls
+
+Checks that classify_error takes the status from the error itself, such as
+aiohttp's ClientResponseError.status, before looking at the message, so
+numbers in a message can't override it.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from aiohttp import ClientConnectionError, ClientResponseError, RequestInfo
+from multidict import CIMultiDict
+from yarl import URL
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuit_breaker import CircuitOpenError
+from roblox_metrics import (
+    AUTH, CIRCUIT_OPEN, CLIENT, NOT_FOUND, PERMISSION, RATE_LIMITED, SERVER, TIMEOUT, UNKNOWN,
+    classify_error, status_of
+)
+
+# Group and user IDs in the URL look like status codes to a regex
+URL_WITH_IDS = URL('https://groups.roblox.com/v1/groups/503/users/429')
+
+def http_error(status, message=''):
+    request_info = RequestInfo(URL_WITH_IDS, 'GET', CIMultiDict(), URL_WITH_IDS)
+    return ClientResponseError(request_info, (), status=status, message=message)
+
+class StatusError(Exception):
+
+    def __init__(self, message, status=None, response=None):
+        super().__init__(message)
+        self.status_code = status
+        self.response = response
+
+class ClassifyErrorTest(unittest.TestCase):
+
+    def test_aiohttp_status_wins_over_the_message(self):
+        self.assertEqual(status_of(http_error(404)), 404)
+        self.assertEqual(classify_error(http_error(404, 'Not Found')), NOT_FOUND)
+        self.assertEqual(classify_error(http_error(400, 'Bad Request')), CLIENT)
+
+    def test_status_attributes(self):
+        self.assertEqual(classify_error(StatusError('user 404 failed', status=502)), SERVER)
+        response = SimpleNamespace(status_code=429)
+        self.assertEqual(classify_error(StatusError('error 500', response=response)), RATE_LIMITED)
+
+    def test_403_depends_on_the_message(self):
+        self.assertEqual(classify_error(http_error(403, 'Authorization has been denied for this request.')), AUTH)
+        self.assertEqual(classify_error(http_error(403, 'Forbidden')), PERMISSION)
+        self.assertEqual(classify_error(http_error(401)), AUTH)
+
+    def test_message_status_is_a_last_resort(self):
+        self.assertEqual(classify_error(Exception('Status code 503: Service Unavailable')), SERVER)
+        self.assertEqual(classify_error(Exception('TooManyRequests for user 404')), RATE_LIMITED)
+        self.assertEqual(classify_error(Exception('something went wrong')), UNKNOWN)
+
+    def test_errors_without_a_status(self):
+        self.assertEqual(classify_error(asyncio.TimeoutError()), TIMEOUT)
+        self.assertEqual(classify_error(CircuitOpenError('users', 30)), CIRCUIT_OPEN)
+        self.assertEqual(classify_error(ClientConnectionError('connection reset')), SERVER)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Import time budget for bot.py
+
+Imports bot.py in fresh interpreters, as `python startup_profiler.py
+--budget` does, and fails when the median import time is over
+STARTUP_IMPORT_BUDGET. Also checks that imports timed on two threads at
+once keep separate accounts.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import io
+import os
+import sys
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import startup_profiler
+from startup_profiler import STARTUP_IMPORT_BUDGET
+
+RUNS = 3
+
+class StartupBudgetTest(unittest.TestCase):
+
+    def test_bot_imports_within_budget(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            within = startup_profiler.check_budget(STARTUP_IMPORT_BUDGET, 'bot', RUNS)
+        self.assertTrue(within, output.getvalue())
+
+    def test_profiled_import_lists_bot(self):
+        result = startup_profiler._measure_import('bot')
+        self.assertIn('bot', [name for name, _, _ in result['imports']])
+
+class ImportStackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.patch = mock.patch.object(startup_profiler, '_imports', {})
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_threads_keep_separate_stacks(self):
+        # The main thread is in the middle of an import when another thread
+        # finishes one of its own
+        stack = startup_profiler._import_stacks.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        try:
+            def import_fresh():
+                sys.modules.pop('colorsys', None)
+                startup_profiler._timed_import('colorsys')
+
+            thread = threading.Thread(target=import_fresh)
+            thread.start()
+            thread.join()
+
+            self.assertEqual(stack, [0.0])
+            self.assertIn('colorsys', startup_profiler._imports)
+        finally:
+            stack.pop()
+
+if __name__ == '__main__':
+    unittest.main()
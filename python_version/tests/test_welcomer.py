@@ -0,0 +1,109 @@
+"""Welcome message batching
+
+Checks that mentions are packed into messages of at most max_batch
+members and under Discord's length limit, and that a join burst is sent
+as a few batched messages rather than one per member.
+
+Run from python_version/: python -m unittest discover tests
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channel_index import ChannelIndex
+from welcomer import MESSAGE_LIMIT, WelcomeCoalescer, build_messages
+
+WINDOW = 0.1
+
+def mentions_in(messages):
+    return sum(message.count('<@') for message in messages)
+
+class BuildMessagesTest(unittest.TestCase):
+
+    def test_batches_hold_at_most_max_batch(self):
+        mentions = [f'<@{user_id}>' for user_id in range(10)]
+        messages = build_messages(mentions, max_batch=4)
+        self.assertEqual([message.count('<@') for message in messages], [4, 4, 2])
+
+    def test_long_batches_are_split_at_the_length_limit(self):
+        mentions = [f'<@{10 ** 18 + user_id}>' for user_id in range(200)]
+        messages = build_messages(mentions, max_batch=200)
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(message) <= MESSAGE_LIMIT for message in messages))
+        self.assertEqual(mentions_in(messages), 200)
+
+    def test_no_mentions_no_messages(self):
+        self.assertEqual(build_messages([]), [])
+
+class StandInChannel:
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append(content)
+
+class WelcomeCoalescerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.channel = StandInChannel()
+        self.guild = SimpleNamespace(id=1)
+        self.patch = mock.patch.object(ChannelIndex, 'get', lambda guild, role: self.channel)
+        self.patch.start()
+
+    async def asyncTearDown(self):
+        self.patch.stop()
+
+    def member(self, user_id):
+        return SimpleNamespace(guild=self.guild, mention=f'<@{user_id}>')
+
+    async def test_quiet_guild_is_welcomed_at_once(self):
+        welcomer = WelcomeCoalescer(window=WINDOW, max_batch=5)
+        welcomer.add(self.member(1))
+        await asyncio.sleep(0.01)
+        self.assertEqual(mentions_in(self.channel.sent), 1)
+
+    async def test_burst_is_sent_in_full_batches(self):
+        welcomer = WelcomeCoalescer(window=WINDOW, max_batch=5)
+        welcomer.add(self.member(0))
+        await asyncio.sleep(0.01)
+
+        # Within the window: buffered, and sent without waiting once a batch
+        # is full, split into messages of max_batch members
+        for user_id in range(1, 13):
+            welcomer.add(self.member(user_id))
+        await asyncio.sleep(0.01)
+        self.assertEqual([message.count('<@') for message in self.channel.sent], [1, 5, 5, 2])
+
+        await asyncio.sleep(WINDOW * 2)
+        self.assertEqual(mentions_in(self.channel.sent), 13)
+
+    async def test_partial_batch_waits_for_the_window(self):
+        welcomer = WelcomeCoalescer(window=WINDOW, max_batch=5)
+        welcomer.add(self.member(0))
+        await asyncio.sleep(0.01)
+        welcomer.add(self.member(1))
+        welcomer.add(self.member(2))
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(self.channel.sent), 1)
+
+        await asyncio.sleep(WINDOW)
+        self.assertEqual([message.count('<@') for message in self.channel.sent], [1, 2])
+
+    async def test_flush_all_sends_what_is_buffered(self):
+        welcomer = WelcomeCoalescer(window=10, max_batch=5)
+        welcomer.add(self.member(0))
+        await asyncio.sleep(0.01)
+        welcomer.add(self.member(1))
+        await welcomer.flush_all()
+        self.assertEqual(mentions_in(self.channel.sent), 2)
+        self.assertEqual(welcomer._flush_tasks, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""Coalesces welcome messages during join bursts"""
+
+import os
+import time
+import asyncio
+import logging
+
+from channel_index import WELCOME, ChannelIndex
+
+logger = logging.getLogger('welcomer')
+
+# How long joins are gathered into one message once a guild is busy
+WELCOME_WINDOW = float(os.getenv('WELCOME_WINDOW', '5'))
+
+# Most members mentioned in one welcome message
+WELCOME_MAX_BATCH = int(os.getenv('WELCOME_MAX_BATCH', '25'))
+
+# Discord's message length limit
+MESSAGE_LIMIT = 2000
+
+WELCOME_PREFIX = 'Welcome to the server, '
+WELCOME_SUFFIX = '! Please use `/verify` to link your Roblox account.'
+
+def build_messages(mentions, max_batch=WELCOME_MAX_BATCH):
+    """Pack mentions into welcome messages of at most `max_batch` members
+
+    A batch is split further only when it would pass the length limit.
+    """
+    budget = MESSAGE_LIMIT - len(WELCOME_PREFIX) - len(WELCOME_SUFFIX)
+    messages = []
+    chunk = []
+    length = 0
+
+    for mention in mentions:
+        added = len(mention) + (2 if chunk else 0)
+        if chunk and (len(chunk) >= max_batch or length + added > budget):
+            messages.append(WELCOME_PREFIX + ', '.join(chunk) + WELCOME_SUFFIX)
+            chunk = []
+            length = 0
+            added = len(mention)
+        chunk.append(mention)
+        length += added
+
+    if chunk:
+        messages.append(WELCOME_PREFIX + ', '.join(chunk) + WELCOME_SUFFIX)
+    return messages
+
+class WelcomeCoalescer:
+    """Sends one welcome message per burst of joins instead of one per member
+
+    A join in a quiet guild is welcomed straight away. Joins arriving within
+    `window` seconds of the last welcome are buffered and sent together when
+    the window closes, or as soon as `max_batch` members are waiting.
+    """
+
+    def __init__(self, window=WELCOME_WINDOW, max_batch=WELCOME_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+
+        self._pending = {}
+        self._flush_tasks = {}
+        self._last_sent = {}
+        # Guilds with a full batch already scheduled to send at once
+        self._sending_now = set()
+
+    def add(self, member):
+        """Queue a welcome for a member who just joined"""
+        guild_id = member.guild.id
+        pending = self._pending.setdefault(guild_id, [])
+        pending.append(member)
+
+        if len(pending) >= self.max_batch:
+            if guild_id not in self._sending_now:
+                self._sending_now.add(guild_id)
+                self._schedule(guild_id, 0)
+            return
+
+        if guild_id not in self._flush_tasks:
+            quiet_for = time.monotonic() - self._last_sent.get(guild_id, 0.0)
+            self._schedule(guild_id, max(0.0, self.window - quiet_for))
+
+    def _schedule(self, guild_id, delay):
+        task = self._flush_tasks.get(guild_id)
+        if task is not None:
+            if delay > 0:
+                return
+            task.cancel()
+        self._flush_tasks[guild_id] = asyncio.create_task(self._flush_later(guild_id, delay))
+
+    async def _flush_later(self, guild_id, delay):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._flush_tasks.pop(guild_id, None)
+        self._sending_now.discard(guild_id)
+        await self.flush(guild_id)
+
+    async def flush(self, guild_id):
+        """Send the buffered welcome for a guild now"""
+        members = self._pending.pop(guild_id, None)
+        if not members:
+            return
+
+        self._last_sent[guild_id] = time.monotonic()
+        guild = members[0].guild
+
+        try:
+            channel = ChannelIndex.get(guild, WELCOME)
+            if not channel:
+                return
+
+            for content in build_messages([member.mention for member in members], self.max_batch):
+                await channel.send(content)
+        except Exception as e:
+            logger.error('Error sending welcome message: %s', e)
+
+    async def flush_all(self):
+        """Send every buffered welcome, e.g. before shutting down"""
+        for task in list(self._flush_tasks.values()):
+            task.cancel()
+        self._flush_tasks.clear()
+        self._sending_now.clear()
+        await asyncio.gather(*(self.flush(guild_id) for guild_id in list(self._pending)))